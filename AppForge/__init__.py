@@ -1,4 +1,31 @@
 from .appforge import AppForge
+from .pool import DevicePool
+from .async_appforge import AsyncAppForge
+from .cache import BuildCache
+from .baseline import TemplateBaseline
+from .check import FastCheck
+from .extracts import Diagnostic, ErrorParser, FuzzParser, TestParser
+from .policies import StopPolicy, FirstCrash, Plateau
+from .store import ResultStore
+from .trash import TrashReaper
+from .registry import TaskRegistry, load_tasks
+from .workqueue import WorkQueue
+from .tracing import Tracer
+from .backend import Backend, FakeBackend
 from . import appforge
 from . import extracts
 from . import utils
+from . import pool
+from . import async_appforge
+from . import cache
+from . import policies
+from . import store
+from . import trash
+from . import registry
+from . import workqueue
+from . import schedule
+from . import tracing
+from . import backend
+from . import gradle
+from . import baseline
+from . import check
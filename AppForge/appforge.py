@@ -1,12 +1,26 @@
 
-from typing import Optional
-import json,subprocess,time
+from typing import Any, Callable, Optional, Union
+from contextlib import contextmanager, nullcontext
+import base64,codecs,json,math,os,re,shutil,signal,subprocess,tempfile,threading,time
 import docker
 from pathlib import Path
 
 
-from .extracts import extract_error, extract_fuzz, extract_test
-from .utils import remove_directory, sumup_json, compare_folder
+from .extracts import ErrorParser, FuzzParser, TestParser, SessionParser, FUZZ_PHASE_MARKER
+from .utils import sumup_json, compare_folder, clone_folder, file_lock, free_port
+from .build_worker import BuildWorker
+from .evaluator_server import EvaluatorServer
+from .backend import Backend
+from .baseline import TemplateBaseline
+from .cache import BuildCache, hash_folder, sdk_identity
+from .policies import StageTimeout, StopPolicy, stop_policy
+from .store import ResultStore, hash_file
+from .trash import TrashReaper
+from .registry import load_tasks
+from .tracing import Tracer, traced
+from .gradle import CLASSPATH_ENV, CLASSPATH_FILE, CLASSPATH_INIT_SCRIPT, GradleHome, PROFILE_ENV, PROFILE_FILE, \
+    PROFILE_INIT_SCRIPT, RO_CACHE_ENV, SHARED_ENV, SHARED_INIT_SCRIPT, WARMUP_CHANGED, read_classpath, read_profile
+from .check import FastCheck, TOOLS_SCRIPT, pack_resources
 
 
 class AppForge:
@@ -18,8 +32,22 @@ class AppForge:
     """
     docker_base_folder = Path('/AppDev-Bench/AppDev-Bench/runs')
     docker_bench_folder = Path('/AppDev-Bench/AppDev-Bench')
+    docker_emulator_home = Path('/home/androidusr')
+    # port noVNC listens on in the container
+    docker_novnc_port = 6080
+    docker_gradle_home = Path('/appforge-gradle')
+    # writable Gradle user home of the builds in a container, on its own file system
+    docker_gradle_user_home = Path('/root/.appforge-gradle')
     template_folder = Path('compiler/templates')
     task_num = 101
+    # Option of evaluate_app.py selecting the sub-features to test
+    sub_feature_arg = '--sub-features'
+    # Mode of evaluate_app.py that installs once, runs the tests and then fuzzes
+    combined_test = 'all'
+    # Line of a combined session between its tests and its fuzzing
+    fuzz_marker = FUZZ_PHASE_MARKER
+    # Seconds an adb probe of the emulator may take
+    probe_timeout = 30
     
     def __init__(self, runs: str,
                  base_folder: Path = Path('runs'),
@@ -28,7 +56,27 @@ class AppForge:
                  sdk_path: Optional[Path] = None,
                  bench_folder: Optional[Path] = None,
                  docker_name: str = 'zenithfocuslight/appforge:latest',
-                 docker_port: int = 6080
+                 docker_port: int = 6080,
+                 container: Optional[str] = None,
+                 snapshot_volume: Optional[str] = None,
+                 boot_deadline: float = 600,
+                 build_worker: bool = False,
+                 build_cache: Union[bool, BuildCache] = False,
+                 build_cache_bytes: int = 2 * 1024**3,
+                 stream_logs: bool = False,
+                 result_store: Union[bool, ResultStore] = False,
+                 evaluator_server: bool = False,
+                 deadlines: Optional[dict[str, float]] = None,
+                 retries: int = 1,
+                 trace: Union[bool, Tracer] = False,
+                 backend: Optional[Backend] = None,
+                 profile_builds: bool = False,
+                 gradle_home: Optional[Path] = None,
+                 template_baseline: bool = False,
+                 fast_check: bool = False,
+                 shared_store: bool = False,
+                 trash: Optional[TrashReaper] = None,
+                 pick_free_port: bool = False
                  ):
         """
         Initialize the AppForge instance.
@@ -41,15 +89,97 @@ class AppForge:
             sdk_path (Optional[Path]): Path to Android SDK. Required if not using Docker.
             bench_folder (Optional[Path]): Path to benchmark folder. Required if not using Docker.
             docker_name (str): Docker image name to use. Defaults to 'zenithfocuslight/appforge:latest'.
-            docker_port (int): Port to expose from Docker container. Defaults to 6080.
+            docker_port (int): Host port the container's noVNC is published on. Defaults to 6080.
+            container (Optional[str]): Name or ID of an already running AppForge container to attach to
+                instead of starting a new one. It is left running by `clean_up`. Defaults to None.
+            snapshot_volume (Optional[str]): Docker volume to keep the emulator's home (AVD and quick-boot
+                snapshot) in. A snapshot is saved into it on `clean_up`, so the next container started on
+                the same volume boots from it instead of cold booting. Defaults to None.
+            boot_deadline (float): Seconds to wait for the emulator on docker to become ready. Defaults to 600.
+            build_worker (bool): Whether to compile through a long-lived build worker that keeps
+                build.py loaded, saving the interpreter start of every compile. Defaults to False.
+            build_cache (Union[bool, BuildCache]): Whether to reuse the outcome of earlier builds of an identical
+                `changed` map, stored under base_folder/.build_cache. A BuildCache instance is shared, e.g. by the
+                devices of a pool. Defaults to False.
+            build_cache_bytes (int): Size bound of the build cache. Defaults to 2GB.
+            stream_logs (bool): Whether to tee command output straight into the log files and parse
+                it as it arrives, instead of buffering whole logs in memory. Defaults to False.
+            result_store (Union[bool, ResultStore]): Whether to also record results in the SQLite store
+                base_folder/results.db and check cached results there. JSON results of this run are imported
+                on first use. A ResultStore instance is shared, e.g. by the devices of a pool. Defaults to False.
+            evaluator_server (bool): Whether to run `evaluate_app.py` jobs through a long-lived server
+                next to the emulator that keeps its imports loaded and the device connected.
+                Defaults to False.
+            deadlines (Optional[dict[str, float]]): Seconds each run of a stage may take, keyed by
+                'compile', 'test', 'fuzz' or 'boot' (which replaces boot_deadline). A run past its
+                deadline is killed with the processes it started and retried; results of stages with
+                a deadline carry 'timeout': 1 if every attempt timed out, else 0. Defaults to None.
+            retries (int): How many times a timed out stage is retried. Defaults to 1.
+            trace (Union[bool, Tracer]): Whether to time every stage in nested spans, written as a
+                Chrome trace to runs/trace.json on `clean_up` and summed per task into `timings.json`
+                next to `test_result.json`. A Tracer instance is shared, e.g. by the devices of a pool.
+                Defaults to False.
+            backend (Optional[Backend]): Runs the commands it serves in place of the device and the
+                build, e.g. a `FakeBackend` to run AppForge without an emulator or SDK. Defaults to None.
+            profile_builds (bool): Whether to time the phases and Gradle tasks of every build, kept in
+                `gradle_profile.json` next to `compile.log` and in the result store. `python -m AppForge.gradle`
+                reports the slowest Gradle tasks of a run. Defaults to False.
+            gradle_home (Optional[Path]): Gradle user home warmed once with a build of the template, and
+                mounted into the containers (an attached container must have it mounted at `docker_gradle_home`).
+                Once warm, builds read its dependencies as their read-only dependency cache and run offline
+                in a Gradle user home of their own, under base_folder/.gradle_homes or, in a container, at
+                `docker_gradle_user_home`. Defaults to None, the Gradle home of the build environment.
+            template_baseline (bool): Whether to build the template once, kept with its build intermediates
+                under base_folder/.baseline, and seed every task build with a copy-on-write clone of its
+                intermediates, so that Gradle only rebuilds what the generated files change. Seeding stops if
+                `build.py` fails over a seeded project without reporting an error. Defaults to False.
+            fast_check (bool): Whether to check the generated files with aapt2 and javac against the
+                template baseline before each Gradle build, and report their errors like the build would
+                without running it. Needs template_baseline. Defaults to False.
+            shared_store (bool): Whether the result store may be used by processes on other hosts, e.g.
+                the workers of a `WorkQueue` sharing base_folder over NFS, which needs its rollback journal
+                instead of WAL. Defaults to False.
+            trash (Optional[TrashReaper]): Reaper of base_folder/.trash shared with other instances, which
+                closes it. Defaults to None, a reaper of this instance's own.
+            pick_free_port (bool): Whether to publish noVNC on the first free host port at or above
+                docker_port instead. Defaults to False.
         """
         assert (use_docker ^ (emulator_id is not None)), \
             'We must choose one and only one option of docker or local emulator for evaluation!'
+        assert template_baseline or not fast_check, 'The fast check needs the template baseline!'
         self.emulator_id = emulator_id
+        self.runs = runs
+        self.tracer = Tracer() if trace is True else (trace or None)
+        self.backend = backend
+        self.deadlines = dict(deadlines or {})
+        self.retries = retries
+        self._evaluate_usage = None
+        # whether builds may run over a project folder that is already populated, see `_check_build`
+        self.reuse_projects = True
+        # environment variables of the builds
+        self.build_env = {}
+        if profile_builds:
+            self.build_env[PROFILE_ENV] = PROFILE_FILE
+        if gradle_home:
+            gradle_home = Path(gradle_home).resolve()
+            # a writable home per instance, as Gradle's locks do not reach across containers
+            self.build_env['GRADLE_USER_HOME'] = str(self.docker_gradle_user_home if use_docker else
+                                                     Path(base_folder).resolve() / '.gradle_homes' / emulator_id)
+        boot_deadline = self.deadlines.get('boot', boot_deadline)
         self.base_folder = base_folder
         self.app_folder = base_folder / runs
         self.app_folder.mkdir(parents=True, exist_ok=True)
+        self.owns_trash = trash is None
+        self.trash = trash or TrashReaper(base_folder / '.trash')
+        self.store = None
+        if isinstance(result_store, ResultStore):
+            self.store = result_store
+        elif result_store:
+            self.store = ResultStore(base_folder / 'results.db', shared=shared_store)
+        if self.store and not self.store.has_run(runs):
+            self.store.import_run(self.app_folder, self.docker_base_folder / runs if use_docker else None)
         self.use_docker = use_docker
+        self.stream_logs = stream_logs
         self.raw_folder = self.app_folder / 'raw_output'
         self.raw_folder.mkdir(parents=True, exist_ok=True)
        
@@ -58,47 +188,272 @@ class AppForge:
             self.emulator_id='emulator-5554'
             client = docker.from_env()
 
-            # Use default image name if docker_name is empty
-            if not docker_name:
-                docker_name = 'zenithfocuslight/appforge:latest'
+            self.snapshot_volume = snapshot_volume
+            self.owns_container = container is None
+            if container:
+                print(f'AppForge: Attaching to docker {container}...')
+                self.container = client.containers.get(container)
+                assert self.container.status == 'running', f'Docker {container} is not running!'
+                if gradle_home:
+                    assert any(mount.get('Destination') == str(self.docker_gradle_home)
+                               for mount in self.container.attrs.get('Mounts', [])), \
+                        f'Docker {container} has no Gradle home mounted at {self.docker_gradle_home}!'
+            else:
+                # Use default image name if docker_name is empty
+                if not docker_name:
+                    docker_name = 'zenithfocuslight/appforge:latest'
 
-            print(f'AppForge: Starting docker {docker_name}...')
-            # Use subprocess to run docker command directly (avoids Python SDK command issue)
-            docker_cmd = [
-                'docker', 'run', '-d',
-                '--privileged',
-                '--device', '/dev/kvm:/dev/kvm',
-                '-p', f'{docker_port}:{docker_port}',
-                '-v', f'{str(self.base_folder)}:{str(self.docker_base_folder)}:rw',
-                docker_name
-            ]
-            result = subprocess.run(docker_cmd, capture_output=True, text=True, check=True)
-            container_id = result.stdout.strip()
-            self.container = client.containers.get(container_id)   
+                print(f'AppForge: Starting docker {docker_name}...')
+                # a port is free until the container binds it, so no other instance may pick it meanwhile
+                with file_lock(Path(tempfile.gettempdir()) / 'appforge-docker-ports.lock'):
+                    if pick_free_port:
+                        docker_port = free_port(docker_port)
+                    # Use subprocess to run docker command directly (avoids Python SDK command issue)
+                    docker_cmd = [
+                        'docker', 'run', '-d',
+                        '--privileged',
+                        '--device', '/dev/kvm:/dev/kvm',
+                        '-p', f'{docker_port}:{self.docker_novnc_port}',
+                        '-v', f'{str(self.base_folder)}:{str(self.docker_base_folder)}:rw',
+                    ]
+                    if snapshot_volume:
+                        docker_cmd += ['-v', f'{snapshot_volume}:{self.docker_emulator_home}:rw']
+                    if gradle_home:
+                        # writable for the warm-up only, which may run in this container
+                        docker_cmd += ['-v', f'{gradle_home}:{self.docker_gradle_home}:rw']
+                    docker_cmd.append(docker_name)
+                    with self.span('docker_boot'):
+                        result = subprocess.run(docker_cmd, capture_output=True, text=True, check=True)
+                container_id = result.stdout.strip()
+                self.docker_port = docker_port
+                print(f'AppForge: noVNC of docker {container_id[:12]} on port {docker_port}...')
+                self.container = client.containers.get(container_id)   
+            if self.owns_trash:
+                # build outputs in the mounted base folder belong to the container's root user
+                self.trash.remover = self.remove_in_container
             print('AppForge: Waiting emulator on docker to get online...')
-            while True:
-                print('AppForge: This might take a while (2-3min)...')
-                try:
-                    self.ensure_emulator()
-                    break
-                except:
-                    time.sleep(10)    
+            try:
+                self.wait_for_emulator(boot_deadline)
+            except BaseException:
+                if self.owns_trash:
+                    self.trash.close()
+                if self.owns_container:
+                    self.remove_container()
+                raise
         else:
             assert sdk_path and bench_folder, 'Android SDK and Benchmark folder not provided!'
             self.sdk_path = sdk_path
             self.bench_folder = bench_folder
-        with open('tasks/tasks.json','r') as file:
-            self.task_sheet = json.load(file)
+        if build_cache or gradle_home or template_baseline:
+            # the image ID changes whenever a tag is moved to a rebuilt image
+            identity = self.build_identity(self.container.image.id if self.use_docker else sdk_identity(self.sdk_path))
+        self.build_cache = None
+        if isinstance(build_cache, BuildCache):
+            assert build_cache.identity == identity, 'The build cache holds builds of another SDK or template!'
+            self.build_cache = build_cache
+        elif build_cache:
+            self.build_cache = BuildCache(self.base_folder / '.build_cache', identity, max_bytes=build_cache_bytes)
+        self.build_worker = None
+        if build_worker:
+            if self.use_docker:
+                self.build_worker = BuildWorker(container_id=self.container.id, python='python3')
+            else:
+                self.build_worker = BuildWorker()
+            self.build_worker.start()
+        self.evaluator = None
+        if evaluator_server:
+            if self.use_docker:
+                name = Path('.evaluator') / f'{self.container.id[:12]}.sock'
+                self.evaluator = EvaluatorServer(self.base_folder / name, self.docker_bench_folder / 'evaluate_app.py',
+                                                 self.emulator_id, container_id=self.container.id,
+                                                 server_socket_path=self.docker_base_folder / name, python='python3')
+            else:
+                self.evaluator = EvaluatorServer(
+                    Path(tempfile.gettempdir()) / f'appforge-{os.getuid()}' / f'{self.emulator_id}.sock',
+                    Path(self.bench_folder).resolve() / 'evaluate_app.py', self.emulator_id)
+        if profile_builds:
+            self._install_init_script('appforge-profile.gradle', PROFILE_INIT_SCRIPT)
+        self.gradle_home = None
+        if gradle_home:
+            self.gradle_home = GradleHome(gradle_home, identity)
+            self._install_init_script('appforge-shared.gradle', SHARED_INIT_SCRIPT)
+            self._warm_gradle_home()
+        self.baseline = None
+        if template_baseline:
+            self.baseline = TemplateBaseline(self.base_folder / '.baseline', identity)
+            self._install_init_script('appforge-classpath.gradle', CLASSPATH_INIT_SCRIPT)
+            self._build_baseline()
+        self.checker = self._setup_fast_check() if fast_check and self.baseline else None
+        self.tasks = load_tasks()
+        self.task_sheet = self.tasks.sheet
+    
+    @classmethod
+    def build_identity(cls, sdk: str):
+        """
+        Identity of the builds of the template with an SDK, which is identified by
+        `cache.sdk_identity` or by the ID of the container image.
+        """
+        return f'{sdk}:{hash_folder(cls.template_folder / "empty_activity")}'
+    
+    def _install_init_script(self, name: str, script: str):
+        """
+        Install a Gradle init script into the `init.d` of the Gradle user home of the builds.
+        """
+        # written aside and renamed, as builds of other instances may be reading it
+        if self.use_docker:
+            encoded = base64.b64encode(script.encode('utf-8')).decode()
+            self.exec_cmd(['sh', '-c', 'd="${GRADLE_USER_HOME:-$HOME/.gradle}/init.d" && mkdir -p "$d" && '
+                                       f'echo {encoded} | base64 -d > "$d/{name}.$$" && mv "$d/{name}.$$" "$d/{name}"'],
+                          env=self.build_env)
+            return
+        home = self.build_env.get('GRADLE_USER_HOME') or os.environ.get('GRADLE_USER_HOME')
+        folder = (Path(home) if home else Path.home() / '.gradle') / 'init.d'
+        folder.mkdir(parents=True, exist_ok=True)
+        tmp = folder / f'{name}.{os.getpid()}'
+        tmp.write_text(script, encoding='utf-8')
+        os.replace(tmp, folder / name)
+    
+    @traced('gradle_warmup')
+    def _warm_gradle_home(self):
+        """
+        Build the template once in the shared Gradle home online, unless an instance
+        already did, so that it holds every dependency and plugin. From then on, build
+        offline with it as the read-only dependency cache.
+        """
+        shared = str(self.docker_gradle_home if self.use_docker else self.gradle_home.path)
+        with self.gradle_home.lock():
+            if not self.gradle_home.warm:
+                print('AppForge: Warming the shared Gradle home...')
+                folder = self.base_folder / '.gradle_warmup'
+                self.trash.discard(folder)
+                folder.mkdir(parents=True)
+                with open(folder / 'changed.json', 'w', encoding='utf-8') as file:
+                    json.dump(WARMUP_CHANGED, file)
+                build_folder = self.docker_base_folder / '.gradle_warmup' if self.use_docker else folder
+                output = self.exec_cmd(self.build_cmd(build_folder / 'changed.json', build_folder, 'template'),
+                                       self.bench_path() / 'compiler',
+                                       env={**self.build_env, 'GRADLE_USER_HOME': shared, SHARED_ENV: 'online'})
+                (folder / 'compile.log').write_text(output, encoding='utf-8')
+                if (folder / 'template' / 'app' / 'build' / 'outputs' / 'apk' / 'debug' / 'app-debug.apk').exists():
+                    self.gradle_home.mark_warm()
+                    self.trash.discard(folder)
+                else:
+                    print(f'AppForge: Warming the shared Gradle home failed, see {folder / "compile.log"}. '
+                          'Building online...')
+        if not self.gradle_home.warm:
+            self.build_env[SHARED_ENV] = 'online'
+            return
+        self._seed_gradle_distribution(shared)
+        self.build_env[RO_CACHE_ENV] = self.gradle_home.ro_cache(shared)
+        self.build_env[SHARED_ENV] = 'offline'
+    
+    def _seed_gradle_distribution(self, shared: str):
+        """
+        Copy the Gradle distribution of the warm shared home into the builds' own home,
+        which offline builds cannot download it into.
+        """
+        if self.use_docker:
+            self.exec_cmd(['sh', '-c', '[ -d "$GRADLE_USER_HOME/wrapper" ] || [ ! -d "$0/wrapper" ] || '
+                                       '{ mkdir -p "$GRADLE_USER_HOME" && cp -a "$0/wrapper" "$GRADLE_USER_HOME/"; }',
+                           shared], env=self.build_env)
+            return
+        home = Path(self.build_env['GRADLE_USER_HOME'])
+        if not (home / 'wrapper').exists() and (self.gradle_home.path / 'wrapper').is_dir():
+            home.mkdir(parents=True, exist_ok=True)
+            clone_folder(self.gradle_home.path / 'wrapper', home / 'wrapper')
+    
+    @traced('baseline')
+    def _build_baseline(self):
+        """
+        Build the template baseline, unless an instance already did. Without a
+        baseline, tasks are built from scratch.
+        """
+        with self.baseline.lock():
+            if self.baseline.changed is None:
+                print('AppForge: Building the template baseline...')
+                folder = self.baseline.folder
+                self.trash.discard(folder)
+                folder.mkdir(parents=True)
+                with open(folder / 'changed.json', 'w', encoding='utf-8') as file:
+                    json.dump(WARMUP_CHANGED, file)
+                build_folder = self.docker_base_folder / folder.relative_to(self.base_folder) \
+                    if self.use_docker else folder
+                # with the classpath of its javac, for the fast check
+                output = self.exec_cmd(self.build_cmd(build_folder / 'changed.json', build_folder,
+                                                      TemplateBaseline.PROJECT),
+                                       self.bench_path() / 'compiler', env={**self.build_env, CLASSPATH_ENV: CLASSPATH_FILE})
+                (folder / 'compile.log').write_text(output, encoding='utf-8')
+                if (self.baseline.project / 'app' / 'build' / 'outputs' / 'apk' / 'debug' / 'app-debug.apk').exists():
+                    self.baseline.mark_built(WARMUP_CHANGED)
+        if self.baseline.changed is None:
+            print(f'AppForge: Building the template baseline failed, see {self.baseline.folder / "compile.log"}. '
+                  'Building tasks from scratch...')
+            self.baseline = None
+    
+    def _setup_fast_check(self):
+        """
+        Find the tools of the fast check, and the classpath and resources of the template
+        baseline in the build environment. Returns None, and builds go straight to Gradle,
+        if any of them is missing.
+        """
+        info = read_classpath(self.baseline.project / CLASSPATH_FILE)
+        resources = self.baseline.folder / 'resources.zip'
+        with self.baseline.lock():
+            packed = resources.exists() or pack_resources(self.baseline.project, resources)
+        if info is None or not packed:
+            print('AppForge: The template baseline has no classpath or resources, the fast check is off.')
+            return None
+        if self.use_docker:
+            sdk, resources = '/opt/android', self.docker_base_folder / resources.relative_to(self.base_folder)
+        else:
+            sdk = str(self.sdk_path)
+        if info['bootclasspath']:
+            android_jar = info['bootclasspath'][0]
+        else:
+            compile_sdk = re.search(r'compileSdk\s+(\d+)',
+                                    (self.template_folder / 'empty_activity' / 'app' / 'build.gradle').read_text())
+            android_jar = f'{sdk}/platforms/android-{compile_sdk.group(1)}/android.jar'
+        lines = self.exec_cmd(['sh', '-c', TOOLS_SCRIPT, 'tools', sdk, android_jar, *info['classpath']]).splitlines()
+        missing = [line[len('missing '):] for line in lines if line.startswith('missing ')]
+        tools = [line for line in lines if not line.startswith('missing ')]
+        if missing or len(tools) != 2:
+            print(f'AppForge: The fast check is off, missing {", ".join(missing) or "aapt2 or javac"}.')
+            return None
+        return FastCheck(tools[0], tools[1], android_jar, info['classpath'], str(resources))
     
     def clean_up(self):
         """
         Clean up resources and stop Docker container if used.
         """
-        if self.use_docker:
-            print('AppForge: Shutting down docker...')
-            self.container.stop()
-            self.container.remove()
-            
+        if self.build_worker:
+            self.build_worker.close()
+        if self.evaluator:
+            self.evaluator.close()
+        if self.backend:
+            self.backend.close()
+        if self.owns_trash:
+            self.trash.close()
+        if self.tracer:
+            self.tracer.export(self.app_folder / 'trace.json')
+        if self.use_docker and self.owns_container:
+            if self.snapshot_volume:
+                print('AppForge: Saving emulator snapshot...')
+                self.exec_cmd(['adb', '-s', self.emulator_id, 'emu', 'avd', 'snapshot', 'save', 'default_boot'])
+            self.remove_container()
+    
+    def remove_in_container(self, path: Path):
+        """
+        Remove a tree under the base folder from inside the container, which may have created it.
+        """
+        self.exec_cmd(['rm', '-rf', str(self.docker_base_folder / path.relative_to(self.base_folder))])
+    
+    def remove_container(self):
+        """
+        Stop and remove the container this instance started.
+        """
+        print('AppForge: Shutting down docker...')
+        self.container.stop()
+        self.container.remove()
         
     def description(self, task_id: int):
         """
@@ -120,8 +475,8 @@ class AppForge:
             f'Task ID ranges from 0~{self.task_num-1}.'
             
         return {
-            'task': self.task_sheet[task_id]["app_key"],
-            'features':self.task_sheet[task_id]["refined_features"],
+            'task': self.tasks[task_id].app_key,
+            'features':self.tasks[task_id].refined_features,
             'api_version':'Android 12',
             'device':'Nexus 4',
         }
@@ -138,10 +493,19 @@ class AppForge:
         return self.apk_folder(task_id) / 'test.log'
     def fuzz_log(self, task_id):
         return self.apk_folder(task_id) / 'fuzz.log'
+    def session_log(self, task_id):
+        return self.apk_folder(task_id) / 'evaluate.log'
+    def shard_log(self, task_id, shard):
+        return self.apk_folder(task_id) / f'test.{shard}.log'
     def json_file(self, task_id):
         return self.apk_folder(task_id) / 'changed.json'
     def result_path(self, task_id):
         return self.app_folder / str(task_id) / 'test_result.json'
+    def timings_path(self, task_id):
+        return self.app_folder / str(task_id) / 'timings.json'
+    def gradle_profile_path(self, task_id):
+        return self.app_folder / str(task_id) / 'gradle_profile.json'
+    
     def fuzz_result_path(self, task_id):
         return self.app_folder / str(task_id) / 'fuzz_result.json'
     def direct_apk_path(self, task_id):
@@ -152,62 +516,650 @@ class AppForge:
         return self.docker_apk_folder(task_id) / 'changed.json'
     def docker_direct_apk_path(self, task_id):
         return self.docker_folder / str(task_id) / str(task_id) /'app'/'build'/'outputs'/'apk'/'debug'/'app-debug.apk'     
+    def bench_path(self):
+        return self.docker_bench_folder if self.use_docker else self.bench_folder
     
-    def ensure_emulator(self):
+    def compile_cmd(self, task_id):
         """
-        Ensure that the emulator is online and accessible.
+        Command line of `build.py` for a task, run under `bench_path() / 'compiler'`.
         """
         if self.use_docker:
-            if self.emulator_id not in self.container.exec_run('adb devices').output.decode():
-                assert 0, 'Emulator offline!'
+            return self.build_cmd(self.docker_json_file(task_id), self.docker_apk_folder(task_id), str(task_id))
+        return self.build_cmd(self.json_file(task_id), self.apk_folder(task_id), str(task_id))
+    
+    def build_cmd(self, json_file: Path, output: Path, project_name: str):
+        """
+        Command line of `build.py` building the `changed` map in `json_file` into `output / project_name`.
+        """
+        if self.use_docker:
+            return ['python3', 'build.py', '--android-sdk-path=/opt/android',
+                    '--templates-dir=./templates', f'--generated-files={str(json_file)}',
+                    f'--output={str(output)}', f'--project-name={project_name}',
+                    '--json_content_directly']
+        return ['python', 'build.py', f'--android-sdk-path={str(self.sdk_path)}',
+                '--templates-dir=./templates', f'--generated-files={str(json_file)}',
+                f'--output={str(output)}', f'--project-name={project_name}',
+                '--json_content_directly']
+    
+    def evaluate_cmd(self, task_id, test: str, sub_features: Optional[list[str]] = None):
+        """
+        Command line of `evaluate_app.py` for a task, run under `bench_path()`.
+        `test` is either 'no_fuzz' or 'only_fuzz'; `sub_features` restricts the
+        tests to the given 'N-M' IDs.
+        """
+        if self.use_docker:
+            interpreter, apk_path = 'python3', self.docker_direct_apk_path(task_id)
         else:
-            if self.emulator_id not in subprocess.run(['adb', 'devices'], capture_output=True, text=True).stdout:
-                assert 0, 'Emulator offline!'
+            interpreter, apk_path = 'python', self.direct_apk_path(task_id)
+        return [interpreter, 'evaluate_app.py', f'--apk-path={str(apk_path)}',
+                '--test', test, f'--package-name={self.task_name(task_id)}',
+                f'--device-id={self.emulator_id}', f'--task={self.task_name(task_id)}'] + \
+               ([f'{self.sub_feature_arg}={",".join(sub_features)}'] if sub_features else [])
+    
+    def evaluate_usage(self):
+        """
+        The `--help` text of `evaluate_app.py`, asked once, or '' if it gave none.
+        """
+        if self._evaluate_usage is None:
+            interpreter = 'python3' if self.use_docker else 'python'
+            try:
+                self._evaluate_usage = self.exec_cmd([interpreter, 'evaluate_app.py', '--help'], self.bench_path(),
+                                                     timeout=self.probe_timeout)
+            except subprocess.TimeoutExpired:
+                self._evaluate_usage = ''
+        return self._evaluate_usage
+    
+    def supports_sub_features(self):
+        """
+        Whether `evaluate_app.py` takes `sub_feature_arg`, which sharded tests need.
+        """
+        return self.sub_feature_arg in self.evaluate_usage()
+    
+    def supports_combined(self):
+        """
+        Whether `evaluate_app.py` lists `combined_test` among the modes of its `--test` option.
+        """
+        match = re.search(r'--test[ =]\{([^}]*)\}', self.evaluate_usage())
+        return bool(match) and self.combined_test in match.group(1).split(',')
+    
+    @property
+    def device_name(self):
+        container = getattr(self, 'container', None)
+        return container.name if container is not None else self.emulator_id
+    
+    def span(self, name: str, task_id: Optional[int] = None):
+        """
+        Time the enclosed block as a span of the tracer, with the run and device
+        and, if given, the task as attributes. Does nothing if tracing is off.
+        """
+        if self.tracer is None:
+            return nullcontext()
+        return self._span(name, task_id)
+    
+    @contextmanager
+    def _span(self, name: str, task_id: Optional[int]):
+        attrs = {'run': self.runs, 'device': self.device_name}
+        if task_id is not None:
+            attrs['task'] = task_id
+        with self.tracer.span(name, **attrs):
+            yield
+        if task_id is not None and self.tracer.depth() == 0:
+            self.write_timings(task_id)
+    
+    def write_timings(self, task_id: int):
+        """
+        Write the seconds spent in each span of the task so far to `timings.json`,
+        keeping the timings of spans only an earlier process ran, e.g. the compile.
+        """
+        path = self.timings_path(task_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # shards of a task finish on several threads at once
+        with file_lock(path.with_name('.timings.lock')):
+            timings = {}
+            if path.exists():
+                with open(path, 'r', encoding='utf-8') as file:
+                    timings = json.load(file)
+            timings.update(self.tracer.task_totals(task_id))
+            temp = path.with_name(f'.timings.{os.getpid()}.json')
+            with open(temp, 'w+', encoding='utf-8') as file:
+                json.dump(timings, file, indent=1)
+            os.replace(temp, path)
+    
+    def exec_cmd(self, cmd: list[str], workdir: Optional[Path] = None, timeout: Optional[float] = None,
+                 env: Optional[dict[str, str]] = None):
+        """
+        Run a command in the container or locally and return its output.
+        In Docker mode stdout and stderr are merged, locally only stdout is kept.
+        `evaluate_app.py` runs on the evaluator server if there is one, and commands
+        the backend serves on the backend. `env` is added to the command's environment.
         
+        Raises:
+            subprocess.TimeoutExpired: If `timeout` seconds passed; the command and its
+                children have been killed.
+        """
+        if self.backend and self.backend.serves(cmd):
+            output = self.backend.run(cmd, workdir)
+            if output is not None:
+                return output
+        if self.evaluator and self.evaluator.serves(cmd) and timeout is None:
+            output = self.evaluator.run(cmd, workdir)
+            if output is not None:
+                return output
+        if self.use_docker:
+            if timeout:
+                # coreutils timeout signals the whole process group of the command
+                result = self.container.exec_run(['timeout', '-s', 'KILL', str(math.ceil(timeout))] + cmd,
+                                                 workdir=str(workdir) if workdir else None, environment=env)
+                if result.exit_code in (124, 137):
+                    raise subprocess.TimeoutExpired(cmd, timeout, result.output)
+                return result.output.decode()
+            return self.container.exec_run(cmd, workdir=str(workdir) if workdir else None,
+                                           environment=env).output.decode()
+        local_env = {**os.environ, **env} if env else None
+        if timeout:
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                                    cwd=str(workdir) if workdir else None, start_new_session=True, env=local_env)
+            try:
+                return proc.communicate(timeout=timeout)[0]
+            except subprocess.TimeoutExpired:
+                self.kill_cmd(cmd, proc.pid)
+                proc.communicate()
+                raise
+        return subprocess.run(cmd, capture_output=True, text=True,
+                              cwd=str(workdir) if workdir else None, env=local_env).stdout
+    
+    def exec_stream(self, cmd: list[str], workdir: Optional[Path], log_path: Path, parser,
+                    watch: Optional[StopPolicy] = None, env: Optional[dict[str, str]] = None):
+        """
+        Run a command like `exec_cmd`, but tee its output chunk by chunk into
+        `log_path` and `parser`, so memory use does not grow with the log.
+        If `watch` is given, the command (with its children) is killed once its
+        budget or deadline runs out or its condition holds on the output parsed so far.
         
-    def compile_json_based_on_template(self, changed: dict[str, str], task_id: int, raw_log: Optional[str] = None):
+        Returns:
+            The parser's result once the output stream closes.
         """
-        Apply changes from JSON on template and compile the application.
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        start = time.time()
+        runner = next((runner for runner in [self.backend, self.evaluator] if runner and runner.serves(cmd)), None)
+        job = runner.submit(cmd, workdir) if runner else None
+        with open(log_path, 'w+') as file:
+            proc = None
+            if job is not None:
+                pid, chunks = job
+                kill = lambda: runner.kill(pid)
+            elif self.use_docker:
+                chunks = self.container.exec_run(cmd, workdir=str(workdir) if workdir else None, stream=True,
+                                                 environment=env).output
+                kill = lambda: self.kill_cmd(cmd)
+            else:
+                proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                        cwd=str(workdir) if workdir else None, start_new_session=True,
+                                        env={**os.environ, **env} if env else None)
+                chunks = iter(lambda: proc.stdout.read1(65536), b'')
+                kill = lambda: self.kill_cmd(cmd, proc.pid)
+            timers = []
+            if watch and watch.budget:
+                timers.append(threading.Timer(watch.budget, watch.stop, [kill, 'budget']))
+            if watch and watch.deadline:
+                timers.append(threading.Timer(watch.deadline, watch.stop, [kill, 'timeout']))
+            for timer in timers:
+                timer.start()
+            try:
+                for chunk in chunks:
+                    text = decoder.decode(chunk)
+                    file.write(text)
+                    parser.feed(text)
+                    if watch and watch.reason is None and watch.check(parser, time.time() - start):
+                        watch.stop(kill, watch.name)
+            finally:
+                for timer in timers:
+                    timer.cancel()
+            text = decoder.decode(b'', final=True)
+            file.write(text)
+            parser.feed(text)
+            if proc:
+                proc.wait()
+        return parser.result()
+    
+    def kill_cmd(self, cmd: list[str], pid: Optional[int] = None):
+        """
+        Kill a running command and its child processes: locally the process group
+        started for `pid`, in the container every process running exactly `cmd`.
+        """
+        if pid is not None:
+            try:
+                os.killpg(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            return
+        pattern = re.sub(r'([.^$*+?()\[\]{}|\\])', r'\\\1', ' '.join(cmd))
+        for pid in self.container.exec_run(['pgrep', '-f', f'^{pattern}$']).output.decode().split():
+            self.container.exec_run(['pkill', '-KILL', '-P', pid])
+            self.container.exec_run(['kill', '-KILL', pid])
+    
+    @traced('parse')
+    def log_output(self, log_path: Path, output: str, parser):
+        """
+        Write a finished output to `log_path` and return what `parser` makes of it.
+        """
+        with open(log_path,'w+') as file:
+            file.write(output)
+        parser.feed(output)
+        return parser.result()
+    
+    def run_logged(self, cmd: list[str], workdir: Optional[Path], log_path: Path, parser,
+                   env: Optional[dict[str, str]] = None):
+        """
+        Run a command, keep its output in `log_path` and return the parsed result,
+        streaming if `stream_logs` is set.
+        """
+        if self.stream_logs:
+            return self.exec_stream(cmd, workdir, log_path, parser, env=env)
+        return self.log_output(log_path, self.exec_cmd(cmd, workdir, env=env), parser)
+    
+    @traced('exec')
+    def run_stage(self, stage: str, cmd: list[str], workdir: Optional[Path], log_path: Path, parser,
+                  watch: Optional[StopPolicy] = None):
+        """
+        `run_logged` under the deadline of `stage`, if it has one, and the stop policy `watch`.
+        Builds ('compile') run with `build_env`.
+        
+        Raises:
+            StageTimeout: If the command was killed on the stage's deadline.
+        """
+        deadline = self.deadlines.get(stage)
+        env = self.build_env if stage == 'compile' else None
+        if deadline is None and watch is None:
+            return self.run_logged(cmd, workdir, log_path, parser, env=env)
+        watch = watch or StopPolicy()
+        watch.deadline = deadline
+        result = self.exec_stream(cmd, workdir, log_path, parser, watch=watch, env=env)
+        if watch.reason == 'timeout':
+            raise StageTimeout(stage, deadline)
+        return result
+    
+    def with_retries(self, stage: str, task_id: int, attempt: Callable[[int], Any]):
+        """
+        Call `attempt(i)` for i = 0, 1, ... until it does not time out, at most 1 + `retries` times.
         
-        Args:
-            changed (dict[str, str]): Dictionary containing changes to apply.
-            task_id (int): ID of the task to compile.
-            
         Returns:
-            str: Compilation errors if any, empty string if successful.
+            tuple: What the last attempt returned (None if it timed out) and whether every attempt timed out.
         """
-        print(f'AppForge: Compiling on {task_id}...')
-        remove_directory(self.apk_folder(task_id))
-        self.apk_folder(task_id).mkdir()
-
+        for i in range(self.retries + 1):
+            try:
+                return attempt(i), False
+            except StageTimeout as e:
+                print(f'AppForge: {stage.capitalize()} on {task_id} timed out after {e.seconds}s '
+                      f'(attempt {i + 1}/{self.retries + 1})...')
+                self.recover(stage, task_id)
+        return None, True
+    
+    def recover(self, stage: str, task_id: int):
+        """
+        Clean up after a stage of a task was killed on its deadline, before it is retried.
+        A wedged Gradle daemon would hang the retry of a compile as well. It is killed
+        in the container, and locally if the builds have a Gradle user home of their
+        own (`gradle_home`); in a Gradle user home shared with other builds, the
+        project's `gradlew --stop` asks its daemons to stop instead.
+        """
+        if stage == 'compile':
+            home = self.build_env.get('GRADLE_USER_HOME')
+            if self.use_docker:
+                self.exec_cmd(['pkill', '-KILL', '-f', 'GradleDaemon'])
+            elif home:
+                # the daemons of a home run the Gradle distribution it holds
+                self.exec_cmd(['pkill', '-KILL', '-f', f'{re.escape(home)}/.*GradleDaemon'])
+            elif (self.project_folder(task_id) / 'gradlew').exists():
+                try:
+                    self.exec_cmd([str(self.project_folder(task_id) / 'gradlew'), '--stop'],
+                                  self.project_folder(task_id), timeout=self.probe_timeout)
+                except subprocess.TimeoutExpired:
+                    pass
+        elif stage == 'fuzz':
+            self.stop_fuzzer()
+    
+    def log_timeout(self, log_path: Path, stage: str):
+        message = f'{stage.capitalize()} timed out after {self.deadlines[stage]}s!\n'
+        with open(log_path, 'a', encoding='utf-8') as file:
+            file.write('\n' + message)
+        return message
+    
+    def mark_timeout(self, stage: str, result: dict, timed_out: bool):
+        if stage in self.deadlines:
+            result['timeout'] = int(timed_out)
+        return result
+    
+    def emulator_ready(self):
+        """
+        Probe whether the emulator is listed by adb in 'device' state, has
+        completed booting and answers package manager queries.
+        """
+        try:
+            timeout = self.probe_timeout
+            if f'{self.emulator_id}\tdevice' not in self.exec_cmd(['adb', 'devices'], timeout=timeout):
+                return False
+            adb = ['adb', '-s', self.emulator_id, 'shell']
+            if self.exec_cmd(adb + ['getprop', 'sys.boot_completed'], timeout=timeout).strip() != '1':
+                return False
+            return 'package:' in self.exec_cmd(adb + ['pm', 'path', 'android'], timeout=timeout)
+        except Exception:
+            return False
+    
+    @traced('wait_for_emulator')
+    def wait_for_emulator(self, deadline: float = 600):
+        """
+        Wait until `emulator_ready`, probing with exponential backoff.
+        
+        Args:
+            deadline (float): Seconds to wait at most. Defaults to 600.
+        """
+        start, delay = time.time(), 1
+        while not self.emulator_ready():
+            remaining = deadline - (time.time() - start)
+            if remaining <= 0:
+                raise TimeoutError(f'Emulator {self.emulator_id} not ready after {deadline}s!')
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 30)
+        print(f'AppForge: Emulator ready after {time.time() - start:.1f}s.')
+    
+    @traced('ensure_emulator')
+    def ensure_emulator(self):
+        """
+        Ensure that the emulator is online and accessible.
+        """
+        if self.emulator_id not in self.exec_cmd(['adb', 'devices'], timeout=self.probe_timeout):
+            assert 0, 'Emulator offline!'
+        
+    @traced('exec')
+    def run_build(self, task_id: int):
+        """
+        Run `build.py` for a prepared task and return its console output,
+        through the build worker if there is one and it is not busy with another task.
+        """
+        cmd, workdir = self.compile_cmd(task_id), self.bench_path() / 'compiler'
+        deadline = self.deadlines.get('compile')
+        try:
+            if (self.build_worker and not self.build_worker.busy()
+                    and not (self.backend and self.backend.serves(cmd))):
+                output = self.build_worker.run(cmd, workdir, merge_stderr=self.use_docker, timeout=deadline,
+                                               env=self.build_env)
+                if output is not None:
+                    return output
+                print('AppForge: Build worker died, compiling without it...')
+            return self.exec_cmd(cmd, workdir, timeout=deadline, env=self.build_env)
+        except (TimeoutError, subprocess.TimeoutExpired):
+            raise StageTimeout('compile', deadline)
+        
+    def project_folder(self, task_id):
+        return self.apk_folder(task_id) / str(task_id)
+    def project_workdir(self, task_id):
+        return self.docker_apk_folder(task_id) / str(task_id) if self.use_docker else self.project_folder(task_id)
+    
+    def _build_project(self, changed: dict[str, str], task_id: int):
+        """
+        Generate and build the project of a prepared task with `build.py`, through the
+        build worker if there is one, unless the fast check fails on the generated files.
+        The check is skipped if they touch the Gradle build files, which it cannot judge.
+        """
+        if self.checker and self.checker.covers(changed):
+            error = self._fast_check(changed, task_id)
+            if error is not None:
+                return error
+        if self.build_worker:
+            return self._finish_compile(task_id, self.run_build(task_id))
+        return self.run_stage('compile', self.compile_cmd(task_id), self.bench_path() / 'compiler',
+                              self.compile_log(task_id), self.error_parser(task_id))
+    
+    @traced('fast_check')
+    def _fast_check(self, changed: dict[str, str], task_id: int):
+        """
+        Check the template's sources with the generated files written over them, in a
+        scratch copy laid out like the project, so that errors read like the build's.
+        """
+        folder, template = self.apk_folder(task_id) / 'check', self.template_folder / 'empty_activity'
+        shutil.rmtree(folder, ignore_errors=True)
+        project = folder / str(task_id)
+        for path in (template / 'app' / 'src' / 'main').rglob('*'):
+            if path.is_file():
+                rel = path.relative_to(template)
+                (project / rel).parent.mkdir(parents=True, exist_ok=True)
+                (project / rel).write_bytes(path.read_bytes())
+        self._apply_changed(project, {}, changed)
+        task_folder = self.docker_apk_folder(task_id) if self.use_docker else self.apk_folder(task_id)
+        try:
+            error = self.run_stage('check', self.checker.cmd(), task_folder / 'check' / str(task_id),
+                                   self.compile_log(task_id), ErrorParser(ignore_path_str=str(task_folder / 'check')))
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+        # the log names the files where the build would have them
+        log = self.compile_log(task_id)
+        log.write_text(log.read_text(encoding='utf-8').replace(str(task_folder / 'check'), str(task_folder)),
+                       encoding='utf-8')
+        return error
+    
+    def _append_raw_log(self, task_id: int, raw_log: Optional[str] = None):
         with open(self.raw_log_file(task_id), 'a+', encoding='utf-8') as file:
             file.write('='*20+'\n')
             if raw_log:
                 file.write(raw_log)
-        if changed:
-            with open(self.json_file(task_id), 'w+', encoding='utf-8') as file:
-                json.dump(changed, file)
-            
-            if self.use_docker:
-                cmd = f'''python3 build.py --android-sdk-path="/opt/android" \
-                --templates-dir=./templates --generated-files="{str(self.docker_json_file(task_id))}" --output="{str(self.docker_apk_folder(task_id))}" --project-name="{str(task_id)}" --json_content_directly'''
-                output = self.container.exec_run(cmd,workdir=str(self.docker_bench_folder / 'compiler')).output.decode()
-            else:
-                cmd = f'''python build.py --android-sdk-path="{str(self.sdk_path)}" \
-                    --templates-dir=./templates --generated-files="{str(self.json_file(task_id))}" --output="{str(self.apk_folder(task_id))}" --project-name="{str(task_id)}" --json_content_directly'''
-                output = subprocess.run(cmd, capture_output=True,shell=True,text=True,cwd=str(self.bench_folder / 'compiler')).stdout
+    
+    @traced('write_files')
+    def _prepare_incremental(self, changed: dict[str, str], task_id: int, raw_log: Optional[str] = None):
+        """
+        Update the project generated by an earlier compile of the task in place:
+        rewrite the files whose content changed since the previous attempt, and
+        reset files the new attempt no longer provides to the template version
+        (or delete them if the template has none). Outputs of the previous
+        attempt are removed so that nothing stale is tested. `build.py` then
+        generates the project over it, and Gradle reuses the build intermediates.
+        Returns False if there is no earlier project to update.
+        """
+        project = self.project_folder(task_id)
+        if not changed or not (project / 'gradlew').exists() or not self.json_file(task_id).exists():
+            return False
+        print(f'AppForge: Compiling on {task_id} incrementally...')
+        with open(self.json_file(task_id), 'r', encoding='utf-8') as file:
+            previous = json.load(file)
+        self._apply_changed(project, previous, changed)
+        for path in [self.direct_apk_path(task_id), self.compile_log(task_id), self.test_log(task_id),
+                     self.fuzz_log(task_id), self.result_path(task_id), self.fuzz_result_path(task_id)]:
+            if path.exists():
+                path.unlink()
+        if self.store:
+            self.store.delete(self.runs, task_id, ['compile', 'test', 'fuzz'])
 
+        self._append_raw_log(task_id, raw_log)
+        with open(self.json_file(task_id), 'w+', encoding='utf-8') as file:
+            json.dump(changed, file)
+        return True
+    
+    def _apply_changed(self, project: Path, previous: dict[str, str], changed: dict[str, str]):
+        """
+        Turn a project generated from `previous` into one generated from `changed`.
+        """
+        template = self.template_folder / 'empty_activity'
+        for rel in previous.keys() - changed.keys():
+            if (template / rel).exists():
+                (project / rel).write_bytes((template / rel).read_bytes())
+            elif (project / rel).exists():
+                (project / rel).unlink()
+        for rel, text in changed.items():
+            if previous.get(rel) != text:
+                (project / rel).parent.mkdir(parents=True, exist_ok=True)
+                (project / rel).write_text(text, encoding='utf-8')
+    
+    @traced('write_files')
+    def _seed_from_baseline(self, task_id: int):
+        """
+        Clone the build intermediates of the template baseline into the project
+        folder of a prepared task, without the baseline's APK.
+        """
+        self.baseline.seed(self.project_folder(task_id))
+        self.direct_apk_path(task_id).unlink(missing_ok=True)
+    
+    @traced('write_files')
+    def _prepare_compile(self, changed: dict[str, str], task_id: int, raw_log: Optional[str] = None):
+        """
+        Reset the task folder and write the raw log and `changed.json`.
+        Returns False (after writing the compile log) if there is nothing to build.
+        """
+        print(f'AppForge: Compiling on {task_id}...')
+        self.trash.discard(self.apk_folder(task_id))
+        self.apk_folder(task_id).mkdir()
+        if self.store:
+            self.store.delete(self.runs, task_id, ['compile', 'test', 'fuzz'])
+
+        self._append_raw_log(task_id, raw_log)
+        if not changed:
             with open(self.compile_log(task_id),'w+') as file:
-                file.write(output)
-            if self.use_docker:    
-                return extract_error(output, ignore_path_str=str(self.docker_apk_folder(task_id)))
-            else:
-                return extract_error(output, ignore_path_str=str(self.apk_folder(task_id)))
+                file.write('Wrong Json Format\n')
+            return False
+        with open(self.json_file(task_id), 'w+', encoding='utf-8') as file:
+            json.dump(changed, file)
+        return True
+    
+    def _build_paths(self, task_id: int):
+        folder = self.docker_apk_folder(task_id) if self.use_docker else self.apk_folder(task_id)
+        return str(folder), str(folder / str(task_id))
+    
+    @traced('build_cache')
+    def _load_build(self, changed: dict[str, str], task_id: int):
+        """
+        Materialise a cached build of `changed` into the task folder.
+        Returns the cached console output, or None without a cache hit.
+        """
+        if not self.build_cache:
+            return None
+        output = self.build_cache.get(self.build_cache.key(changed), self.direct_apk_path(task_id),
+                                      *self._build_paths(task_id))
+        if output is not None:
+            print(f'AppForge: Reusing cached build for {task_id}...')
+        return output
+    
+    @traced('build_cache')
+    def _store_build(self, changed: dict[str, str], task_id: int):
+        """
+        Store a finished build (its compile log and APK) in the cache. A build without
+        an APK is only kept if it reported compiler errors, see `BuildCache.put`.
+        """
+        if not self.build_cache:
+            return
+        apk = self.direct_apk_path(task_id)
+        apk = apk if apk.exists() else None
+        output = self.compile_log(task_id).read_text()
+        self.build_cache.put(self.build_cache.key(changed), output, apk, *self._build_paths(task_id))
+    
+    def error_parser(self, task_id: int):
+        if self.use_docker:    
+            return ErrorParser(ignore_path_str=str(self.docker_apk_folder(task_id)))
         else:
-            output = 'Wrong Json Format\n'
-            with open(self.compile_log(task_id),'w+') as file:
-                file.write(output)
-            return output
+            return ErrorParser(ignore_path_str=str(self.apk_folder(task_id)))
+    
+    def _finish_compile(self, task_id: int, output: str):
+        return self.log_output(self.compile_log(task_id), output, self.error_parser(task_id))
+
+    def compile_diagnostics(self, task_id: int):
+        """
+        Structured errors of the latest compile of a task.
+
+        Args:
+            task_id (int): ID of the compiled task.
+
+        Returns:
+            list[Diagnostic]: Deduplicated compiler messages with file, line, column,
+                severity and Gradle task, see `extracts.extract_diagnostics`.
+                Empty if the build succeeded or has not run.
+        """
+        if not self.compile_log(task_id).exists():
+            return []
+        parser = self.error_parser(task_id)
+        with open(self.compile_log(task_id), 'r', encoding='utf-8', errors='replace') as file:
+            for chunk in iter(lambda: file.read(1 << 20), ''):
+                parser.feed(chunk)
+        parser.result()
+        return parser.diagnostics
+
+    @traced('compile')
+    def compile_json_based_on_template(self, changed: dict[str, str], task_id: int, raw_log: Optional[str] = None,
+                                       incremental: bool = False):
+        """
+        Apply changes from JSON on template and compile the application.
+        
+        Args:
+            changed (dict[str, str]): Dictionary containing changes to apply.
+            task_id (int): ID of the task to compile.
+            incremental (bool): Whether to update the project kept from the previous compile of this
+                task in place and let `build.py` rebuild it incrementally, e.g. between self-fix attempts. Falls back
+                to a full build if there is no such project, or for good if `build.py` failed over one without
+                reporting an error. Defaults to False.
+            
+        Returns:
+            str: Compilation errors if any, empty string if successful.
+        """
+        start = time.time()
+        # a retry starts over from a full build, with the raw log already kept
+        error, timed_out = self.with_retries('compile', task_id, lambda i: self._compile(
+            changed, task_id, raw_log if i == 0 else None, incremental and i == 0))
+        if timed_out:
+            error = self.log_timeout(self.compile_log(task_id), 'compile')
+        profile = self._keep_profile(task_id, start) if PROFILE_ENV in self.build_env else None
+        self._record_compile(task_id, error, start, timed_out, profile)
+        return error
+    
+    def _keep_profile(self, task_id: int, start: float):
+        """
+        Move the Gradle profile a build of this task wrote since `start` to `gradle_profile_path`.
+        """
+        path = self.project_folder(task_id) / PROFILE_FILE
+        profile = read_profile(path, since=start)
+        if profile is None:
+            return None
+        with open(self.gradle_profile_path(task_id), 'w', encoding='utf-8') as file:
+            json.dump(profile, file, indent=1)
+        path.unlink(missing_ok=True)
+        return profile
+    
+    def _compile(self, changed: dict[str, str], task_id: int, raw_log: Optional[str], incremental: bool):
+        reused = incremental and self.reuse_projects and self._prepare_incremental(changed, task_id, raw_log)
+        if not reused:
+            if not self._prepare_compile(changed, task_id, raw_log):
+                return 'Wrong Json Format\n'
+            output = self._load_build(changed, task_id)
+            if output is not None:
+                return self._finish_compile(task_id, output)
+            if self.baseline and self.reuse_projects:
+                self._seed_from_baseline(task_id)
+                reused = True
+        error, redo = self._check_build(task_id, self._build_project(changed, task_id), reused)
+        if redo:
+            return self._compile(changed, task_id, None, False)
+        self._store_build(changed, task_id)
+        return error
+    
+    def _check_build(self, task_id: int, error: Optional[str], reused: bool):
+        """
+        Catch a build that neither produced an APK nor reported a compiler error,
+        e.g. because `build.py` itself crashed, and report it as failed. If the build
+        ran over a populated project folder (`reused`: the project of an earlier
+        compile, or one seeded from the baseline), `build.py` may not generate
+        projects over existing ones: it is not asked to anymore, and the compile is
+        redone from scratch.
+        
+        Returns:
+            tuple: The compile error, and whether to redo the compile from scratch.
+        """
+        if error is not None or self.direct_apk_path(task_id).exists():
+            return error, False
+        if reused:
+            print(f'AppForge: Build over the existing project of {task_id} failed without errors, '
+                  'building projects from scratch from now on...')
+            self.reuse_projects = False
+            return None, True
+        message = 'Build failed without compiler errors!\n'
+        with open(self.compile_log(task_id), 'a', encoding='utf-8') as file:
+            file.write('\n' + message)
+        return message, False
         
     def compile_folder(self, folder: Path, task_id: int):
         """
@@ -222,8 +1174,48 @@ class AppForge:
         """
         changed = compare_folder(folder, self.template_folder / 'empty_activity')
         return self.compile_json_based_on_template(changed, task_id)
-            
+    
+    def stage_result_path(self, task_id: int, stage: str):
+        return self.result_path(task_id) if stage == 'test' else self.fuzz_result_path(task_id)
+    
+    def stage_log(self, task_id: int, stage: str):
+        return {'compile': self.compile_log, 'test': self.test_log, 'fuzz': self.fuzz_log}[stage](task_id)
+    
+    def _cached_result(self, task_id: int, stage: str):
+        """
+        The earlier result of stage 'test' or 'fuzz' of a task, or None.
+        """
+        if self.store:
+            return self.store.get(self.runs, task_id, stage)
+        path = self.stage_result_path(task_id, stage)
+        if path.exists():
+            with open(path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        return None
+    
+    @traced('save_result')
+    def _save_result(self, task_id: int, stage: str, result: dict, start: Optional[float] = None):
+        with open(self.stage_result_path(task_id, stage), 'w+', encoding='utf-8') as file:
+            json.dump(result, file)
+        if self.store:
+            self.store.put(self.runs, task_id, stage, result,
+                           duration=time.time() - start if start else None,
+                           artifact_hash=hash_file(self.direct_apk_path(task_id)),
+                           log_path=self.stage_log(task_id, stage))
+        return result
+    
+    def _record_compile(self, task_id: int, error: Optional[str], start: float, timed_out: bool = False,
+                        profile: Optional[dict] = None):
+        if self.store:
+            apk = self.direct_apk_path(task_id)
+            metrics = self.mark_timeout('compile', {'compile': int(apk.exists()), 'error': error}, timed_out)
+            if profile:
+                metrics['gradle_profile'] = profile
+            self.store.put(self.runs, task_id, 'compile', metrics,
+                           duration=time.time() - start, artifact_hash=hash_file(apk),
+                           log_path=self.compile_log(task_id))
    
+    @traced('test')
     def test(self, task_id: int):
         """
         Run test cases on the specified task.
@@ -237,43 +1229,73 @@ class AppForge:
                     if not successfully compiled, other value is set to be 0
                 - test (float): Test pass rate between 0.0 and 1.0
                 - all_pass (int): 1 if all tests passed, 0 otherwise
+                - timeout (int): 1 if every attempt ran into the test deadline, 0 otherwise;
+                    only if a test deadline is set
             
         """
         print(f'AppForge: Testing on {task_id}...')
         self.ensure_emulator()
         assert self.apk_folder(task_id).exists(), 'Target task not built!'
-        if self.result_path(task_id).exists():
-            with open(self.result_path(task_id), 'r', encoding='utf-8') as file:
-                return json.load(file)
-
+        cached = self._cached_result(task_id, 'test')
+        if cached is not None:
+            return cached
 
+        start = time.time()
+        timed_out = False
         if self.direct_apk_path(task_id).exists():
-            if self.use_docker:
-                cmd = f'''python3 evaluate_app.py     --apk-path="{str(self.docker_direct_apk_path(task_id))}"  \
-                --test no_fuzz  --package-name="{self.task_name(task_id)}"     --device-id="{self.emulator_id}"    --task="{self.task_name(task_id)}" '''
-                output = self.container.exec_run(cmd,workdir=str(self.docker_bench_folder)).output.decode()
-            else:
-                cmd = f'''python evaluate_app.py     --apk-path="{str(self.direct_apk_path(task_id))}"   \
-                --test no_fuzz  --package-name="{self.task_name(task_id)}"     --device-id="{self.emulator_id}"    --task="{self.task_name(task_id)}" '''
-                results = subprocess.run(cmd, capture_output=True,shell=True,text=True,cwd=str(self.bench_folder))
-                output,err = results.stdout, results.stderr 
+            result, timed_out = self.with_retries('test', task_id, lambda i: self.run_stage(
+                'test', self.evaluate_cmd(task_id, 'no_fuzz'), self.bench_path(), self.test_log(task_id), TestParser()))
+            if timed_out:
+                # a hanging test counts as failed, but the APK was built
+                self.log_timeout(self.test_log(task_id), 'test')
+                result = {'compile': 1, 'test': 0.0, 'all_pass': 0}
         else:
-            output = 'Compilation Failure!'
+            result = self.log_output(self.test_log(task_id), 'Compilation Failure!', TestParser())
+        return self._save_result(task_id, 'test', self.mark_timeout('test', result, timed_out), start)
+    
+    @traced('test_shard')
+    def test_shard(self, task_id: int, shard: int, sub_features: list[str]):
+        """
+        Run the test cases of some sub-features of a task, a part of `test`
+        that can run on another device at the same time. The result is not saved.
+        
+        Args:
+            task_id (int): ID of the built task.
+            shard (int): Index of the shard, naming its log `test.<shard>.log`.
+            sub_features (list[str]): 'N-M' IDs of the sub-features to test.
             
-        with open(self.test_log(task_id),'w+') as file:
-            file.write(output)
-
-        result = extract_test(output)
-        with open(self.result_path(task_id), 'w+', encoding='utf-8') as file:
-            json.dump(result, file)
-        return result
+        Returns:
+            tuple[TestParser, bool]: The parser holding the counts of passed and failed tests,
+                and whether every attempt ran into the test deadline.
+        """
+        print(f'AppForge: Testing on {task_id}, shard {shard} ({",".join(sub_features)})...')
+        self.ensure_emulator()
+        parsers = []
+        def attempt(i):
+            parsers.append(TestParser())
+            self.run_stage('test', self.evaluate_cmd(task_id, 'no_fuzz', sub_features), self.bench_path(),
+                           self.shard_log(task_id, shard), parsers[-1])
+        _, timed_out = self.with_retries('test', task_id, attempt)
+        if timed_out:
+            self.log_timeout(self.shard_log(task_id, shard), 'test')
+            # the shard's tests count as failed
+            parser = TestParser()
+            parser.bad = len(sub_features)
+            return parser, True
+        return parsers[-1], False
     
-    def fuzz(self, task_id: int):
+    @traced('fuzz')
+    def fuzz(self, task_id: int, budget: Optional[float] = None,
+             stop: Union[None, str, StopPolicy] = None):
         """
         Run 10-minute fuzzing on the specified task.
         
         Args:
             task_id (int): ID of the task to fuzz.
+            budget (Optional[float]): Seconds after which the session is terminated. Defaults to
+                None, which runs the full session.
+            stop (Union[None, str, StopPolicy]): Condition to terminate the session early on,
+                'first_crash', 'plateau' or a StopPolicy. Defaults to None.
             
         Returns:
             dict: Fuzzing results containing:
@@ -284,34 +1306,100 @@ class AppForge:
                 - java (int): 1 if Java crash detected, 0 otherwise
                 - anr (int): 1 if ANR detected, 0 otherwise
                 - failtostart (int): 1 if app failed to start, 0 otherwise
+                - fuzz_time (float): Seconds actually spent fuzzing
+                - early_stop (int): 1 if the session was terminated by budget or stop policy, 0 otherwise
+                - timeout (int): 1 if every attempt ran into the fuzz deadline, 0 otherwise;
+                    only if a fuzz deadline is set. The result is then that of the last attempt so far.
             
         """
         print(f'AppForge: Fuzzing on {task_id}...')
         self.ensure_emulator()
         assert self.apk_folder(task_id).exists(), 'Target task not built!'
-        if self.fuzz_result_path(task_id).exists():
-            with open(self.fuzz_result_path(task_id), 'r', encoding='utf-8') as file:
-                return json.load(file)
+        cached = self._cached_result(task_id, 'fuzz')
+        if cached is not None:
+            return cached
 
+        start = time.time()
+        watch, timed_out = None, False
         if self.direct_apk_path(task_id).exists():
-            if self.use_docker:
-                cmd = f'''python3 evaluate_app.py     --apk-path="{str(self.docker_direct_apk_path(task_id))}"  \
-                --test only_fuzz  --package-name="{self.task_name(task_id)}"     --device-id="{self.emulator_id}"    --task="{self.task_name(task_id)}" '''
-                output = self.container.exec_run(cmd,workdir=str(self.docker_bench_folder)).output.decode()
-            else:
-                cmd = f'''python evaluate_app.py     --apk-path="{str(self.direct_apk_path(task_id))}"   \
-                --test only_fuzz  --package-name="{self.task_name(task_id)}"     --device-id="{self.emulator_id}"    --task="{self.task_name(task_id)}" '''
-                results = subprocess.run(cmd, capture_output=True,shell=True,text=True,cwd=str(self.bench_folder))
-                output,err = results.stdout, results.stderr 
+            parsers = []
+            def attempt(i):
+                nonlocal watch
+                watch = stop_policy(stop, budget) if budget or stop else None
+                parsers.append(FuzzParser())
+                return self.run_stage('fuzz', self.evaluate_cmd(task_id, 'only_fuzz'), self.bench_path(),
+                                      self.fuzz_log(task_id), parsers[-1], watch)
+            result, timed_out = self.with_retries('fuzz', task_id, attempt)
+            if timed_out:
+                self.log_timeout(self.fuzz_log(task_id), 'fuzz')
+                result = parsers[-1].finish()
+                watch = None
         else:
-            output = 'Compilation Failure!'
+            result = self.log_output(self.fuzz_log(task_id), 'Compilation Failure!', FuzzParser())
+        self.mark_timeout('fuzz', result, timed_out)
+        result['fuzz_time'] = time.time() - start
+        result['early_stop'] = int(bool(watch and watch.reason))
+        if result['early_stop']:
+            print(f'AppForge: Fuzzing on {task_id} stopped early ({watch.reason})...')
+            self.stop_fuzzer()
+        return self._save_result(task_id, 'fuzz', result, start)
+    
+    @traced('evaluate')
+    def test_and_fuzz(self, task_id: int, budget: Optional[float] = None,
+                      stop: Union[None, str, StopPolicy] = None):
+        """
+        Run test cases and then fuzzing on the specified task in one `evaluate_app.py`
+        session, so the APK is installed and the app launched once instead of twice.
+        Both `test_result.json` and `fuzz_result.json` are written as by `test` and `fuzz`,
+        and the session output is copied to both `test.log` and `fuzz.log`.
+        
+        With a fuzzing budget or stop policy, a test or fuzz deadline, or if one of the two
+        results is already cached, this runs `test` and `fuzz` separately instead, as a budget
+        must not cut the tests and each deadline applies to its own stage. So it does if
+        `evaluate_app.py` has no `combined_test` mode, and fuzzes separately if the session
+        never printed `fuzz_marker`, as its fuzzing output cannot be told from its tests then.
+        
+        Args:
+            task_id (int): ID of the task to evaluate.
+            budget (Optional[float]): See `fuzz`.
+            stop (Union[None, str, StopPolicy]): See `fuzz`.
             
-        with open(self.fuzz_log(task_id),'w+') as file:
-            file.write(output)
-        result = extract_fuzz(output)
-        with open(self.fuzz_result_path(task_id), 'w+', encoding='utf-8') as file:
-            json.dump(result, file)
-        return result
+        Returns:
+            dict: Test results and fuzzing results in one dictionary, see `test` and `fuzz`.
+                'fuzz_time' is the length of the whole session.
+        """
+        if budget or stop or 'test' in self.deadlines or 'fuzz' in self.deadlines \
+                or self._cached_result(task_id, 'test') is not None \
+                or self._cached_result(task_id, 'fuzz') is not None or not self.supports_combined():
+            return {**self.test(task_id), **self.fuzz(task_id, budget=budget, stop=stop)}
+        print(f'AppForge: Testing and fuzzing on {task_id}...')
+        self.ensure_emulator()
+        assert self.apk_folder(task_id).exists(), 'Target task not built!'
+
+        start = time.time()
+        if self.direct_apk_path(task_id).exists():
+            parser = SessionParser(TestParser(), FuzzParser(), marker=self.fuzz_marker)
+            test_result, fuzz_result = self.run_logged(self.evaluate_cmd(task_id, self.combined_test), self.bench_path(),
+                                                       self.session_log(task_id), parser)
+            shutil.copyfile(self.session_log(task_id), self.test_log(task_id))
+            if parser.phase == 0:
+                print(f'AppForge: No fuzzing phase in the session of {task_id}, fuzzing separately...')
+                return {**self._save_result(task_id, 'test', test_result, start), **self.fuzz(task_id)}
+            shutil.copyfile(self.session_log(task_id), self.fuzz_log(task_id))
+        else:
+            test_result = self.log_output(self.test_log(task_id), 'Compilation Failure!', TestParser())
+            fuzz_result = self.log_output(self.fuzz_log(task_id), 'Compilation Failure!', FuzzParser())
+        fuzz_result['fuzz_time'] = time.time() - start
+        fuzz_result['early_stop'] = 0
+        self._save_result(task_id, 'test', test_result, start)
+        self._save_result(task_id, 'fuzz', fuzz_result, start)
+        return {**test_result, **fuzz_result}
+    
+    def stop_fuzzer(self):
+        """
+        Terminate the on-device monkey session left behind by a killed fuzzing run.
+        """
+        self.exec_cmd(['adb', '-s', self.emulator_id, 'shell', 'pkill', '-f', 'com.android.commands.monkey'])
     
     def evaluation_only_test(self, eval_list: Optional[list] = None):
         """
@@ -332,12 +1420,23 @@ class AppForge:
                 all_results[i] = {**self.test(i)}
         return sumup_json(all_results)
         
-    def evaluation(self, eval_list: Optional[list] = None):
+    def evaluate_task(self, task_id: int, fuzz_budget: Optional[float] = None,
+                      fuzz_stop: Union[None, str, StopPolicy] = None, combined: bool = False):
+        if combined:
+            return self.test_and_fuzz(task_id, budget=fuzz_budget, stop=fuzz_stop)
+        return {**self.test(task_id), **self.fuzz(task_id, budget=fuzz_budget, stop=fuzz_stop)}
+    
+    def evaluation(self, eval_list: Optional[list] = None, fuzz_budget: Optional[float] = None,
+                   fuzz_stop: Union[None, str, StopPolicy] = None, combined: bool = False):
         """
         Run test cases and fuzzing on specified tasks or all tasks.
         
         Args:
             eval_list (Optional[list]): List of task IDs to evaluate. If None, evaluates all tasks.
+            fuzz_budget (Optional[float]): Time budget of each fuzzing session, see `fuzz`.
+            fuzz_stop (Union[None, str, StopPolicy]): Early stop policy name of each fuzzing session, see `fuzz`.
+            combined (bool): Whether to test and fuzz each task in one session, see `test_and_fuzz`.
+                Defaults to False.
             
         Returns:
             dict: Aggregated test and fuzzing results for all evaluated tasks. 
@@ -346,10 +1445,10 @@ class AppForge:
         all_results = {}
         if eval_list:
             for i in eval_list:
-                all_results[i] = {**self.test(i), **self.fuzz(i)}
+                all_results[i] = self.evaluate_task(i, fuzz_budget, fuzz_stop, combined)
         else:
             for i in range(self.task_num):
-                all_results[i] = {**self.test(i), **self.fuzz(i)}
+                all_results[i] = self.evaluate_task(i, fuzz_budget, fuzz_stop, combined)
         ans = sumup_json(all_results)
         ans['crash_rate'] = 1 - ans['no_crash'] / ans['compile']
         return ans
@@ -0,0 +1,282 @@
+from typing import Any, Awaitable, Callable, Optional, Union
+from pathlib import Path
+import asyncio, codecs, os, subprocess, time
+
+from .appforge import AppForge
+from .gradle import PROFILE_ENV
+from .extracts import FuzzParser, TestParser
+from .policies import StageTimeout, StopPolicy, stop_policy
+
+
+class AsyncAppForge(AppForge):
+    """
+    AppForge with awaitable compile/test/fuzz, so that one event loop can overlap
+    e.g. compiling task N+1 with testing task N. Commands are spawned with
+    `asyncio.create_subprocess_exec` (through `docker exec` in Docker mode) instead
+    of blocking calls; folder layout and cached results are the same as AppForge.
+    Commands the backend or the evaluator server serves, the build worker and the
+    fast check run as in AppForge, on a worker thread.
+
+    Test and fuzz share one emulator, so they are serialized on a per-instance lock,
+    while compiles may run concurrently; their file work (resetting task folders,
+    copying APKs and baseline intermediates) runs on worker threads. Stage deadlines
+    and retries apply as in AppForge, and a cancelled command is killed with the
+    processes it started.
+
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.device_lock = asyncio.Lock()
+
+    def _served(self, cmd: list[str]):
+        return any(runner and runner.serves(cmd) for runner in [self.backend, self.evaluator])
+
+    async def _spawn(self, cmd: list[str], workdir: Optional[Path] = None, env: Optional[dict[str, str]] = None):
+        if self.use_docker:
+            argv = ['docker', 'exec']
+            if workdir:
+                argv += ['-w', str(workdir)]
+            for key, value in (env or {}).items():
+                argv += ['-e', f'{key}={value}']
+            proc = await asyncio.create_subprocess_exec(*argv, self.container.id, *cmd,
+                                                        stdout=asyncio.subprocess.PIPE,
+                                                        stderr=asyncio.subprocess.STDOUT)
+        else:
+            proc = await asyncio.create_subprocess_exec(*cmd, cwd=str(workdir) if workdir else None,
+                                                        stdout=asyncio.subprocess.PIPE,
+                                                        stderr=asyncio.subprocess.DEVNULL,
+                                                        start_new_session=True,
+                                                        env={**os.environ, **env} if env else None)
+        return proc
+
+    async def _kill_async(self, cmd: list[str], proc: asyncio.subprocess.Process):
+        """
+        Kill a spawned command with its children, and reap it.
+        """
+        if self.use_docker:
+            try:
+                proc.kill()
+            except ProcessLookupError:
+                pass
+            await asyncio.to_thread(self.kill_cmd, cmd)
+        else:
+            self.kill_cmd(cmd, proc.pid)
+        await proc.wait()
+
+    async def exec_cmd_async(self, cmd: list[str], workdir: Optional[Path] = None,
+                             env: Optional[dict[str, str]] = None, timeout: Optional[float] = None):
+        """
+        Awaitable counterpart of `AppForge.exec_cmd`. A command that is cancelled is
+        killed with its children.
+
+        Raises:
+            subprocess.TimeoutExpired: If `timeout` seconds passed; the command and its
+                children have been killed.
+        """
+        if self._served(cmd):
+            return await asyncio.to_thread(self.exec_cmd, cmd, workdir, timeout=timeout, env=env)
+        proc = await self._spawn(cmd, workdir, env)
+        try:
+            output, _ = await asyncio.wait_for(proc.communicate(), timeout)
+        except asyncio.TimeoutError:
+            await self._kill_async(cmd, proc)
+            raise subprocess.TimeoutExpired(cmd, timeout)
+        except asyncio.CancelledError:
+            await self._kill_async(cmd, proc)
+            raise
+        return output.decode()
+
+    async def exec_stream_async(self, cmd: list[str], workdir: Optional[Path], log_path: Path, parser,
+                                watch: Optional[StopPolicy] = None, env: Optional[dict[str, str]] = None):
+        """
+        Awaitable counterpart of `AppForge.exec_stream`.
+        """
+        if self._served(cmd):
+            return await asyncio.to_thread(self.exec_stream, cmd, workdir, log_path, parser, watch=watch, env=env)
+        proc = await self._spawn(cmd, workdir, env)
+        loop = asyncio.get_running_loop()
+        if self.use_docker:
+            kill = lambda: loop.run_in_executor(None, self.kill_cmd, cmd)
+        else:
+            kill = lambda: self.kill_cmd(cmd, proc.pid)
+        timers = []
+        if watch and watch.budget:
+            timers.append(loop.call_later(watch.budget, watch.stop, kill, 'budget'))
+        if watch and watch.deadline:
+            timers.append(loop.call_later(watch.deadline, watch.stop, kill, 'timeout'))
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        start = time.time()
+        try:
+            with open(log_path, 'w+') as file:
+                while True:
+                    chunk = await proc.stdout.read(65536)
+                    text = decoder.decode(chunk, final=not chunk)
+                    file.write(text)
+                    parser.feed(text)
+                    if not chunk:
+                        break
+                    if watch and watch.reason is None and watch.check(parser, time.time() - start):
+                        watch.stop(kill, watch.name)
+        except asyncio.CancelledError:
+            await self._kill_async(cmd, proc)
+            raise
+        finally:
+            for timer in timers:
+                timer.cancel()
+        await proc.wait()
+        return parser.result()
+
+    async def run_logged_async(self, cmd: list[str], workdir: Optional[Path], log_path: Path, parser,
+                               env: Optional[dict[str, str]] = None):
+        """
+        Awaitable counterpart of `AppForge.run_logged`.
+        """
+        if self.stream_logs:
+            return await self.exec_stream_async(cmd, workdir, log_path, parser, env=env)
+        return self.log_output(log_path, await self.exec_cmd_async(cmd, workdir, env=env), parser)
+
+    async def run_stage_async(self, stage: str, cmd: list[str], workdir: Optional[Path], log_path: Path, parser,
+                              watch: Optional[StopPolicy] = None):
+        """
+        Awaitable counterpart of `AppForge.run_stage`.
+        
+        Raises:
+            StageTimeout: If the command was killed on the stage's deadline.
+        """
+        deadline = self.deadlines.get(stage)
+        env = self.build_env if stage == 'compile' else None
+        if deadline is None and watch is None:
+            return await self.run_logged_async(cmd, workdir, log_path, parser, env=env)
+        watch = watch or StopPolicy()
+        watch.deadline = deadline
+        result = await self.exec_stream_async(cmd, workdir, log_path, parser, watch=watch, env=env)
+        if watch.reason == 'timeout':
+            raise StageTimeout(stage, deadline)
+        return result
+
+    async def with_retries_async(self, stage: str, task_id: int, attempt: Callable[[int], Awaitable[Any]]):
+        """
+        Awaitable counterpart of `AppForge.with_retries`.
+        """
+        for i in range(self.retries + 1):
+            try:
+                return await attempt(i), False
+            except StageTimeout as e:
+                print(f'AppForge: {stage.capitalize()} on {task_id} timed out after {e.seconds}s '
+                      f'(attempt {i + 1}/{self.retries + 1})...')
+                await asyncio.to_thread(self.recover, stage, task_id)
+        return None, True
+
+    async def ensure_emulator_async(self):
+        if self.emulator_id not in await self.exec_cmd_async(['adb', 'devices'], timeout=self.probe_timeout):
+            assert 0, 'Emulator offline!'
+
+    async def compile_async(self, changed: dict[str, str], task_id: int, raw_log: Optional[str] = None,
+                            incremental: bool = False):
+        """
+        Awaitable `compile_json_based_on_template`.
+        """
+        start = time.time()
+        error, timed_out = await self.with_retries_async('compile', task_id, lambda i: self._compile_async(
+            changed, task_id, raw_log if i == 0 else None, incremental and i == 0))
+        if timed_out:
+            error = self.log_timeout(self.compile_log(task_id), 'compile')
+        profile = self._keep_profile(task_id, start) if PROFILE_ENV in self.build_env else None
+        self._record_compile(task_id, error, start, timed_out, profile)
+        return error
+
+    async def _compile_async(self, changed: dict[str, str], task_id: int, raw_log: Optional[str], incremental: bool):
+        reused = incremental and self.reuse_projects and \
+            await asyncio.to_thread(self._prepare_incremental, changed, task_id, raw_log)
+        if not reused:
+            if not await asyncio.to_thread(self._prepare_compile, changed, task_id, raw_log):
+                return 'Wrong Json Format\n'
+            output = await asyncio.to_thread(self._load_build, changed, task_id)
+            if output is not None:
+                return self._finish_compile(task_id, output)
+            if self.baseline and self.reuse_projects:
+                await asyncio.to_thread(self._seed_from_baseline, task_id)
+                reused = True
+        error, redo = self._check_build(task_id, await self._build_project_async(changed, task_id), reused)
+        if redo:
+            return await self._compile_async(changed, task_id, None, False)
+        await asyncio.to_thread(self._store_build, changed, task_id)
+        return error
+
+    async def _build_project_async(self, changed: dict[str, str], task_id: int):
+        """
+        Awaitable counterpart of `AppForge._build_project`.
+        """
+        if self.checker and self.checker.covers(changed):
+            error = await asyncio.to_thread(self._fast_check, changed, task_id)
+            if error is not None:
+                return error
+        if self.build_worker:
+            return self._finish_compile(task_id, await asyncio.to_thread(self.run_build, task_id))
+        return await self.run_stage_async('compile', self.compile_cmd(task_id), self.bench_path() / 'compiler',
+                                          self.compile_log(task_id), self.error_parser(task_id))
+
+    async def test_async(self, task_id: int):
+        """
+        Awaitable `test`.
+        """
+        print(f'AppForge: Testing on {task_id}...')
+        assert self.apk_folder(task_id).exists(), 'Target task not built!'
+        cached = self._cached_result(task_id, 'test')
+        if cached is not None:
+            return cached
+
+        start = time.time()
+        timed_out = False
+        if self.direct_apk_path(task_id).exists():
+            async with self.device_lock:
+                await self.ensure_emulator_async()
+                result, timed_out = await self.with_retries_async('test', task_id, lambda i: self.run_stage_async(
+                    'test', self.evaluate_cmd(task_id, 'no_fuzz'), self.bench_path(), self.test_log(task_id),
+                    TestParser()))
+            if timed_out:
+                # a hanging test counts as failed, but the APK was built
+                self.log_timeout(self.test_log(task_id), 'test')
+                result = {'compile': 1, 'test': 0.0, 'all_pass': 0}
+        else:
+            result = self.log_output(self.test_log(task_id), 'Compilation Failure!', TestParser())
+        return self._save_result(task_id, 'test', self.mark_timeout('test', result, timed_out), start)
+
+    async def fuzz_async(self, task_id: int, budget: Optional[float] = None,
+                         stop: Union[None, str, StopPolicy] = None):
+        """
+        Awaitable `fuzz`.
+        """
+        print(f'AppForge: Fuzzing on {task_id}...')
+        assert self.apk_folder(task_id).exists(), 'Target task not built!'
+        cached = self._cached_result(task_id, 'fuzz')
+        if cached is not None:
+            return cached
+
+        start = time.time()
+        watch, timed_out = None, False
+        if self.direct_apk_path(task_id).exists():
+            parsers = []
+            def attempt(i):
+                nonlocal watch
+                watch = stop_policy(stop, budget) if budget or stop else None
+                parsers.append(FuzzParser())
+                return self.run_stage_async('fuzz', self.evaluate_cmd(task_id, 'only_fuzz'), self.bench_path(),
+                                            self.fuzz_log(task_id), parsers[-1], watch)
+            async with self.device_lock:
+                await self.ensure_emulator_async()
+                result, timed_out = await self.with_retries_async('fuzz', task_id, attempt)
+                if timed_out:
+                    self.log_timeout(self.fuzz_log(task_id), 'fuzz')
+                    result = parsers[-1].finish()
+                    watch = None
+                if watch and watch.reason:
+                    print(f'AppForge: Fuzzing on {task_id} stopped early ({watch.reason})...')
+                    await self.exec_cmd_async(['adb', '-s', self.emulator_id, 'shell', 'pkill', '-f',
+                                               'com.android.commands.monkey'])
+        else:
+            result = self.log_output(self.fuzz_log(task_id), 'Compilation Failure!', FuzzParser())
+        self.mark_timeout('fuzz', result, timed_out)
+        result['fuzz_time'] = time.time() - start
+        result['early_stop'] = int(bool(watch and watch.reason))
+        return self._save_result(task_id, 'fuzz', result, start)
@@ -0,0 +1,231 @@
+"""
+Backends run the device-side commands of an AppForge in place of the emulator
+and the Android build.
+
+A backend has the interface of `EvaluatorServer`: `serves(cmd)` tells whether
+it runs a command line, `submit` starts one and returns a pid and the chunks of
+its output, `run` runs one to completion and `kill` stops one. AppForge routes
+every command a backend serves through it, before the build worker and the
+evaluator server are considered.
+
+`FakeBackend` answers the build (`build.py` and `gradlew`), `evaluate_app.py`
+and `adb` commands with deterministic synthetic or recorded output, so the
+Python side of AppForge can be run and measured without a device or SDK.
+"""
+from typing import Optional
+from pathlib import Path
+from abc import ABC, abstractmethod
+import hashlib, itertools, json, threading, time
+
+from .extracts import FUZZ_PHASE_MARKER
+
+
+class Backend(ABC):
+    """
+    Base class of backends. Serves no command unless a subclass says so.
+
+    """
+    def serves(self, cmd: list[str]):
+        return False
+
+    @abstractmethod
+    def submit(self, cmd: list[str], workdir: Optional[Path]):
+        """
+        Start a command line.
+
+        Returns:
+            Optional[tuple[int, Iterator[bytes]]]: An ID to `kill` the command with and the
+                chunks of its output, or None if the command cannot be run here.
+        """
+
+    def run(self, cmd: list[str], workdir: Optional[Path]):
+        """
+        Returns:
+            Optional[str]: Console output of the command, or None if it cannot be run here.
+        """
+        job = self.submit(cmd, workdir)
+        if job is None:
+            return None
+        return b''.join(job[1]).decode('utf-8', errors='replace')
+
+    def kill(self, pid: int):
+        pass
+
+    def close(self):
+        pass
+
+
+def fraction(*keys):
+    """
+    A number in [0, 1) that only depends on `keys`.
+    """
+    digest = hashlib.blake2b('\0'.join(map(str, keys)).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') / 2**64
+
+
+class FakeBackend(Backend):
+    """
+    Deterministic stand-in for the emulator and the Android build.
+
+    Outcomes only depend on the generated files and the task: a build fails for
+    a `fail_rate` share of the `changed` maps, each test passes with probability
+    `pass_rate` and a fuzzing session crashes with probability `crash_rate`.
+    Builds write the generated files, `project_files` stub files and an APK of
+    `apk_bytes` into the project folder, like `build.py`. Every output is padded
+    with `log_lines` lines of filler, or replays `logs` recorded from real runs,
+    and takes `latency` seconds before it starts.
+
+    """
+    filler = '> Task :app:processDebugResources UP-TO-DATE (filler line of the fake backend)\n'
+
+    def __init__(self, devices: tuple[str, ...] = ('emulator-5554',), log_lines: int = 100, latency: float = 0.0,
+                 fail_rate: float = 0.25, pass_rate: float = 0.75, crash_rate: float = 0.2, tests: int = 4,
+                 fuzz_cycles: int = 10, project_files: int = 20, apk_bytes: int = 64 * 1024,
+                 logs: Optional[dict[str, str]] = None, chunk_bytes: int = 65536):
+        """
+        Args:
+            devices (tuple[str, ...]): Emulator IDs `adb devices` lists as online.
+            log_lines (int): Lines of filler in every output. Defaults to 100.
+            latency (float): Seconds every command takes before its output. Defaults to 0.
+            fail_rate (float): Share of builds that fail. Defaults to 0.25.
+            pass_rate (float): Share of tests that pass. Defaults to 0.75.
+            crash_rate (float): Share of fuzzing sessions that find a crash. Defaults to 0.2.
+            tests (int): Tests of a task unless `--sub-features` names them. Defaults to 4.
+            fuzz_cycles (int): App starts of a fuzzing session. Defaults to 10.
+            project_files (int): Stub files a build writes besides the generated ones. Defaults to 20.
+            apk_bytes (int): Size of the built APK. Defaults to 64KB.
+            logs (Optional[dict[str, str]]): Recorded outputs replayed instead of the synthetic
+                ones, keyed 'build', 'build_failed', 'test' or 'fuzz'. See `recorded`.
+            chunk_bytes (int): Size of the output chunks. Defaults to 64KB.
+        """
+        self.devices = devices
+        self.log_lines = log_lines
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.pass_rate = pass_rate
+        self.crash_rate = crash_rate
+        self.tests = tests
+        self.fuzz_cycles = fuzz_cycles
+        self.project_files = project_files
+        self.apk_bytes = apk_bytes
+        self.logs = logs or {}
+        self.chunk_bytes = chunk_bytes
+        self.ids = itertools.count(1)
+        self.killed = set()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def recorded(cls, task_folder: Path, failed_task_folder: Optional[Path] = None, **kwargs):
+        """
+        A fake backend replaying the logs of a task folder of a real run: its
+        `compile.log` for builds, `test.log` and `fuzz.log` for evaluations, and the
+        `compile.log` of `failed_task_folder` for failed builds.
+        """
+        logs = {}
+        for key, path in [('build', task_folder / 'compile.log'), ('test', task_folder / 'test.log'),
+                          ('fuzz', task_folder / 'fuzz.log')] + \
+                         ([('build_failed', failed_task_folder / 'compile.log')] if failed_task_folder else []):
+            if path.exists():
+                logs[key] = path.read_text(encoding='utf-8', errors='replace')
+        return cls(logs=logs, **kwargs)
+
+    def serves(self, cmd: list[str]):
+        return bool(cmd) and (cmd[0] == 'adb' or Path(cmd[0]).name == 'gradlew' or
+                              (len(cmd) > 1 and Path(cmd[1]).name in ('build.py', 'evaluate_app.py')))
+
+    def submit(self, cmd: list[str], workdir: Optional[Path]):
+        pid = next(self.ids)
+        return pid, self.chunks(pid, cmd, workdir)
+
+    def chunks(self, pid: int, cmd: list[str], workdir: Optional[Path]):
+        if self.latency:
+            time.sleep(self.latency)
+        text = self.output(cmd, workdir)
+        data = text.encode('utf-8')
+        for i in range(0, len(data), self.chunk_bytes):
+            with self.lock:
+                if pid in self.killed:
+                    self.killed.discard(pid)
+                    return
+            yield data[i:i + self.chunk_bytes]
+
+    def kill(self, pid: int):
+        with self.lock:
+            self.killed.add(pid)
+
+    def output(self, cmd: list[str], workdir: Optional[Path]):
+        if cmd[0] == 'adb':
+            return self.adb(cmd)
+        args = dict(arg[2:].split('=', 1) for arg in cmd if arg.startswith('--') and '=' in arg)
+        if Path(cmd[0]).name == 'gradlew':
+            if '--stop' in cmd:
+                return 'Stopping Daemon(s)\n1 Daemon stopped\n'
+            project = Path(workdir)
+            changed = {str(path.relative_to(project)): path.read_text(encoding='utf-8', errors='replace')
+                       for path in sorted(project.rglob('*.java'))}
+            return self.build(project, changed)
+        if Path(cmd[1]).name == 'build.py':
+            with open(args['generated-files'], 'r', encoding='utf-8') as file:
+                changed = json.load(file)
+            return self.build(Path(args['output']) / args['project-name'], changed)
+        if '--help' in cmd:
+            return self.usage
+        mode = cmd[cmd.index('--test') + 1] if '--test' in cmd else 'all'
+        output = ''
+        if mode != 'only_fuzz':
+            output += self.test(args['apk-path'], args.get('sub-features'))
+        if mode == 'all':
+            output += FUZZ_PHASE_MARKER + '\n'
+        if mode != 'no_fuzz':
+            output += self.fuzz(args['apk-path'])
+        return output
+
+    usage = ('usage: evaluate_app.py --apk-path APK_PATH [--test {all,no_fuzz,only_fuzz}] '
+             '[--sub-features SUB_FEATURES]\n')
+
+    def adb(self, cmd: list[str]):
+        if cmd[1:] == ['devices']:
+            return 'List of devices attached\n' + ''.join(f'{device}\tdevice\n' for device in self.devices)
+        if 'getprop' in cmd:
+            return '1\n'
+        if 'pm' in cmd:
+            return 'package:/system/framework/framework-res.apk\n'
+        return ''
+
+    def pad(self, key: str, synthetic: str):
+        return self.filler * self.log_lines + self.logs.get(key, synthetic)
+
+    def build(self, project: Path, changed: dict[str, str]):
+        key = json.dumps(changed, sort_keys=True)
+        project.mkdir(parents=True, exist_ok=True)
+        for rel, text in changed.items():
+            (project / rel).parent.mkdir(parents=True, exist_ok=True)
+            (project / rel).write_text(text, encoding='utf-8')
+        stubs = project / 'app' / 'build' / 'intermediates'
+        stubs.mkdir(parents=True, exist_ok=True)
+        for i in range(self.project_files):
+            (stubs / f'stub{i}.txt').write_text(f'{i}\n', encoding='utf-8')
+        (project / 'gradlew').write_text('#!/bin/sh\n', encoding='utf-8')
+        if fraction('build', key) < self.fail_rate:
+            source = project / 'app' / 'src' / 'main' / 'java' / 'MainActivity.java'
+            return self.pad('build_failed', f'> Task :app:compileDebugJavaWithJavac FAILED\n编译失败\n'
+                                            f'{source}:3: error: cannot find symbol\n'
+                                            f'    symbol:   class Foo\n'
+                                            f"Execution failed for task ':app:compileDebugJavaWithJavac'.\n"
+                                            f'BUILD FAILED in 1s\n')
+        apk = project / 'app' / 'build' / 'outputs' / 'apk' / 'debug' / 'app-debug.apk'
+        apk.parent.mkdir(parents=True, exist_ok=True)
+        apk.write_bytes(hashlib.blake2b(key.encode('utf-8')).digest() * (self.apk_bytes // 64 + 1))
+        return self.pad('build', '> Task :app:assembleDebug\nBUILD SUCCESSFUL in 1s\n')
+
+    def test(self, apk: str, sub_features: Optional[str]):
+        ids = sub_features.split(',') if sub_features else [f'{i + 1}-1' for i in range(self.tests)]
+        lines = ''.join(f"sub-feature {id}: {{'success': {fraction('test', apk, id) < self.pass_rate}}}\n"
+                        for id in ids)
+        return self.pad('test', lines)
+
+    def fuzz(self, apk: str):
+        crash_at = int(fraction('fuzz', apk) * self.fuzz_cycles / self.crash_rate) if self.crash_rate else None
+        lines = ''.join('Starting app...\n' + ('Java crash detected!\n' if i == crash_at else '')
+                        for i in range(self.fuzz_cycles))
+        return self.pad('fuzz', lines)
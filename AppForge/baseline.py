@@ -0,0 +1,75 @@
+"""
+Prebuilt template baseline.
+
+The template is built once, and the project with all its build intermediates
+(merged resources, dexed dependencies, R classes and Gradle's own state) is kept
+under base_folder/.baseline. Task projects are still generated and built by
+`build.py`, in a project folder seeded with a copy-on-write clone of the
+baseline's intermediates. Gradle checks the inputs of every task as usual, so
+it only recompiles and redexes what the generated project changes.
+"""
+from pathlib import Path
+import hashlib, json, os
+
+from .utils import clone_folder, file_lock
+
+
+class TemplateBaseline:
+    """
+    Built template project, shared by the AppForge instances of a base folder.
+    It is never built in place, only cloned. A baseline belongs to one template
+    and SDK identity; baselines of other identities are kept beside it.
+
+    """
+    PROJECT = 'template'
+    # relative to the project
+    INTERMEDIATES = ('.gradle', 'build', 'app/build')
+
+    def __init__(self, folder: Path, identity: str):
+        """
+        Args:
+            folder (Path): Directory holding the baseline.
+            identity (str): Template and SDK identity the baseline is built for.
+        """
+        self.root = folder
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.identity = identity
+        self.folder = folder / hashlib.sha256(identity.encode('utf-8')).hexdigest()[:16]
+        self.marker = self.folder / 'baseline.json'
+
+    @property
+    def project(self):
+        return self.folder / self.PROJECT
+
+    def lock(self):
+        """
+        The build lock of the baseline, held across processes.
+        """
+        return file_lock(self.root / 'baseline.lock')
+
+    @property
+    def changed(self):
+        """
+        The `changed` map the baseline was built from, or None if it is not built.
+        """
+        try:
+            with open(self.marker, 'r', encoding='utf-8') as file:
+                ans = json.load(file)
+        except (OSError, ValueError):
+            return None
+        return ans['changed'] if ans.get('identity') == self.identity else None
+
+    def mark_built(self, changed: dict[str, str]):
+        tmp = self.marker.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp, 'w', encoding='utf-8') as file:
+            json.dump({'identity': self.identity, 'changed': changed}, file)
+        os.replace(tmp, self.marker)
+
+    def seed(self, project: Path):
+        """
+        Clone the build intermediates of the baseline into `project`, which has none.
+        """
+        for rel in self.INTERMEDIATES:
+            if (self.project / rel).exists():
+                (project / rel).parent.mkdir(parents=True, exist_ok=True)
+                clone_folder(self.project / rel, project / rel)
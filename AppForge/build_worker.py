@@ -0,0 +1,181 @@
+"""
+Long-lived build worker.
+
+Run as a script (`python3 -u build_worker.py`, or with its source passed through
+`python3 -u -c` inside the container), it reads one JSON job per line from stdin,
+runs `build.py` in-process with the job's argv and cwd, and answers with one JSON
+line holding the console output of the build. Keeping the interpreter alive saves
+the interpreter start and build.py's imports on every compile. Gradle keeps its own
+daemon warm with or without the worker, since it is on by default and reused by every
+build with the same Gradle home and JVM options.
+
+A worker runs one build at a time. Each AppForge has its own, so devices do not wait
+for each other, and a compile that finds its worker busy runs as a plain process.
+
+`BuildWorker` is the client side used by AppForge.
+"""
+from typing import Optional
+from pathlib import Path
+import json, os, signal, subprocess, sys, threading
+
+
+class BuildWorker:
+    """
+    Client of a build worker process, either local or inside a Docker container.
+
+    """
+    def __init__(self, container_id: Optional[str] = None, python: str = 'python'):
+        """
+        Args:
+            container_id (Optional[str]): Container to run the worker in. Runs locally if None.
+            python (str): Python interpreter to run the worker with.
+        """
+        self.container_id = container_id
+        self.python = python
+        self.lock = threading.Lock()
+        self.proc = None
+        self.pid = None
+        self.expired = False
+
+    def start(self):
+        source = Path(__file__).read_text(encoding='utf-8')
+        cmd = [self.python, '-u', '-c', source]
+        if self.container_id:
+            cmd = ['docker', 'exec', '-i', self.container_id] + cmd
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     stderr=subprocess.DEVNULL, text=True, encoding='utf-8')
+        # The worker first tells its pid, which leads the process group of its builds
+        line = self.proc.stdout.readline()
+        self.pid = json.loads(line)['pid'] if line else None
+
+    def alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def busy(self):
+        return self.lock.locked()
+
+    def run(self, cmd: list[str], workdir: Path, merge_stderr: bool = False, timeout: Optional[float] = None,
+            env: Optional[dict[str, str]] = None):
+        """
+        Run a `build.py` command line on the worker.
+
+        Args:
+            cmd (list[str]): Command line, starting with the interpreter and `build.py`.
+            workdir (Path): Directory to run the build in.
+            merge_stderr (bool): Whether stderr is part of the returned output.
+            timeout (Optional[float]): Seconds after which the worker and its build are killed.
+            env (Optional[dict[str, str]]): Variables added to the environment of the build.
+
+        Returns:
+            Optional[str]: Console output of the build, or None if the worker died.
+
+        Raises:
+            TimeoutError: If the build was killed on `timeout`. The next job starts a new worker.
+        """
+        with self.lock:
+            if not self.alive():
+                self.start()
+            self.expired = False
+            timer = threading.Timer(timeout, self.kill) if timeout else None
+            if timer:
+                timer.start()
+            try:
+                self.proc.stdin.write(json.dumps({'argv': cmd[1:], 'cwd': str(workdir),
+                                                  'merge_stderr': merge_stderr, 'env': env or {}}) + '\n')
+                self.proc.stdin.flush()
+                line = self.proc.stdout.readline()
+            except (BrokenPipeError, OSError):
+                line = ''
+            finally:
+                if timer:
+                    timer.cancel()
+            if not line:
+                self.close()
+                if self.expired:
+                    raise TimeoutError(f'Build timed out after {timeout}s')
+                return None
+            return json.loads(line)['output']
+
+    def kill(self):
+        """
+        Kill the worker with the build it is running.
+        """
+        self.expired = True
+        if self.pid is not None:
+            if self.container_id:
+                subprocess.run(['docker', 'exec', self.container_id, 'kill', '-KILL', '--', f'-{self.pid}'],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            else:
+                try:
+                    os.killpg(self.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+        if self.proc is not None:
+            self.proc.kill()
+
+    def close(self):
+        if self.proc is not None:
+            try:
+                self.proc.stdin.close()
+                self.proc.wait(timeout=10)
+            except Exception:
+                self.proc.kill()
+            self.proc = None
+            self.pid = None
+
+
+def serve():
+    import runpy, tempfile, traceback
+    # Jobs and answers use private copies of stdin/stdout, so that the build and the
+    # processes it spawns only ever see /dev/null and the job log on fd 0/1/2
+    jobs = os.fdopen(os.dup(0), 'r', encoding='utf-8')
+    reply = os.fdopen(os.dup(1), 'w', encoding='utf-8')
+    # Lead a process group of our own, so that a build can be killed with all it started
+    try:
+        os.setpgid(0, 0)
+    except OSError:
+        pass
+    reply.write(json.dumps({'pid': os.getpid()}) + '\n')
+    reply.flush()
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.close(devnull)
+    for line in jobs:
+        if not line.strip():
+            continue
+        job = json.loads(line)
+        saved = [os.dup(1), os.dup(2)]
+        with tempfile.TemporaryFile() as log:
+            sys.stdout.flush(); sys.stderr.flush()
+            os.dup2(log.fileno(), 1)
+            if job['merge_stderr']:
+                os.dup2(log.fileno(), 2)
+            cwd, environ = os.getcwd(), dict(os.environ)
+            os.environ.update(job.get('env', {}))
+            sys.path.insert(0, job['cwd'])
+            try:
+                os.chdir(job['cwd'])
+                sys.argv = job['argv']
+                runpy.run_path(job['argv'][0], run_name='__main__')
+            except SystemExit:
+                pass
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                sys.stdout.flush(); sys.stderr.flush()
+                sys.path.remove(job['cwd'])
+                os.chdir(cwd)
+                os.environ.clear()
+                os.environ.update(environ)
+                os.dup2(saved[0], 1)
+                os.dup2(saved[1], 2)
+                for fd in saved:
+                    os.close(fd)
+            log.seek(0)
+            output = log.read().decode('utf-8', errors='replace')
+        reply.write(json.dumps({'output': output}) + '\n')
+        reply.flush()
+
+
+if __name__ == '__main__':
+    serve()
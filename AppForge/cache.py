@@ -0,0 +1,194 @@
+from typing import Optional
+from pathlib import Path
+import hashlib, json, os, shutil, threading, uuid
+
+from .extracts import extract_diagnostics
+
+
+def hash_folder(folder: Path):
+    """
+    Hash the relative paths and contents of every file under a folder.
+
+    Args:
+        folder (Path): The folder to hash.
+
+    Returns:
+        str: Hex digest identifying the folder content.
+    """
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        for name in sorted(files):
+            p = Path(root) / name
+            digest.update(str(p.relative_to(folder)).encode('utf-8') + b'\0')
+            digest.update(p.read_bytes() + b'\0')
+    return digest.hexdigest()
+
+
+def sdk_identity(sdk_path: Path):
+    """
+    Identify an Android SDK by the packages builds use: the revision of every
+    build-tools and platform package, from its `source.properties`.
+
+    Args:
+        sdk_path (Path): Root of the SDK.
+
+    Returns:
+        str: The sorted 'kind/package=revision' entries, joined by ','.
+    """
+    entries = []
+    for kind in ['build-tools', 'platforms']:
+        folder = Path(sdk_path) / kind
+        for package in sorted(folder.iterdir()) if folder.is_dir() else []:
+            revision = package.name
+            try:
+                with open(package / 'source.properties', 'r', encoding='utf-8') as file:
+                    for line in file:
+                        if line.startswith('Pkg.Revision='):
+                            revision = line.split('=', 1)[1].strip()
+            except OSError:
+                pass
+            entries.append(f'{kind}/{package.name}={revision}')
+    return ','.join(entries)
+
+
+class BuildCache:
+    """
+    Content-addressed cache of compile outcomes.
+
+    An entry is keyed by the hash of the sorted `changed` map together with the
+    template and SDK identity, and holds the console output of the build and the
+    resulting `app-debug.apk` if there was one. Task-specific paths in the output
+    are replaced by placeholders, so one entry serves any task. Failed builds are
+    only cached if they report compiler errors, so that an infrastructure failure
+    (e.g. a dependency download) does not stick to its key. The cache is bounded
+    in bytes and evicts least recently used entries first; entries are published
+    and evicted with an atomic rename so several AppForge instances can share it.
+
+    """
+    FOLDER = '<task_folder>'
+    PROJECT = '<project_folder>'
+
+    def __init__(self, folder: Path, identity: str, max_bytes: int = 2 * 1024**3):
+        """
+        Args:
+            folder (Path): Directory holding the cache entries.
+            identity (str): Template and SDK identity mixed into every key.
+            max_bytes (int): Size bound of the cache. Defaults to 2GB.
+        """
+        self.folder = folder
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.identity = identity
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def key(self, changed: dict[str, str]):
+        payload = json.dumps([self.identity, sorted(changed.items())], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str, apk_path: Path, folder: str, project: str):
+        """
+        Materialise a cached build.
+
+        Args:
+            key (str): Cache key from `key()`.
+            apk_path (Path): Where to put the cached APK, if the entry has one.
+            folder (str): Task folder path to substitute back into the output.
+            project (str): Project folder path to substitute back into the output.
+
+        Returns:
+            Optional[str]: Console output of the cached build, or None on a miss.
+        """
+        entry = self.folder / key
+        log, apk = entry / 'compile.log', entry / 'app-debug.apk'
+        # an entry keeps its files until it is renamed away by `evict`, so an APK
+        # that is missing here was never there, and a file that goes missing later is a miss
+        has_apk = apk.exists()
+        try:
+            output = log.read_text(encoding='utf-8')
+            if has_apk:
+                apk_path.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copyfile(apk, apk_path)
+            os.utime(log)
+        except FileNotFoundError:
+            if has_apk:
+                apk_path.unlink(missing_ok=True)
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return output.replace(self.PROJECT, project).replace(self.FOLDER, folder)
+
+    def put(self, key: str, output: str, apk_path: Optional[Path], folder: str, project: str):
+        """
+        Store the outcome of a build and evict old entries beyond the size bound.
+        A build without an APK is not stored unless its output reports compiler errors.
+
+        Args:
+            key (str): Cache key from `key()`.
+            output (str): Console output of the build.
+            apk_path (Optional[Path]): The built APK, or None if the build failed.
+            folder (str): Task folder path to replace in the output.
+            project (str): Project folder path to replace in the output.
+        """
+        if (self.folder / key).exists():
+            return
+        if apk_path is None and not any(d.severity == 'error' for d in extract_diagnostics(output)):
+            return
+        tmp = self.folder / f'.{key}.{uuid.uuid4().hex}'
+        tmp.mkdir()
+        if apk_path is not None:
+            shutil.copyfile(apk_path, tmp / 'app-debug.apk')
+        (tmp / 'compile.log').write_text(output.replace(project, self.PROJECT).replace(folder, self.FOLDER),
+                                         encoding='utf-8')
+        try:
+            tmp.rename(self.folder / key)
+        except OSError:
+            # Another instance stored the same build first
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+
+    def entries(self):
+        """
+        Returns:
+            list[tuple[float, int, Path]]: (last use, size in bytes, path) of every entry.
+        """
+        ans = []
+        for entry in self.folder.iterdir():
+            if entry.name.startswith('.'):
+                continue
+            try:
+                files = list(entry.iterdir())
+                ans.append(((entry / 'compile.log').stat().st_mtime,
+                            sum(f.stat().st_size for f in files), entry))
+            except OSError:
+                continue
+        return ans
+
+    def evict(self):
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            # readers of the entry see all of it or none of it
+            doomed = self.folder / f'.{entry.name}.{uuid.uuid4().hex}'
+            try:
+                entry.rename(doomed)
+            except OSError:
+                # Another instance evicted it first
+                continue
+            shutil.rmtree(doomed, ignore_errors=True)
+            total -= size
+
+    def stats(self):
+        entries = self.entries()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+        }
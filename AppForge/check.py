@@ -0,0 +1,116 @@
+"""
+Fast check of generated files ahead of the Gradle build.
+
+`aapt2` compiles the project's resources and links them with the resources of
+the template baseline, which also generates the R class, and `javac` compiles
+the sources against the classpath the baseline was compiled with. Failures are
+printed like the Gradle build prints them (javac messages as they are, aapt2
+ones as 'ERROR:<file>:<line>: AAPT: error: ...'), between the markers of
+`build.py`, so that `ErrorParser` reads them unchanged.
+
+The check only sees the template's dependencies and build configuration, so it
+is skipped for generated files that change them (see `FastCheck.covers`). Even
+then it is a prediction: a project passing it may still fail the build, and a
+failure it reports is one the build would most likely, not certainly, report.
+"""
+from pathlib import Path
+import os, zipfile
+
+
+# Arguments: aapt2, javac, android.jar, classpath, resources of the baseline
+CHECK_SCRIPT = r'''aapt2=$1 javac=$2 android_jar=$3 classpath=$4 resources=$5
+t=$(mktemp -d) && trap 'rm -rf "$t"' EXIT
+fail() {
+    echo "编译失败"
+    cat "$t/out"
+    echo "Execution failed for task '$1'."
+    echo "BUILD FAILED"
+    exit 0
+}
+aapt() {
+    sed -E 's/^([^ ]+:[0-9]+(:[0-9]+)?): (error|warning): /ERROR:\1: AAPT: \3: /' "$t/out" > "$t/aapt"
+    mv "$t/aapt" "$t/out"
+}
+"$aapt2" compile --dir "$PWD/app/src/main/res" -o "$t/res.zip" > "$t/out" 2>&1 \
+    || { aapt; fail :app:mergeDebugResources; }
+"$aapt2" link -I "$android_jar" --manifest "$PWD/app/src/main/AndroidManifest.xml" --auto-add-overlay \
+    --java "$t/gen" -o "$t/app.apk" "$resources" -R "$t/res.zip" > "$t/out" 2>&1 \
+    || { aapt; fail :app:processDebugResources; }
+find "$PWD/app/src/main/java" "$t/gen" -name '*.java' > "$t/sources" 2>/dev/null
+"$javac" -J-XX:TieredStopAtLevel=1 -J-XX:+UseSerialGC -encoding UTF-8 -source 8 -target 8 -Xlint:-options \
+    -nowarn -proc:none -implicit:none -bootclasspath "$android_jar" -classpath "$classpath" \
+    -d "$t/classes" @"$t/sources" > "$t/out" 2>&1 \
+    || fail :app:compileDebugJavaWithJavac
+echo "Fast check passed"
+'''
+
+# Arguments: Android SDK, then the files the check needs. Prints the missing
+# files, then the newest aapt2 of the SDK and javac.
+TOOLS_SCRIPT = r'''sdk=$1
+shift
+for file in "$@"; do
+    test -e "$file" || echo "missing $file"
+done
+ls -d "$sdk"/build-tools/*/aapt2 2>/dev/null | sort -V | tail -n 1
+if [ -n "$JAVA_HOME" ] && [ -x "$JAVA_HOME/bin/javac" ]; then echo "$JAVA_HOME/bin/javac"; else command -v javac; fi
+'''
+
+
+def pack_resources(project: Path, path: Path):
+    """
+    Pack the compiled resources a build of `project` merged (its own and those of
+    its dependencies) into the archive `path`, which `aapt2 link` takes as input.
+
+    Returns:
+        bool: Whether there were any.
+    """
+    flats = sorted((project / 'app' / 'build' / 'intermediates' / 'merged_res' / 'debug').rglob('*.flat'))
+    if not flats:
+        return False
+    tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+    with zipfile.ZipFile(tmp, 'w', zipfile.ZIP_STORED) as archive:
+        for flat in flats:
+            archive.write(flat, flat.name)
+    os.replace(tmp, path)
+    return True
+
+
+class FastCheck:
+    """
+    Command line of the fast check, with the paths it uses in the build environment.
+
+    """
+    def __init__(self, aapt2: str, javac: str, android_jar: str, classpath: list[str], resources: str):
+        """
+        Args:
+            aapt2 (str): The aapt2 binary.
+            javac (str): The javac binary.
+            android_jar (str): android.jar of the compile SDK.
+            classpath (list[str]): The javac classpath of the template baseline.
+            resources (str): Archive of the compiled resources of the template baseline, see `pack_resources`.
+        """
+        self.aapt2 = aapt2
+        self.javac = javac
+        self.android_jar = android_jar
+        self.classpath = classpath
+        self.resources = resources
+
+    @staticmethod
+    def covers(changed: dict[str, str]):
+        """
+        Whether the check applies to these generated files, i.e. none of them is a
+        Gradle build file, which could add dependencies or change the build setup.
+        """
+        for rel in changed:
+            path = Path(rel)
+            if path.name.endswith(('.gradle', '.gradle.kts')) or path.suffix == '.properties' \
+                    or path.parts[:1] == ('gradle',):
+                return False
+        return True
+
+    def cmd(self):
+        """
+        Shell command checking the project in the working directory.
+        """
+        return ['sh', '-c', CHECK_SCRIPT, 'fast-check', self.aapt2, self.javac, self.android_jar,
+                ':'.join(self.classpath), self.resources]
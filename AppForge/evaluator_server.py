@@ -0,0 +1,346 @@
+"""
+Long-lived evaluator server.
+
+Run as a script (`python3 -u evaluator_server.py --socket <path> ...`, or with its
+source passed through `python3 -u -c` inside the container), it imports
+`evaluate_app.py` once, connects uiautomator2 to the device once, and then serves
+evaluation jobs on a Unix socket. A job is one JSON line with the arguments and cwd
+of an `evaluate_app.py` run; the server only ever runs the script it preloaded. The server forks a child that already has every module
+loaded, answers with one JSON line holding the child's pid, and the child's output
+then streams over the same connection until the job ends. The server forks before
+anything may have started a thread and only connects to the device in the child;
+it keeps accepting jobs while children run and reaps them as they exit.
+
+The socket lives in a folder only its owner can enter, and only its owner may use
+it. A server in a container runs as root, so the client passes its uid along, and
+the server hands the socket to that user.
+
+`EvaluatorServer` is the client side used by AppForge.
+"""
+from typing import Optional
+from pathlib import Path
+import json, os, signal, socket, stat, struct, subprocess, sys, threading, time
+
+
+class EvaluatorServer:
+    """
+    Client of an evaluator server process, either local or inside a Docker container.
+
+    """
+    def __init__(self, socket_path: Path, script: Path, device: str,
+                 container_id: Optional[str] = None, server_socket_path: Optional[Path] = None,
+                 python: str = 'python', start_timeout: float = 120):
+        """
+        Args:
+            socket_path (Path): Where the client finds the server's socket.
+            script (Path): `evaluate_app.py` as seen by the server.
+            device (str): ADB serial of the device the server evaluates on.
+            container_id (Optional[str]): Container to run the server in. Runs locally if None.
+            server_socket_path (Optional[Path]): The socket path as seen by the server, if it
+                differs from `socket_path`, i.e. inside a container. The socket must be on a
+                folder shared with the host. Its folder is made private to the current user.
+            python (str): Python interpreter to run the server with.
+            start_timeout (float): Seconds to wait for a starting server to listen.
+        """
+        self.socket_path = socket_path
+        self.server_socket_path = server_socket_path or socket_path
+        self.script = script
+        self.device = device
+        self.container_id = container_id
+        self.python = python
+        self.start_timeout = start_timeout
+        self.lock = threading.Lock()
+        assert len(str(socket_path)) < 108, f'Socket path {socket_path} is too long for a Unix socket!'
+
+    def serves(self, cmd: list[str]):
+        """
+        Whether `cmd` is an `evaluate_app.py` command line this server can run.
+        """
+        return len(cmd) > 1 and Path(cmd[1]).name == self.script.name
+
+    def start(self):
+        private_folder(self.socket_path.parent)
+        if self.socket_path.exists():
+            self.socket_path.unlink()
+        source = Path(__file__).read_text(encoding='utf-8')
+        args = ['--socket', str(self.server_socket_path), '--preload', str(self.script), '--device', self.device]
+        if self.container_id:
+            # the server runs as root in the container, the client as the owner of the folder
+            args += ['--owner', str(os.getuid())]
+            subprocess.run(['docker', 'exec', '-d', '-w', str(self.script.parent), self.container_id,
+                            self.python, '-u', '-c', source] + args, check=True)
+        else:
+            subprocess.Popen([self.python, '-u', '-c', source] + args, cwd=str(self.script.parent),
+                             stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                             start_new_session=True)
+        deadline = time.time() + self.start_timeout
+        while time.time() < deadline:
+            if self.alive():
+                return True
+            time.sleep(0.5)
+        return False
+
+    def connect(self):
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            conn.connect(str(self.socket_path))
+        except OSError:
+            conn.close()
+            return None
+        return conn
+
+    def alive(self):
+        conn = self.connect()
+        if conn is None:
+            return False
+        conn.close()
+        return True
+
+    def submit(self, cmd: list[str], workdir: Path):
+        """
+        Start an `evaluate_app.py` command line on the server, starting the server if needed.
+
+        Args:
+            cmd (list[str]): Command line, starting with the interpreter and `evaluate_app.py`.
+                The server runs its own `evaluate_app.py` with the arguments that follow.
+            workdir (Path): Directory to run the evaluation in.
+
+        Returns:
+            Optional[tuple[int, Iterator[bytes]]]: The pid of the job on the server's side and
+                the chunks of its output, or None if the server cannot be reached.
+        """
+        with self.lock:
+            conn = self.connect()
+            if conn is None and self.start():
+                conn = self.connect()
+        if conn is None:
+            return None
+        try:
+            # like exec_cmd: stderr is part of the output in a container, dropped locally
+            job = {'args': cmd[2:], 'cwd': str(workdir), 'merge_stderr': bool(self.container_id)}
+            conn.sendall((json.dumps(job) + '\n').encode('utf-8'))
+            stream = conn.makefile('rb')
+            header = stream.readline()
+        except OSError:
+            header = b''
+        if not header:
+            conn.close()
+            return None
+        def chunks():
+            try:
+                yield from iter(lambda: stream.read1(65536), b'')
+            finally:
+                stream.close()
+                conn.close()
+        return json.loads(header)['pid'], chunks()
+
+    def run(self, cmd: list[str], workdir: Path):
+        """
+        Run an `evaluate_app.py` command line on the server to completion.
+
+        Returns:
+            Optional[str]: Console output of the evaluation, or None if the server cannot be reached.
+        """
+        job = self.submit(cmd, workdir)
+        if job is None:
+            return None
+        return b''.join(job[1]).decode('utf-8', errors='replace')
+
+    def kill(self, pid: int):
+        """
+        Kill a job of the server with the processes it started.
+        """
+        if self.container_id:
+            subprocess.run(['docker', 'exec', self.container_id, 'kill', '-KILL', '--', f'-{pid}'],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            return
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def close(self):
+        conn = self.connect()
+        if conn is None:
+            return
+        try:
+            conn.sendall(b'{"shutdown": true}\n')
+        except OSError:
+            pass
+        conn.close()
+
+
+def private_folder(folder: Path):
+    """
+    Create `folder` accessible to the current user only, or make sure an existing one is.
+    """
+    folder.mkdir(mode=0o700, parents=True, exist_ok=True)
+    info = folder.stat()
+    if info.st_uid != os.getuid():
+        raise PermissionError(f'{folder} is owned by another user!')
+    if stat.S_IMODE(info.st_mode) != 0o700:
+        os.chmod(folder, 0o700)
+
+
+def peer_uid(conn: socket.socket):
+    """
+    User ID of the process at the other end of a Unix socket, None if the platform cannot tell.
+    """
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return None
+    creds = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+    return struct.unpack('3i', creds)[1]
+
+
+def preload(script: str):
+    """
+    Import `script` with its modules, without running its main block and without
+    connecting to the device, so that forking afterwards is safe.
+    """
+    import runpy
+    try:
+        import uiautomator2
+    except BaseException:
+        pass
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+    try:
+        # Runs the imports and definitions of the script, but not its main block
+        runpy.run_path(script, run_name='evaluate_app_preload')
+    except BaseException:
+        pass
+
+
+def connect_device(device: str):
+    """
+    Connect uiautomator2 to `device` once and have the job reuse that connection
+    instead of setting up its own. Runs in a job's child, as connecting starts threads.
+    """
+    try:
+        import uiautomator2
+        connected = uiautomator2.connect(device)
+        connect = uiautomator2.connect
+        def warm_connect(serial=None, *args, **kwargs):
+            if serial in (None, device) and not args and not kwargs:
+                return connected
+            return connect(serial, *args, **kwargs)
+        uiautomator2.connect = warm_connect
+    except BaseException:
+        pass
+
+
+def reap(children: set[int]):
+    """
+    Collect the jobs of `children` that exited, without waiting for running ones.
+    """
+    for pid in list(children):
+        try:
+            done, _ = os.waitpid(pid, os.WNOHANG)
+        except ChildProcessError:
+            done = pid
+        if done:
+            children.discard(pid)
+
+
+def serve(socket_path: str, script: str, device: str, idle_timeout: float = 3600,
+          owner: Optional[int] = None, poll: float = 1):
+    """
+    Serve evaluation jobs running `script` on a Unix socket. Only connections of the
+    socket's owner are accepted: the server's own user, or `owner` if given, e.g. for
+    a client on the host of a container running as root.
+    """
+    import runpy, traceback
+    preload(script)
+    script = os.path.abspath(script)
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    if owner is not None:
+        os.chown(socket_path, owner, -1)
+    os.chmod(socket_path, 0o600)
+    allowed = {None, os.getuid(), owner}
+    server.listen(8)
+    server.settimeout(poll)
+    children = set()
+    idle_since = time.time()
+    while True:
+        reap(children)
+        if children:
+            idle_since = time.time()
+        try:
+            conn, _ = server.accept()
+        except socket.timeout:
+            if time.time() - idle_since > idle_timeout:
+                break
+            continue
+        idle_since = time.time()
+        conn.settimeout(None)
+        if peer_uid(conn) not in allowed:
+            conn.close()
+            continue
+        line = conn.makefile('rb').readline()
+        if not line.strip():
+            # a liveness probe
+            conn.close()
+            continue
+        job = json.loads(line)
+        if job.get('shutdown'):
+            conn.close()
+            break
+        # the child waits until its pid went out, so the pid line comes before any output
+        ready, go = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.setsid()
+            server.close()
+            os.close(go)
+            os.read(ready, 1)
+            os.close(ready)
+            devnull = os.open(os.devnull, os.O_RDWR)
+            os.dup2(devnull, 0)
+            os.dup2(conn.fileno(), 1)
+            os.dup2(conn.fileno() if job.get('merge_stderr') else devnull, 2)
+            conn.close()
+            sys.stdout = os.fdopen(1, 'w', buffering=1, encoding='utf-8')
+            sys.stderr = os.fdopen(2, 'w', buffering=1, encoding='utf-8')
+            code = 0
+            try:
+                connect_device(device)
+                os.chdir(job['cwd'])
+                sys.argv = [script] + job['args']
+                runpy.run_path(script, run_name='__main__')
+            except SystemExit as e:
+                code = e.code if isinstance(e.code, int) else 0
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+        children.add(pid)
+        os.close(ready)
+        try:
+            conn.sendall((json.dumps({'pid': pid}) + '\n').encode('utf-8'))
+        except OSError:
+            pass
+        os.write(go, b'x')
+        os.close(go)
+        # the child holds its own copy of the connection
+        conn.close()
+    server.close()
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    # running jobs finish on their own, their exit is collected by init
+    reap(children)
+
+
+if __name__ == '__main__':
+    import argparse
+    ap = argparse.ArgumentParser('evaluator server')
+    ap.add_argument('--socket', required=True)
+    ap.add_argument('--preload', required=True)
+    ap.add_argument('--device', required=True)
+    ap.add_argument('--idle_timeout', type=float, default=3600)
+    ap.add_argument('--owner', type=int, default=None, help="uid of the user to hand the socket to")
+    args = ap.parse_args()
+    serve(args.socket, args.preload, args.device, args.idle_timeout, args.owner)
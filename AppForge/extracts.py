@@ -1,5 +1,274 @@
+from typing import NamedTuple, Optional
+from abc import ABC, abstractmethod
+import re
+
+
+# Line a combined `evaluate_app.py` session prints when it turns from testing to fuzzing
+FUZZ_PHASE_MARKER = 'Start fuzzing...'
+
+
+class LineParser(ABC):
+    """
+    Base class of the incremental log parsers.
+
+    Text is fed in arbitrary chunks as it arrives; complete lines are handed to
+    `feed_line` and the trailing partial line is kept until more text (or `result()`)
+    comes. Lines are split on '\n' only, exactly as `log.split('\n')` does, so
+    that parsing a stream gives the same result as parsing the whole log.
+    """
+    def __init__(self):
+        self.partial = ''
+
+    def feed(self, text: str):
+        lines = (self.partial + text).split('\n')
+        self.partial = lines.pop()
+        for line in lines:
+            self.feed_line(line)
+
+    @abstractmethod
+    def feed_line(self, line: str):
+        pass
+
+    def result(self):
+        """
+        Parse the remaining partial line and return the result.
+        """
+        self.feed_line(self.partial)
+        self.partial = ''
+        return self.finish()
+
+    @abstractmethod
+    def finish(self):
+        pass
+
+
+class Diagnostic(NamedTuple):
+    """
+    One compiler message of a failed build.
+
+    `file` has the task folder prefix removed, `line` and `column` are None when
+    the compiler did not report them, and `task` is the Gradle task that produced
+    the message, e.g. ':app:compileDebugKotlin', if it could be told.
+    """
+    file: Optional[str]
+    line: Optional[int]
+    column: Optional[int]
+    severity: str
+    message: str
+    task: Optional[str] = None
+
+    def key(self):
+        return (self.file, self.line, self.column, self.severity, self.message)
+
+    def render(self):
+        location = ':'.join(str(part) for part in [self.file, self.line, self.column] if part is not None)
+        return f'{location}: {self.severity}: {self.message}' if location else f'{self.severity}: {self.message}'
+
+
+# (pattern, group indices of file, line, column, severity, message)
+DIAGNOSTIC_PATTERNS = [
+    # ERROR: /p/app/src/main/res/layout/a.xml:12:5: AAPT: error: ...
+    (re.compile(r'^(?:ERROR:\s*)?(.+?):(\d+)(?::(\d+))?: AAPT: (error|warning): (.*)$'), (1, 2, 3, 4, 5)),
+    # e: file:///p/app/src/main/java/A.kt:12:5 Unresolved reference: foo
+    (re.compile(r'^([ew]): (?:file://)?(.+?):(\d+):(\d+) (.*)$'), (2, 3, 4, 1, 5)),
+    # e: /p/app/src/main/java/A.kt: (12, 5): Unresolved reference: foo
+    (re.compile(r'^([ew]): (?:file://)?(.+?): \((\d+), (\d+)\): (.*)$'), (2, 3, 4, 1, 5)),
+    # /p/app/src/main/java/A.java:12: error: cannot find symbol
+    (re.compile(r'^(.+?\.java):(\d+): (error|warning): (.*)$'), (1, 2, None, 3, 4)),
+]
+# Lines javac prints under a diagnostic to detail it
+JAVAC_DETAIL = re.compile(r'^\s+(symbol|location|required|found|reason)\s*:')
+GRADLE_TASK = re.compile(r'^> Task (:\S+)')
+FAILED_TASK = re.compile(r"Execution failed for task '(:[^']+)'")
+SEVERITIES = {'e': 'error', 'w': 'warning'}
+
+
+class ErrorParser(LineParser):
+    """
+    Incremental counterpart of `extract_error`.
+
+    Only the lines after the latest '编译失败' marker are buffered. They become
+    the errors once a 'BUILD FAILED' line closes the block, which is what the
+    latest marker's forward scan would have selected. Every line is looked at
+    once, so parsing is linear in the size of the log.
+
+    The block is also parsed into `diagnostics`: the Kotlin, javac and AAPT
+    messages it holds, deduplicated, with the Gradle task they came from.
+    """
+    def __init__(self, ignore_path_str: Optional[str] = None):
+        super().__init__()
+        self.ignore_path_str = ignore_path_str
+        self.errors = []
+        self.block = None
+        self.diagnostics = []
+        self.block_diagnostics = None
+        self.task = None
+
+    def feed_line(self, line: str):
+        match = GRADLE_TASK.match(line)
+        if match:
+            self.task = match.group(1)
+        if line.find('编译失败')>=0:
+            self.block = []
+            self.block_diagnostics = {}
+            if line.find('BUILD FAILED')>=0:
+                # the marker line closes its own block
+                self.close_block()
+            return
+        if self.block is not None:
+            self.block.append(line.replace(self.ignore_path_str, '') if self.ignore_path_str else line)
+            self.parse_diagnostic(line)
+            if line.find('BUILD FAILED')>=0:
+                self.close_block()
+
+    def parse_diagnostic(self, line: str):
+        diagnostics = self.block_diagnostics
+        if JAVAC_DETAIL.match(line) and diagnostics:
+            # javac details belong to the latest message, e.g. the missing symbol
+            key, last = next(reversed(diagnostics.items()))
+            if last.file and last.file.endswith('.java'):
+                del diagnostics[key]
+                last = last._replace(message=f"{last.message} ({' '.join(line.split())})")
+                diagnostics.setdefault(last.key(), last)
+            return
+        match = FAILED_TASK.search(line)
+        if match:
+            for key, diagnostic in diagnostics.items():
+                if diagnostic.task is None:
+                    diagnostics[key] = diagnostic._replace(task=match.group(1))
+            return
+        if ':' not in line:
+            return
+        for pattern, groups in DIAGNOSTIC_PATTERNS:
+            match = pattern.match(line)
+            if match:
+                file, row, column, severity, message = [match.group(g) if g else None for g in groups]
+                diagnostic = Diagnostic(self.relative_path(file), int(row), int(column) if column else None,
+                                        SEVERITIES.get(severity, severity), message.strip(), self.task)
+                diagnostics.setdefault(diagnostic.key(), diagnostic)
+                return
+
+    def relative_path(self, file: str):
+        if self.ignore_path_str and file.startswith(self.ignore_path_str):
+            file = file[len(self.ignore_path_str):]
+        return file.lstrip('/')
+
+    def close_block(self):
+        self.errors = self.block
+        self.diagnostics = list(self.block_diagnostics.values())
+        self.block = None
+        self.block_diagnostics = None
+        if len(self.errors)==0:
+            self.errors = ['']
+
+    def finish(self):
+        if self.block is not None and len(self.errors)==0:
+            # marker without a closing 'BUILD FAILED'
+            self.errors = ['']
+        if (len(self.errors)==0):
+            return None
+        return '\n'.join(self.errors)
+
+
+class FuzzParser(LineParser):
+    """
+    Incremental counterpart of `extract_fuzz`.
+    """
+    def __init__(self):
+        super().__init__()
+        self.result_dict = {
+            'compile':0,
+            'no_crash':0,
+            'native':0,
+            'java':0,
+            'anr':0,
+            'failtostart':0,
+        }
+        self.cycle_cnt = 0
+        self.crash_cnt = 0
+
+    def feed_line(self, line: str):
+        segments = line.split('Starting app...')
+        for id, segment in enumerate(segments):
+            if id > 0:
+                self.cycle_cnt += 1
+            if self.cycle_cnt == 0:
+                continue
+            for pattern, key in [('Native crash detected!', 'native'), ('Java crash detected!', 'java'),
+                                 ('ANR detected!', 'anr'), ('Failed to start', 'failtostart')]:
+                if pattern in segment:
+                    self.crash_cnt += 1
+                    self.result_dict[key] = 1
+
+    def finish(self):
+        result = dict(self.result_dict)
+        if self.cycle_cnt:
+            result['compile'] = 1
+            if self.crash_cnt==0:
+                result['no_crash'] = 1
+        return result
+
+
+class TestParser(LineParser):
+    """
+    Incremental counterpart of `extract_test`.
+    """
+    def __init__(self):
+        super().__init__()
+        self.good = 0
+        self.bad = 0
+
+    @classmethod
+    def merge(cls, parsers: list['TestParser']):
+        """
+        Combine the counts of parsers that each read part of a task's tests.
+        """
+        merged = cls()
+        merged.good = sum(parser.good for parser in parsers)
+        merged.bad = sum(parser.bad for parser in parsers)
+        return merged
+
+    def feed_line(self, line: str):
+        self.bad += line.count("'success': False")
+        self.good += line.count("'success': True")
+
+    def finish(self):
+        result = {
+            'compile':0,
+            'test':0.0,
+            'all_pass':0
+        }
+        bad, good = self.bad, self.good
+        if good+bad > 0:
+            result['compile'] = 1
+            result['test'] = good / (good+bad)
+            if bad == 0:
+                result['all_pass'] = 1
+        return result
+
+
+class SessionParser(LineParser):
+    """
+    Splits one output into phases, e.g. a session that runs the tests and then
+    fuzzes, and feeds each phase to its own parser. A line holding `marker` ends
+    a phase; it belongs to none. `phase` is the index of the current phase, and
+    `result()` returns the results of the parsers in order.
+    """
+    def __init__(self, *parsers: LineParser, marker: str = FUZZ_PHASE_MARKER):
+        super().__init__()
+        self.parsers = parsers
+        self.marker = marker
+        self.phase = 0
+
+    def feed_line(self, line: str):
+        if self.marker in line and self.phase < len(self.parsers) - 1:
+            self.phase += 1
+            return
+        self.parsers[self.phase].feed_line(line)
+
+    def finish(self):
+        return [parser.finish() for parser in self.parsers]
 
-from typing import Optional
 
 def extract_error(log: str, ignore_path_str: Optional[str] = None,):
     """
@@ -15,24 +284,37 @@ def extract_error(log: str, ignore_path_str: Optional[str] = None,):
             no errors were found. Returns empty string if errors were detected
             but no specific error messages were captured.
     """
-    build_outputs = log.split('\n')
-    errors = []
-    for id,s in enumerate(build_outputs):
-        if s.find('编译失败')>=0:
-            for kid in range(id,len(build_outputs)):
-                if build_outputs[kid].find('BUILD FAILED')>=0:
-                    if ignore_path_str:
-                        errors = [i.replace(ignore_path_str,'')for i in build_outputs[id+1:kid+1]]
-                    else:
-                        errors = [i for i in build_outputs[id+1:kid+1]]
-                    break
-            if(len(errors)==0):
-                errors += ['']
-    if (len(errors)==0):
-        return None
-    return '\n'.join(errors)
+    parser = ErrorParser(ignore_path_str)
+    parser.feed(log)
+    return parser.result()
     
     
+def extract_diagnostics(log: str, ignore_path_str: Optional[str] = None):
+    """
+    Extract structured compilation errors from build log output.
+
+    Args:
+        log (str): The complete build log output as a string.
+        ignore_path_str (Optional[str]): Path prefix to remove from the reported files.
+
+    Returns:
+        list[Diagnostic]: Deduplicated diagnostics of the block `extract_error` selects,
+            in order of appearance. Empty if no errors were found or none could be parsed.
+    """
+    parser = ErrorParser(ignore_path_str)
+    parser.feed(log)
+    parser.result()
+    return parser.diagnostics
+
+
+def render_diagnostics(diagnostics: list[Diagnostic]):
+    """
+    Render diagnostics one per line as 'file:line:column: severity: message', the
+    javac layout, so the text can be fed back to a model like `extract_error`'s output.
+    """
+    return '\n'.join(diagnostic.render() for diagnostic in diagnostics)
+
+
 def extract_fuzz(log: str):
     """
     Extract fuzzing results from fuzzing log output.
@@ -52,37 +334,9 @@ def extract_fuzz(log: str):
             - anr (int): 1 if ANR detected, 0 otherwise
             - failtostart (int): 1 if app failed to start, 0 otherwise   
     """
-    result = {
-        'compile':0,
-        'no_crash':0,
-        'native':0,
-        'java':0,
-        'anr':0,
-        'failtostart':0,
-    }
-    if 'Starting app...' in log:
-        result['compile'] = 1
-    cycles = log.split('Starting app...')
-    crash_cnt,cycle_cnt = 0,0
-    for i in cycles[1:]:
-        cycle_cnt += 1
-        if 'Native crash detected!' in i:
-            crash_cnt += 1
-            result['native'] = 1
-        if 'Java crash detected!' in i:
-            crash_cnt += 1
-            result['java'] = 1
-        if 'ANR detected!' in i:
-            crash_cnt += 1
-            result['anr'] = 1
-        if 'Failed to start' in i:
-            crash_cnt += 1
-            result['failtostart'] = 1
-    if cycle_cnt:
-        if crash_cnt==0:
-            result['no_crash'] = 1
-        
-    return result
+    parser = FuzzParser()
+    parser.feed(log)
+    return parser.result()
     
 def extract_test(log: str):
     """
@@ -103,18 +357,6 @@ def extract_test(log: str):
             - all_pass (int): 1 if all tests passed, 0 otherwise
             
     """
-    result = {
-        'compile':0,
-        'test':0.0,
-        'all_pass':0
-    }
-    
-    bad, good = log.count("'success': False"), \
-                        log.count("'success': True")
-    if good+bad > 0:
-        result['compile'] = 1
-        result['test'] = good / (good+bad)
-        if bad == 0:
-            result['all_pass'] = 1
-
-    return result
\ No newline at end of file
+    parser = TestParser()
+    parser.feed(log)
+    return parser.result()
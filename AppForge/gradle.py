@@ -0,0 +1,244 @@
+"""
+Gradle build profiles.
+
+With profiling on, AppForge installs `PROFILE_INIT_SCRIPT` into the Gradle
+user home of the builds (`init.d`), and sets `PROFILE_ENV` for its builds. The
+script is inert for any other build. It times the settings, configuration and
+execution phases and every task, and writes them to `PROFILE_FILE` in the root
+project when the build finishes. `read_profile` turns that into seconds per
+Gradle task, and `report` aggregates the profiles of a run:
+
+    python -m AppForge.gradle runs/example_qwen3 --top 20
+
+A `GradleHome` is a Gradle user home warmed once with a build of the template
+and then shared read-only, as the `GRADLE_RO_DEP_CACHE` of the builds of several
+AppForge instances and containers. Each of them builds in a writable Gradle user
+home of its own, and `SHARED_INIT_SCRIPT` puts the builds into offline mode.
+"""
+from typing import Optional
+from pathlib import Path
+import json, os
+
+from .utils import file_lock
+
+
+PROFILE_ENV = 'APPFORGE_GRADLE_PROFILE'
+# relative to the root project of a build
+PROFILE_FILE = 'build/appforge-profile.json'
+
+PROFILE_INIT_SCRIPT = '''// Installed by AppForge. Does nothing unless APPFORGE_GRADLE_PROFILE is set.
+def profileFile = System.getenv('APPFORGE_GRADLE_PROFILE')
+if (profileFile) {
+    def buildStart = System.currentTimeMillis()
+    def phases = [:]
+    def tasks = Collections.synchronizedList([])
+    def started = new java.util.concurrent.ConcurrentHashMap()
+    gradle.settingsEvaluated { phases.settings = System.currentTimeMillis() - buildStart }
+    gradle.projectsEvaluated { phases.configuration = System.currentTimeMillis() - buildStart }
+    gradle.taskGraph.beforeTask { task -> started[task.path] = System.currentTimeMillis() }
+    gradle.taskGraph.afterTask { task, state ->
+        def start = started.remove(task.path)
+        if (start != null) {
+            def outcome = state.failure ? 'FAILED' : (state.skipped ? (state.skipMessage ?: 'SKIPPED') : 'EXECUTED')
+            tasks << [path: task.path, ms: System.currentTimeMillis() - start, outcome: outcome]
+        }
+    }
+    gradle.buildFinished { result ->
+        phases.total = System.currentTimeMillis() - buildStart
+        def file = new File(profileFile)
+        if (!file.absolute) {
+            file = new File(gradle.rootProject.projectDir, profileFile)
+        }
+        file.parentFile.mkdirs()
+        file.text = groovy.json.JsonOutput.toJson([phases: phases, tasks: tasks, failed: result.failure != null])
+    }
+}
+'''
+
+SHARED_ENV = 'APPFORGE_GRADLE_SHARED'
+# read-only dependency cache of Gradle, the `caches` folder of a warmed user home
+RO_CACHE_ENV = 'GRADLE_RO_DEP_CACHE'
+
+SHARED_INIT_SCRIPT = '''// Installed by AppForge. Does nothing unless APPFORGE_GRADLE_SHARED is set.
+def shared = System.getenv('APPFORGE_GRADLE_SHARED')
+if (shared) {
+    gradle.startParameter.buildCacheEnabled = true
+    if (shared == 'offline') {
+        gradle.startParameter.offline = true
+    }
+}
+'''
+
+# Smallest app built from the template, so that a build resolves every dependency
+# and plugin of the template and fills the build cache with its outputs
+WARMUP_CHANGED = {
+    'app/src/main/java/com/example/template/MainActivity.java':
+        'package com.example.template;\n\n'
+        'import android.os.Bundle;\n'
+        'import androidx.appcompat.app.AppCompatActivity;\n\n'
+        'public class MainActivity extends AppCompatActivity {\n'
+        '    @Override\n'
+        '    protected void onCreate(Bundle savedInstanceState) {\n'
+        '        super.onCreate(savedInstanceState);\n'
+        '        setContentView(R.layout.activity_main);\n'
+        '    }\n'
+        '}\n',
+}
+
+
+class GradleHome:
+    """
+    Gradle user home shared by the builds of several AppForge instances, e.g. the
+    containers of a pool. One of them warms it under `lock` with a build of the
+    template, which fills it with the Gradle distribution and the resolved
+    dependencies and plugins. From then on nothing writes to it: the builds read
+    the dependencies through `ro_cache` and copy the distribution into their own
+    writable user home, since Gradle's cross-process locks only reach the processes
+    of one host and one container. Whether the home was warmed for a template and
+    SDK identity is recorded in a marker file, so that it is warmed only once.
+
+    """
+    def __init__(self, path: Path, identity: str):
+        """
+        Args:
+            path (Path): The Gradle user home.
+            identity (str): Template and SDK identity the home is warmed for.
+        """
+        self.path = path
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.identity = identity
+        self.marker = path / 'appforge-warm.json'
+
+    def lock(self):
+        """
+        The warm-up lock of the home, held across processes.
+        """
+        return file_lock(self.path / 'appforge-warm.lock')
+
+    @staticmethod
+    def ro_cache(home: str):
+        """
+        The read-only dependency cache of the user home at `home`, as seen by a build.
+        """
+        return f'{home}/caches'
+
+    @property
+    def warm(self):
+        try:
+            with open(self.marker, 'r', encoding='utf-8') as file:
+                return json.load(file).get('identity') == self.identity
+        except (OSError, ValueError):
+            return False
+
+    def mark_warm(self):
+        tmp = self.marker.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp, 'w', encoding='utf-8') as file:
+            json.dump({'identity': self.identity}, file)
+        os.replace(tmp, self.marker)
+
+CLASSPATH_ENV = 'APPFORGE_GRADLE_CLASSPATH'
+# relative to the root project of a build
+CLASSPATH_FILE = 'build/appforge-classpath.json'
+
+CLASSPATH_INIT_SCRIPT = '''// Installed by AppForge. Does nothing unless APPFORGE_GRADLE_CLASSPATH is set.
+def classpathFile = System.getenv('APPFORGE_GRADLE_CLASSPATH')
+if (classpathFile) {
+    gradle.taskGraph.afterTask { task, state ->
+        if (task.path == ':app:compileDebugJavaWithJavac' && !state.failure) {
+            def file = new File(classpathFile)
+            if (!file.absolute) {
+                file = new File(gradle.rootProject.projectDir, classpathFile)
+            }
+            file.parentFile.mkdirs()
+            def boot = task.options.bootstrapClasspath
+            file.text = groovy.json.JsonOutput.toJson([
+                classpath: task.classpath.files*.absolutePath + [task.destinationDirectory.get().asFile.absolutePath],
+                bootclasspath: boot ? boot.files*.absolutePath : []])
+        }
+    }
+}
+'''
+
+
+def read_profile(path: Path, since: float = 0):
+    """
+    Read the profile written by `PROFILE_INIT_SCRIPT`.
+
+    Args:
+        path (Path): The profile file.
+        since (float): Ignore a profile last written before this time, e.g. by an earlier build.
+
+    Returns:
+        Optional[dict]: 'phases' with the seconds until the end of the settings and configuration
+            phases and in total, and 'tasks' with the seconds of each executed Gradle task, longest
+            first. None if there is no profile.
+    """
+    try:
+        if path.stat().st_mtime < since:
+            return None
+        with open(path, 'r', encoding='utf-8') as file:
+            raw = json.load(file)
+    except (OSError, ValueError):
+        return None
+    tasks = {}
+    for task in raw.get('tasks', []):
+        tasks[task['path']] = tasks.get(task['path'], 0.0) + task['ms'] / 1000
+    phases = {name: ms / 1000 for name, ms in raw.get('phases', {}).items()}
+    return {'phases': phases, 'tasks': dict(sorted(tasks.items(), key=lambda x: -x[1])),
+            'failed': raw.get('failed', False)}
+
+
+def read_classpath(path: Path):
+    """
+    Read the javac classpath written by `CLASSPATH_INIT_SCRIPT`.
+
+    Returns:
+        Optional[dict]: 'classpath' and 'bootclasspath', lists of paths in the build environment.
+            None if there is none.
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def report(run_folder: Path, top: Optional[int] = 20):
+    """
+    Aggregate the Gradle profiles (`gradle_profile.json`) of the tasks of a run.
+
+    Returns:
+        dict: 'builds', the number of profiled builds; 'phases', the mean seconds of
+            each phase; 'tasks', a list of the `top` Gradle tasks by total seconds across
+            the run, each with its 'task', 'total', 'mean', 'builds' and 'share' of all task time.
+    """
+    profiles = []
+    for path in sorted(run_folder.glob('*/gradle_profile.json')):
+        with open(path, 'r', encoding='utf-8') as file:
+            profiles.append(json.load(file))
+    totals, counts, phases = {}, {}, {}
+    for profile in profiles:
+        for name, seconds in profile['tasks'].items():
+            totals[name] = totals.get(name, 0.0) + seconds
+            counts[name] = counts.get(name, 0) + 1
+        for name, seconds in profile['phases'].items():
+            phases[name] = phases.get(name, 0.0) + seconds / len(profiles)
+    everything = sum(totals.values()) or 1.0
+    rows = [{'task': name, 'total': total, 'mean': total / counts[name], 'builds': counts[name],
+             'share': total / everything}
+            for name, total in sorted(totals.items(), key=lambda x: -x[1])]
+    return {'builds': len(profiles), 'phases': phases, 'tasks': rows[:top] if top else rows}
+
+
+if __name__ == '__main__':
+    import argparse
+    ap = argparse.ArgumentParser('Gradle profile report')
+    ap.add_argument('run_folder', help="base_folder/runs of a run compiled with profile_builds")
+    ap.add_argument('--top', type=int, default=20, help="number of Gradle tasks to list")
+    args = ap.parse_args()
+    ans = report(Path(args.run_folder), args.top)
+    print(f"{ans['builds']} profiled builds")
+    print('mean phases: ' + ', '.join(f'{name} {seconds:.1f}s' for name, seconds in ans['phases'].items()))
+    print(f"{'task':<56}{'total':>10}{'mean':>9}{'builds':>8}{'share':>8}")
+    for row in ans['tasks']:
+        print(f"{row['task']:<56}{row['total']:>9.1f}s{row['mean']:>8.2f}s{row['builds']:>8}{row['share']:>8.1%}")
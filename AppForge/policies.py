@@ -0,0 +1,132 @@
+from typing import Callable, Optional, Union
+import copy, threading
+
+from .extracts import FuzzParser
+
+
+class StopPolicy:
+    """
+    Decides when a streamed command, typically a fuzzing session, should be
+    terminated early. The base policy only enforces the time budget; subclasses
+    add a condition on what the parser has seen so far.
+
+    After the command ends, `reason` tells why it was stopped, or is None if it
+    ran to completion. A policy may also carry a `deadline`, the hard limit of its
+    stage: unlike the budget, running into it counts as a failure ('timeout').
+
+    """
+    name = 'budget'
+
+    def __init__(self, budget: Optional[float] = None):
+        """
+        Args:
+            budget (Optional[float]): Seconds after which the command is stopped. Unlimited if None.
+        """
+        self.budget = budget
+        self.deadline = None
+        self.reason = None
+        self.lock = threading.Lock()
+
+    def fresh(self):
+        """
+        Returns:
+            StopPolicy: A copy of this policy with no run recorded yet, so one
+                instance can configure many sessions.
+        """
+        clone = copy.copy(self)
+        clone.reason = None
+        clone.lock = threading.Lock()
+        return clone
+
+    def check(self, parser, elapsed: float):
+        """
+        Called whenever new output was parsed.
+
+        Args:
+            parser: The parser consuming the command's output.
+            elapsed (float): Seconds since the command started.
+
+        Returns:
+            bool: Whether the command should be stopped now.
+        """
+        return False
+
+    def stop(self, kill: Callable[[], None], reason: str):
+        """
+        Stop the command once, recording why.
+        """
+        with self.lock:
+            if self.reason is not None:
+                return
+            self.reason = reason
+        kill()
+
+
+class FirstCrash(StopPolicy):
+    """
+    Stop fuzzing as soon as any crash, ANR or start failure has been seen.
+
+    """
+    name = 'first_crash'
+
+    def check(self, parser: FuzzParser, elapsed: float):
+        return any(parser.result_dict[key] for key in ['native', 'java', 'anr', 'failtostart'])
+
+
+class Plateau(StopPolicy):
+    """
+    Stop fuzzing once the detected outcomes have not changed for `cycles`
+    consecutive app starts, i.e. further cycles stopped revealing anything new.
+
+    """
+    name = 'plateau'
+
+    def __init__(self, budget: Optional[float] = None, cycles: int = 5):
+        super().__init__(budget)
+        self.cycles = cycles
+        self.seen = None
+        self.since = 0
+
+    def fresh(self):
+        clone = super().fresh()
+        clone.seen, clone.since = None, 0
+        return clone
+
+    def check(self, parser: FuzzParser, elapsed: float):
+        seen = tuple(parser.result_dict[key] for key in ['native', 'java', 'anr', 'failtostart'])
+        if seen != self.seen:
+            self.seen, self.since = seen, parser.cycle_cnt
+        return parser.cycle_cnt - self.since >= self.cycles
+
+
+class StageTimeout(TimeoutError):
+    """
+    Raised when a command of a stage ('compile', 'test', 'fuzz') ran into its deadline
+    and was killed.
+    """
+    def __init__(self, stage: str, seconds: float):
+        super().__init__(f'{stage} timed out after {seconds}s')
+        self.stage = stage
+        self.seconds = seconds
+
+
+def stop_policy(policy: Union[None, str, StopPolicy] = None, budget: Optional[float] = None):
+    """
+    Build a stop policy from its name.
+
+    Args:
+        policy (Union[None, str, StopPolicy]): 'first_crash', 'plateau', a policy instance,
+            or None to stop on the budget only.
+        budget (Optional[float]): Time budget in seconds, applied unless the policy instance has its own.
+
+    Returns:
+        StopPolicy: The policy to watch the command with.
+    """
+    if isinstance(policy, StopPolicy):
+        policy = policy.fresh()
+        if policy.budget is None:
+            policy.budget = budget
+        return policy
+    policies = {None: StopPolicy, 'first_crash': FirstCrash, 'plateau': Plateau}
+    assert policy in policies, f'No such stop policy {policy}'
+    return policies[policy](budget=budget)
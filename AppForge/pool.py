@@ -0,0 +1,329 @@
+from typing import Callable, Iterable, Optional, Union
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from pathlib import Path
+import queue, threading, time
+import docker
+
+from .appforge import AppForge
+from .cache import BuildCache, sdk_identity
+from .extracts import TestParser
+from .policies import StopPolicy
+from .registry import shard_sub_features
+from .schedule import expected_seconds, longest_first
+from .store import ResultStore
+from .tracing import Tracer
+from .trash import TrashReaper
+from .utils import sumup_json
+
+
+def image_id(docker_name: str, containers: Optional[list[str]] = None):
+    """
+    ID of the image the containers of a pool run: that of the running `containers`,
+    which must agree, or else of `docker_name`, pulled if it is missing.
+    """
+    client = docker.from_env()
+    if containers:
+        ids = {client.containers.get(container).image.id for container in containers}
+        assert len(ids) == 1, 'The containers of a pool must run the same image!'
+        return ids.pop()
+    try:
+        return client.images.get(docker_name).id
+    except docker.errors.ImageNotFound:
+        return client.images.pull(docker_name).id
+
+
+def start_devices(starters: list[Callable[[], AppForge]], workers: int = 1):
+    """
+    Start the devices of a pool, `workers` at a time.
+
+    If a device fails to start, the devices not started yet are skipped, those
+    already started are cleaned up, and the error is raised.
+
+    Returns:
+        list[AppForge]: The devices, in the order of `starters`.
+    """
+    devices, error = [], None
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(starter) for starter in starters]
+        for future in futures:
+            try:
+                devices.append(future.result())
+            except BaseException as e:
+                error = error or e
+                for pending in futures:
+                    pending.cancel()
+    if error:
+        for forge in devices:
+            forge.clean_up()
+        raise error
+    return devices
+
+
+class DevicePool:
+    """
+    A pool of AppForge instances, one per emulator or Docker container, all writing
+    into the same run folder. Tasks are dispatched to whichever device is free, and
+    each device is guarded by its own lock so that only one task touches it at a time.
+    The devices share one trash reaper, build cache and result store.
+
+    """
+    def __init__(self, runs: str,
+                 base_folder: Path = Path('runs'),
+                 use_docker: bool = False,
+                 emulator_ids: Optional[list[str]] = None,
+                 docker_num: int = 1,
+                 sdk_path: Optional[Path] = None,
+                 bench_folder: Optional[Path] = None,
+                 docker_name: str = 'zenithfocuslight/appforge:latest',
+                 docker_port: int = 6080,
+                 containers: Optional[list[str]] = None,
+                 **forge_kwargs
+                 ):
+        """
+        Initialize the device pool.
+
+        Args:
+            runs (str): Name identifier for the current run session, shared by all devices.
+            base_folder (Path): Base directory for storing run data. Defaults to '/runs'.
+            use_docker (bool): Whether to launch Docker containers as devices. Defaults to False.
+            emulator_ids (Optional[list[str]]): IDs of local emulators to use. Required if not using Docker.
+            docker_num (int): Number of Docker containers to launch. Defaults to 1.
+            sdk_path (Optional[Path]): Path to Android SDK. Required if not using Docker.
+            bench_folder (Optional[Path]): Path to benchmark folder. Required if not using Docker.
+            docker_name (str): Docker image name to use. Defaults to 'zenithfocuslight/appforge:latest'.
+            docker_port (int): First host port to try for the containers' noVNC; each container gets the next
+                free one. Defaults to 6080.
+            containers (Optional[list[str]]): Names or IDs of running AppForge containers to attach to instead
+                of launching `docker_num` new ones. Defaults to None.
+            **forge_kwargs: Further AppForge options applied to every device, e.g. build_worker or build_cache.
+        """
+        assert (use_docker ^ bool(emulator_ids)), \
+            'We must choose one and only one option of docker or local emulators for evaluation!'
+        if forge_kwargs.get('trace') is True:
+            # one trace for the whole pool
+            forge_kwargs['trace'] = Tracer()
+        if forge_kwargs.get('result_store') is True:
+            forge_kwargs['result_store'] = ResultStore(base_folder / 'results.db',
+                                                       shared=forge_kwargs.get('shared_store', False))
+        if forge_kwargs.get('build_cache') is True:
+            sdk = image_id(docker_name, containers) if use_docker else sdk_identity(sdk_path)
+            forge_kwargs['build_cache'] = BuildCache(base_folder / '.build_cache', AppForge.build_identity(sdk),
+                                                     **({'max_bytes': forge_kwargs.pop('build_cache_bytes')}
+                                                        if 'build_cache_bytes' in forge_kwargs else {}))
+        self.trash = TrashReaper(base_folder / '.trash')
+        forge_kwargs['trash'] = self.trash
+        try:
+            if use_docker and containers:
+                self.devices = start_devices([partial(AppForge, runs, base_folder=base_folder, use_docker=True,
+                                                      container=container, **forge_kwargs)
+                                              for container in containers])
+            elif use_docker:
+                assert docker_num > 0, 'At least one docker container is needed!'
+                # An emulator home can only be used by one emulator at a time
+                volume = forge_kwargs.pop('snapshot_volume', None)
+                # Containers boot independently, so wait for all of them at once; each
+                # publishes noVNC on the next free port
+                self.devices = start_devices([partial(AppForge, runs, base_folder=base_folder, use_docker=True,
+                                                      docker_name=docker_name, docker_port=docker_port,
+                                                      pick_free_port=True,
+                                                      snapshot_volume=f'{volume}-{i}' if volume else None,
+                                                      **forge_kwargs)
+                                              for i in range(docker_num)], workers=docker_num)
+            else:
+                self.devices = start_devices([partial(AppForge, runs, base_folder=base_folder,
+                                                      emulator_id=emulator_id, sdk_path=sdk_path,
+                                                      bench_folder=bench_folder, **forge_kwargs)
+                                              for emulator_id in emulator_ids])
+        except BaseException:
+            self.trash.close()
+            raise
+        if use_docker:
+            # build outputs in the mounted base folder belong to the containers' root user
+            self.trash.remover = self.devices[0].remove_in_container
+        self.runs = runs
+        self.task_num = AppForge.task_num
+        self.warned_unsharded = False
+        self.locks = [threading.Lock() for _ in self.devices]
+        self.free = queue.Queue()
+        for i in range(len(self.devices)):
+            self.free.put(i)
+
+    def __len__(self):
+        return len(self.devices)
+
+    def clean_up(self):
+        """
+        Clean up resources of every device in the pool.
+        """
+        # while the containers that may have to remove some of it are still up
+        self.trash.close()
+        for forge in self.devices:
+            forge.clean_up()
+
+    @contextmanager
+    def device(self):
+        """
+        Borrow a free device, blocking until one is available.
+
+        Yields:
+            AppForge: The borrowed device, locked for the duration of the context.
+        """
+        i = self.free.get()
+        try:
+            with self.locks[i]:
+                yield self.devices[i]
+        finally:
+            self.free.put(i)
+
+    def description(self, task_id: int):
+        return self.devices[0].description(task_id)
+
+    def task_name(self, task_id: int):
+        return self.devices[0].task_name(task_id)
+
+    def compile_json_based_on_template(self, changed: dict[str, str], task_id: int, raw_log: Optional[str] = None,
+                                       incremental: bool = False):
+        """
+        Compile the application on whichever device is free.
+        See `AppForge.compile_json_based_on_template`.
+        """
+        with self.device() as forge:
+            return forge.compile_json_based_on_template(changed, task_id, raw_log=raw_log, incremental=incremental)
+
+    def map(self, fn: Callable[[AppForge, int], dict], task_ids: Iterable[int]):
+        """
+        Run `fn(device, task_id)` for every task, each on whichever device is free.
+
+        Args:
+            fn (Callable[[AppForge, int], dict]): Job to run on a borrowed device.
+            task_ids (Iterable[int]): IDs of the tasks to run.
+
+        Returns:
+            dict: Results of `fn` keyed by task ID, in the order of `task_ids`.
+        """
+        def job(task_id):
+            with self.device() as forge:
+                return fn(forge, task_id)
+        task_ids = list(task_ids)
+        with ThreadPoolExecutor(max_workers=len(self.devices)) as executor:
+            return dict(zip(task_ids, executor.map(job, task_ids)))
+
+    def test(self, task_id: int, shards: int = 1):
+        """
+        Run test cases on the specified task, see `AppForge.test`.
+        
+        Args:
+            task_id (int): ID of the task to test.
+            shards (int): Number of devices to spread the task's sub-features over. The
+                shards run in parallel, each installing the same APK, and their counts are
+                merged into one result. Defaults to 1, which tests on a single device, as
+                does an `evaluate_app.py` that cannot select sub-features.
+        """
+        # the task's files are shared, but a device's methods are only called while it is borrowed
+        with self.device() as forge:
+            sub_features = forge.tasks[task_id].sub_features
+            if shards > 1 and not forge.supports_sub_features():
+                if not self.warned_unsharded:
+                    self.warned_unsharded = True
+                    print(f'AppForge: evaluate_app.py has no {forge.sub_feature_arg} option, testing unsharded...')
+                shards = 1
+            if shards <= 1 or len(sub_features) <= 1 or not forge.direct_apk_path(task_id).exists():
+                return forge.test(task_id)
+            print(f'AppForge: Testing on {task_id}...')
+            assert forge.apk_folder(task_id).exists(), 'Target task not built!'
+            cached = forge._cached_result(task_id, 'test')
+            if cached is not None:
+                return cached
+
+        start = time.time()
+        groups = [list(dict.fromkeys(sub.header for sub in group))
+                  for group in shard_sub_features(sub_features, shards)]
+        def job(shard):
+            with self.device() as device:
+                return device.test_shard(task_id, shard, groups[shard])
+        with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+            parsers, timeouts = zip(*executor.map(job, range(len(groups))))
+        with self.device() as forge:
+            # keep test.log as the one place to read a task's test output
+            with open(forge.test_log(task_id), 'w+') as file:
+                for shard, group in enumerate(groups):
+                    file.write(f'=== shard {shard}: {",".join(group)} ===\n')
+                    file.write(forge.shard_log(task_id, shard).read_text(errors='replace'))
+            result = forge.mark_timeout('test', TestParser.merge(list(parsers)).result(), any(timeouts))
+            return forge._save_result(task_id, 'test', result, start)
+
+    def fuzz(self, task_id: int, budget: Optional[float] = None,
+             stop: Union[None, str, StopPolicy] = None):
+        with self.device() as forge:
+            return forge.fuzz(task_id, budget=budget, stop=stop)
+
+    def map_tasks(self, fn: Callable[[int], dict], task_ids: Iterable[int]):
+        """
+        Run `fn(task_id)` for every task, as many at a time as there are devices.
+        Unlike `map`, no device is borrowed for `fn`; it borrows what it needs itself,
+        e.g. several devices for a sharded test.
+
+        Returns:
+            dict: Results of `fn` keyed by task ID, in the order of `task_ids`.
+        """
+        task_ids = list(task_ids)
+        with ThreadPoolExecutor(max_workers=len(self.devices)) as executor:
+            return dict(zip(task_ids, executor.map(fn, task_ids)))
+
+    def schedule(self, task_ids: Iterable[int], stage: str, fuzz_budget: Optional[float] = None):
+        """
+        Order tasks longest expected first, by their durations in earlier runs where the
+        result store has them and by the size of their features otherwise, see `schedule.expected_seconds`.
+        Devices take tasks in this order, which keeps the tail of a run short.
+        """
+        forge = self.devices[0]
+        seconds = expected_seconds(task_ids, stage, forge.tasks, forge.store, self.runs, fuzz_budget)
+        return longest_first(task_ids, seconds)
+
+    def evaluation_only_test(self, eval_list: Optional[list] = None, test_shards: int = 1):
+        """
+        Run test cases on specified tasks or all tasks, spread over the pool.
+
+        Args:
+            eval_list (Optional[list]): List of task IDs to evaluate. If None, evaluates all tasks.
+            test_shards (int): Number of devices to spread each task's tests over, see `test`. Defaults to 1.
+
+        Returns:
+            dict: Aggregated test results for all evaluated tasks.
+        """
+        task_ids = self.schedule(eval_list if eval_list else range(self.task_num), 'test')
+        if test_shards > 1:
+            all_results = self.map_tasks(lambda i: {**self.test(i, shards=test_shards)}, task_ids)
+        else:
+            all_results = self.map(lambda forge, i: {**forge.test(i)}, task_ids)
+        return sumup_json(all_results)
+
+    def evaluation(self, eval_list: Optional[list] = None, fuzz_budget: Optional[float] = None,
+                   fuzz_stop: Union[None, str, StopPolicy] = None, test_shards: int = 1, combined: bool = False):
+        """
+        Run test cases and fuzzing on specified tasks or all tasks, spread over the pool.
+        Test and fuzz of one task run back to back on the same device, unless the test is sharded.
+        Tasks are taken longest expected first, see `schedule`.
+
+        Args:
+            eval_list (Optional[list]): List of task IDs to evaluate. If None, evaluates all tasks.
+            fuzz_budget (Optional[float]): Time budget of each fuzzing session, see `AppForge.fuzz`.
+            fuzz_stop (Union[None, str, StopPolicy]): Early stop policy of each fuzzing session, see `AppForge.fuzz`.
+            test_shards (int): Number of devices to spread each task's tests over, see `test`. Defaults to 1.
+            combined (bool): Whether to test and fuzz each task in one session, see `AppForge.test_and_fuzz`.
+                Not applied to sharded tests. Defaults to False.
+
+        Returns:
+            dict: Aggregated test and fuzzing results for all evaluated tasks, plus 'crash_rate'.
+        """
+        task_ids = self.schedule(eval_list if eval_list else range(self.task_num), 'evaluate', fuzz_budget)
+        if test_shards > 1:
+            all_results = self.map_tasks(lambda i: {**self.test(i, shards=test_shards),
+                                                    **self.fuzz(i, budget=fuzz_budget, stop=fuzz_stop)}, task_ids)
+        else:
+            all_results = self.map(lambda forge, i: forge.evaluate_task(i, fuzz_budget, fuzz_stop, combined), task_ids)
+        ans = sumup_json(all_results)
+        ans['crash_rate'] = 1 - ans['no_crash'] / ans['compile']
+        return ans
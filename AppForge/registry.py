@@ -0,0 +1,251 @@
+from typing import NamedTuple, Optional, Union
+from importlib import resources
+from importlib.abc import Traversable
+from pathlib import Path
+import json, re, threading
+
+
+# Rough cost of a UI test: starting the app, then each action and the check after it
+LAUNCH_SECONDS = 10.0
+ACTION_SECONDS = 3.0
+
+RESOURCE_ID = re.compile(r'[A-Za-z][\w.]*:id/\w+')
+ACTION = re.compile(r'\b(?:tap|click|press|long[- ]press|typ|enter|input|swip|scroll|drag)\w*', re.I)
+# 'feature-1:', 'feature 1:', 'Feature-1', 'sub-feature 1-2:', 'sub-feature1-2', 'sub-feature 3:'
+HEADER = re.compile(r'^\W*(sub-?)?\s*feature\s*-?\s*(\d+)(?:\s*-\s*(\d+))?\s*:?\s*', re.I)
+DESCRIPTION = re.compile(r'^\W*description\s*:?\s*', re.I)
+# tell apart repeated sub-feature headers of one feature: '1-3', '1-3b', '1-3c', ...
+REPEATS = 'bcdefghijklmnopqrstuvwxyz'
+
+
+def estimate_seconds(actions: int):
+    return LAUNCH_SECONDS + ACTION_SECONDS * max(actions, 1)
+
+
+class SubFeature(NamedTuple):
+    """
+    One `sub-feature N-M` of a task, i.e. one UI test. A header repeated within a
+    feature gets a letter, e.g. the second `sub-feature 1-3` of a feature is '1-3b'.
+    """
+    id: str
+    feature: int
+    text: str
+    resource_ids: tuple[str, ...]
+    actions: int
+    estimated_seconds: float
+
+    @property
+    def header(self):
+        """
+        'N-M' as in the sub-feature's header, which is what `evaluate_app.py` knows it by.
+        """
+        return self.id.rstrip(REPEATS)
+
+    @classmethod
+    def parse(cls, id: str, feature: int, text: str):
+        actions = len(ACTION.findall(text))
+        return cls(id, feature, text, tuple(dict.fromkeys(RESOURCE_ID.findall(text))), actions,
+                   estimate_seconds(actions))
+
+
+class Feature(NamedTuple):
+    """
+    One `feature-N` of a task with its sub-features. A feature described without
+    sub-features counts as a single one made of its own text.
+    """
+    id: int
+    text: str
+    sub_features: tuple[SubFeature, ...]
+
+    @property
+    def resource_ids(self):
+        return tuple(dict.fromkeys(r for sub in self.sub_features for r in sub.resource_ids))
+
+    @property
+    def actions(self):
+        return sum(sub.actions for sub in self.sub_features)
+
+    @property
+    def estimated_seconds(self):
+        return sum(sub.estimated_seconds for sub in self.sub_features)
+
+
+class Task(NamedTuple):
+    """
+    One benchmark task: the raw entry of tasks.json and its parsed features.
+    """
+    id: int
+    app_key: str
+    description: str
+    refined_features: str
+    features: tuple[Feature, ...]
+
+    @property
+    def sub_features(self):
+        return tuple(sub for feature in self.features for sub in feature.sub_features)
+
+    @property
+    def resource_ids(self):
+        return tuple(dict.fromkeys(r for feature in self.features for r in feature.resource_ids))
+
+    @property
+    def actions(self):
+        return sum(feature.actions for feature in self.features)
+
+    @property
+    def estimated_seconds(self):
+        return sum(feature.estimated_seconds for feature in self.features)
+
+
+def parse_features(text: str):
+    """
+    Split the `refined_features` prose of a task into features and sub-features.
+
+    Lines that do not start a new block continue the previous one. Headers come in
+    several spellings in tasks.json, see `HEADER`.
+
+    Returns:
+        tuple[str, tuple[Feature, ...]]: The description line and the features in order.
+    """
+    description, features = [], []
+    # [feature id, feature text lines, [[sub-feature id, text lines], ...]]
+    current = None
+    block = description
+    for line in text.split('\n'):
+        match = HEADER.match(line)
+        if match is None:
+            if block is description:
+                line = DESCRIPTION.sub('', line)
+            block.append(line.strip())
+            continue
+        sub, n, m = match.group(1), int(match.group(2)), match.group(3)
+        rest = line[match.end():].strip()
+        if sub is not None:
+            if current is None or current[0] != n:
+                current = [n, [], []]
+                features.append(current)
+            index = int(m) if m else len(current[2]) + 1
+            id = f'{n}-{index}'
+            repeats = sum(sub_id.rstrip(REPEATS) == id for sub_id, _ in current[2])
+            current[2].append([id + REPEATS[repeats - 1] if repeats else id, [rest]])
+            block = current[2][-1][1]
+        else:
+            current = [n, [rest], []]
+            features.append(current)
+            block = current[1]
+    ans = []
+    for n, lines, subs in features:
+        feature_text = ' '.join(line for line in lines if line)
+        if not subs:
+            subs = [[f'{n}-1', lines]]
+        ans.append(Feature(n, feature_text,
+                           tuple(SubFeature.parse(id, n, ' '.join(line for line in sub_lines if line))
+                                 for id, sub_lines in subs)))
+    return ' '.join(line for line in description if line), tuple(ans)
+
+
+class TaskRegistry:
+    """
+    Index of the benchmark tasks with their features parsed once.
+
+    Tasks are looked up by ID (`registry[task_id]`), by `app_key`, and
+    features or sub-features by (task ID, feature ID), all through dicts.
+
+    """
+    def __init__(self, sheet: list[dict]):
+        """
+        Args:
+            sheet (list[dict]): Entries of tasks.json with 'app_key' and 'refined_features'.
+        """
+        self.sheet = sheet
+        self.tasks = []
+        for i, entry in enumerate(sheet):
+            description, features = parse_features(entry['refined_features'])
+            self.tasks.append(Task(i, entry['app_key'], description, entry['refined_features'], features))
+        self.keys = {task.app_key: task for task in self.tasks}
+        self.features = {(task.id, feature.id): feature for task in self.tasks for feature in reversed(task.features)}
+        self.sub_features = {(task.id, sub.id): sub for task in self.tasks for sub in reversed(task.sub_features)}
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def __iter__(self):
+        return iter(self.tasks)
+
+    def __getitem__(self, task_id: int):
+        return self.tasks[task_id]
+
+    def by_key(self, app_key: str):
+        return self.keys[app_key]
+
+    def feature(self, task_id: int, feature_id: int):
+        return self.features[(task_id, feature_id)]
+
+    def sub_feature(self, task_id: int, sub_feature_id: str):
+        """
+        Args:
+            task_id (int): ID of the task.
+            sub_feature_id (str): 'N-M' as in the task's `sub-feature N-M` header, with a
+                letter for a repeated header, e.g. '1-3b'.
+        """
+        return self.sub_features[(task_id, sub_feature_id)]
+
+
+def shard_sub_features(sub_features: tuple[SubFeature, ...], shards: int):
+    """
+    Split sub-features into at most `shards` groups of similar estimated length,
+    longest first onto the currently shortest group. Sub-features sharing a header,
+    which `evaluate_app.py` cannot tell apart, stay in one group.
+
+    Returns:
+        list[list[SubFeature]]: Non-empty groups, each in the task's original order.
+    """
+    units: dict[str, list[tuple[int, SubFeature]]] = {}
+    for i, sub in enumerate(sub_features):
+        units.setdefault(sub.header, []).append((i, sub))
+    groups = [[] for _ in range(max(1, min(shards, len(units))))]
+    lengths = [0.0] * len(groups)
+    for unit in sorted(units.values(), key=lambda unit: -sum(sub.estimated_seconds for _, sub in unit)):
+        j = lengths.index(min(lengths))
+        groups[j].extend(unit)
+        lengths[j] += sum(sub.estimated_seconds for _, sub in unit)
+    return [[sub for _, sub in sorted(group)] for group in groups if group]
+
+
+def tasks_file():
+    """
+    Locate tasks.json: the resource `AppForge.tasks` of the installed package, else the
+    file in the source tree next to the package, else under the current directory as before.
+
+    Returns:
+        Union[Path, Traversable]: The file, to be read with `read_text`.
+    """
+    try:
+        shipped = resources.files('AppForge.tasks') / 'tasks.json'
+        if shipped.is_file():
+            return shipped
+    except ModuleNotFoundError:
+        pass
+    path = Path(__file__).resolve().parent.parent / 'tasks' / 'tasks.json'
+    return path if path.exists() else Path('tasks/tasks.json')
+
+
+_registries: dict[str, TaskRegistry] = {}
+_registries_lock = threading.Lock()
+
+def load_tasks(path: Union[None, Path, Traversable] = None):
+    """
+    The task registry of a tasks.json, read and parsed on first use and shared afterwards.
+
+    Args:
+        path (Optional[Union[Path, Traversable]]): The tasks.json to load. Defaults to `tasks_file()`.
+
+    Returns:
+        TaskRegistry: The registry.
+    """
+    path = path or tasks_file()
+    key = str(path.resolve()) if isinstance(path, Path) else str(path)
+    with _registries_lock:
+        if key not in _registries:
+            _registries[key] = TaskRegistry(json.loads(path.read_text(encoding='utf-8')))
+        return _registries[key]
@@ -0,0 +1,68 @@
+from typing import Iterable, Optional
+
+from .registry import TaskRegistry
+from .store import ResultStore
+
+
+# Length of a full fuzzing session of evaluate_app.py
+FUZZ_SECONDS = 600.0
+
+
+def estimated_seconds(tasks: TaskRegistry, task_id: int, stage: str, fuzz_budget: Optional[float] = None):
+    """
+    Size estimate of a stage of a task that has never run: its UI tests from the
+    feature text, see `registry.estimate_seconds`, and fuzzing for its budget.
+    """
+    if stage == 'test':
+        return tasks[task_id].estimated_seconds
+    if stage == 'fuzz':
+        return fuzz_budget or FUZZ_SECONDS
+    return estimated_seconds(tasks, task_id, 'test') + estimated_seconds(tasks, task_id, 'fuzz', fuzz_budget)
+
+
+def expected_seconds(task_ids: Iterable[int], stage: str, tasks: TaskRegistry, store: Optional[ResultStore] = None,
+                     run: Optional[str] = None, fuzz_budget: Optional[float] = None):
+    """
+    How long a stage is expected to take on each task.
+
+    Tasks with recorded durations in the result store are expected to take as long
+    again (see `ResultStore.durations`). The others get their size estimate, scaled
+    by how far the estimates of the recorded tasks were off, so that the two kinds
+    of figures compare.
+
+    Args:
+        task_ids (Iterable[int]): IDs of the tasks.
+        stage (str): 'test', 'fuzz' or 'evaluate' (both).
+        tasks (TaskRegistry): The task registry.
+        store (Optional[ResultStore]): Where durations were recorded. Defaults to None, estimates only.
+        run (Optional[str]): Run whose own durations are preferred. Defaults to None.
+        fuzz_budget (Optional[float]): Fuzzing budget of the coming sessions, capping their durations.
+
+    Returns:
+        dict[int, float]: Expected seconds per task.
+    """
+    task_ids = list(task_ids)
+    if stage == 'evaluate':
+        test = expected_seconds(task_ids, 'test', tasks, store, run)
+        fuzz = expected_seconds(task_ids, 'fuzz', tasks, store, run, fuzz_budget)
+        return {task_id: test[task_id] + fuzz[task_id] for task_id in task_ids}
+    estimates = {task_id: estimated_seconds(tasks, task_id, stage, fuzz_budget) for task_id in task_ids}
+    recorded = store.durations(stage, run) if store else {}
+    if fuzz_budget and stage == 'fuzz':
+        recorded = {task_id: min(seconds, fuzz_budget) for task_id, seconds in recorded.items()}
+    known = [task_id for task_id in recorded if task_id < len(tasks)]
+    scale = 1.0
+    if known:
+        scale = sum(recorded[task_id] for task_id in known) / \
+            sum(estimated_seconds(tasks, task_id, stage, fuzz_budget) for task_id in known)
+    return {task_id: recorded[task_id] if task_id in recorded else estimates[task_id] * scale
+            for task_id in task_ids}
+
+
+def longest_first(task_ids: Iterable[int], seconds: dict[int, float]):
+    """
+    Order tasks longest expected first, so that a pool of devices taking them in
+    order does not end with one device running a long task while the rest idle.
+    Ties keep their order.
+    """
+    return sorted(task_ids, key=lambda task_id: -seconds[task_id])
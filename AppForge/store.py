@@ -0,0 +1,222 @@
+from typing import Iterable, Optional
+from pathlib import Path
+import hashlib, json, sqlite3, threading, time
+
+from .extracts import extract_error
+from .utils import sumup_json
+
+
+def hash_file(path: Path):
+    """
+    Returns:
+        Optional[str]: SHA-256 of the file content, or None if it does not exist.
+    """
+    if not path.exists():
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultStore:
+    """
+    SQLite store of per-task results, one database per base folder.
+
+    Every row holds the metrics of one (run, task, stage), e.g. the dict written to
+    `test_result.json` for stage 'test', together with the stage's duration, the
+    hash of the artifact it worked on and the path of its log. (run, task, stage)
+    is the primary key, so cache checks are a single index lookup. The database is
+    in WAL mode with a busy timeout and each thread uses its own connection, so
+    concurrent writers (threads of a DevicePool, or several processes) are safe.
+    WAL needs shared memory, which processes on different hosts sharing the file
+    over a network file system do not have; a `shared` store stays in rollback
+    journal mode instead, like `WorkQueue`.
+
+    """
+    schema = '''
+        CREATE TABLE IF NOT EXISTS results (
+            run TEXT NOT NULL,
+            task INTEGER NOT NULL,
+            stage TEXT NOT NULL,
+            metrics TEXT NOT NULL,
+            duration REAL,
+            artifact_hash TEXT,
+            log_path TEXT,
+            updated REAL NOT NULL,
+            PRIMARY KEY (run, task, stage)
+        );
+        CREATE INDEX IF NOT EXISTS results_by_stage ON results (stage, run);
+    '''
+
+    def __init__(self, path: Path, shared: bool = False):
+        """
+        Args:
+            path (Path): Database file, created if missing.
+            shared (bool): Whether processes on other hosts may use the database. Defaults to False.
+        """
+        self.path = path
+        self.shared = shared
+        self.local = threading.local()
+        with self.connection() as conn:
+            conn.executescript(self.schema)
+
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=60)
+            if self.shared:
+                conn.execute('PRAGMA journal_mode=DELETE')
+            else:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+        return conn
+
+    def put(self, run: str, task: int, stage: str, metrics: dict,
+            duration: Optional[float] = None, artifact_hash: Optional[str] = None,
+            log_path: Optional[Path] = None):
+        """
+        Insert or replace the result of one stage of a task.
+        """
+        with self.connection() as conn:
+            conn.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                         (run, task, stage, json.dumps(metrics), duration, artifact_hash,
+                          str(log_path) if log_path else None, time.time()))
+
+    def get(self, run: str, task: int, stage: str):
+        """
+        Returns:
+            Optional[dict]: Metrics of the stage, or None if it has not been recorded.
+        """
+        row = self.connection().execute('SELECT metrics FROM results WHERE run=? AND task=? AND stage=?',
+                                        (run, task, stage)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def row(self, run: str, task: int, stage: str):
+        """
+        Returns:
+            Optional[dict]: The full record of the stage, or None if it has not been recorded.
+        """
+        cursor = self.connection().execute('SELECT * FROM results WHERE run=? AND task=? AND stage=?',
+                                           (run, task, stage))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        ans = dict(zip([c[0] for c in cursor.description], row))
+        ans['metrics'] = json.loads(ans['metrics'])
+        return ans
+
+    def delete(self, run: str, task: int, stages: Iterable[str]):
+        with self.connection() as conn:
+            conn.executemany('DELETE FROM results WHERE run=? AND task=? AND stage=?',
+                             [(run, task, stage) for stage in stages])
+
+    def results(self, run: str, stage: str):
+        """
+        Returns:
+            dict[int, dict]: Metrics of the stage for every recorded task of the run.
+        """
+        rows = self.connection().execute('SELECT task, metrics FROM results WHERE run=? AND stage=? ORDER BY task',
+                                         (run, stage))
+        return {task: json.loads(metrics) for task, metrics in rows}
+
+    def summary(self, run: str, stage: str):
+        """
+        Returns:
+            Optional[dict]: Metrics of the stage averaged over the recorded tasks of the run,
+                as `sumup_json` computes them, or None if nothing was recorded.
+        """
+        results = self.results(run, stage)
+        if not results:
+            return None
+        if stage == 'compile':
+            results = {task: {'compile': metrics['compile']} for task, metrics in results.items()}
+        return sumup_json(results)
+
+    def compare(self, runs: Iterable[str], stage: str):
+        """
+        Returns:
+            dict[str, Optional[dict]]: `summary` of the stage for each run.
+        """
+        return {run: self.summary(run, stage) for run in runs}
+
+    def durations(self, stage: str, run: Optional[str] = None):
+        """
+        Returns:
+            dict[int, float]: Recorded seconds of the stage for every task that has any, taken from
+                `run` where it was recorded there and averaged over all runs otherwise.
+        """
+        conn = self.connection()
+        ans = dict(conn.execute('SELECT task, AVG(duration) FROM results WHERE stage=? AND duration IS NOT NULL '
+                                'GROUP BY task', (stage,)))
+        if run is not None:
+            ans.update(conn.execute('SELECT task, duration FROM results WHERE stage=? AND run=? '
+                                    'AND duration IS NOT NULL', (stage, run)))
+        return ans
+
+    def runs(self):
+        return [row[0] for row in self.connection().execute('SELECT DISTINCT run FROM results ORDER BY run')]
+
+    def has_run(self, run: str):
+        return self.connection().execute('SELECT 1 FROM results WHERE run=? LIMIT 1', (run,)).fetchone() is not None
+
+    def import_run(self, run_folder: Path, docker_folder: Optional[Path] = None):
+        """
+        Import the per-task JSON files of a run folder written by AppForge:
+        `compile.log` and the APK as stage 'compile', `test_result.json` as stage
+        'test' and `fuzz_result.json` as stage 'fuzz'. Existing records are replaced.
+
+        Args:
+            run_folder (Path): The run folder, i.e. base_folder / runs.
+            docker_folder (Optional[Path]): The run folder as seen in the container, if the run
+                was built in docker, whose paths its compile logs then hold. Defaults to None.
+
+        Returns:
+            int: Number of records imported.
+        """
+        run, records = run_folder.name, []
+        for task_folder in run_folder.iterdir():
+            if not task_folder.name.isdigit():
+                continue
+            task = int(task_folder.name)
+            apk = task_folder / str(task) / 'app' / 'build' / 'outputs' / 'apk' / 'debug' / 'app-debug.apk'
+            if (task_folder / 'compile.log').exists():
+                prefix = docker_folder / task_folder.name if docker_folder else task_folder
+                error = extract_error((task_folder / 'compile.log').read_text(), ignore_path_str=str(prefix))
+                records.append((run, task, 'compile', json.dumps({'compile': int(apk.exists()), 'error': error}),
+                                None, hash_file(apk), str(task_folder / 'compile.log'), time.time()))
+            for stage, name, log in [('test', 'test_result.json', 'test.log'), ('fuzz', 'fuzz_result.json', 'fuzz.log')]:
+                if (task_folder / name).exists():
+                    with open(task_folder / name, 'r', encoding='utf-8') as file:
+                        metrics = json.load(file)
+                    records.append((run, task, stage, json.dumps(metrics), None, hash_file(apk),
+                                    str(task_folder / log), time.time()))
+        with self.connection() as conn:
+            conn.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)', records)
+        return len(records)
+
+    def import_base_folder(self, base_folder: Path, docker_base_folder: Optional[Path] = None):
+        """
+        Import every run folder under a base folder, see `import_run`.
+
+        Args:
+            base_folder (Path): The base folder.
+            docker_base_folder (Optional[Path]): The base folder as seen in the container, if the
+                runs were built in docker. Defaults to None.
+
+        Returns:
+            int: Number of records imported.
+        """
+        return sum(self.import_run(folder, docker_base_folder / folder.name if docker_base_folder else None)
+                   for folder in base_folder.iterdir() if folder.is_dir() and not folder.name.startswith('.'))
+
+
+if __name__ == '__main__':
+    # python -m AppForge.store <base_folder> [<base folder in the container>]: import the JSON results of every run
+    import sys
+    base_folder = Path(sys.argv[1] if len(sys.argv) > 1 else 'runs')
+    docker_base_folder = Path(sys.argv[2]) if len(sys.argv) > 2 else None
+    store = ResultStore(base_folder / 'results.db')
+    print(f'Imported {store.import_base_folder(base_folder, docker_base_folder)} records into {store.path}')
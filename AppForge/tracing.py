@@ -0,0 +1,99 @@
+from contextlib import contextmanager
+from pathlib import Path
+import functools, inspect, json, os, threading, time
+
+
+class Tracer:
+    """
+    Collector of timing spans in the Chrome trace event format.
+
+    `span` times a block and records it as a complete event with its attributes,
+    e.g. the task, run and device it worked on. Spans of one thread nest, and
+    chrome://tracing or https://ui.perfetto.dev show them as a flame chart per
+    thread. Seconds spent in each span are also summed per task, see `task_totals`.
+
+    One tracer may be shared by the devices of a pool, as recording is guarded by a lock.
+
+    """
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+        self.events = []
+        self.totals: dict[int, dict[str, float]] = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def depth(self):
+        """
+        Number of spans open in the calling thread.
+        """
+        return len(getattr(self.local, 'stack', ()))
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """
+        Time the enclosed block as a span called `name`. Attributes not given are
+        taken from the enclosing span. An attribute 'task' adds the span to the totals of that task.
+        """
+        stack = self.local.__dict__.setdefault('stack', [])
+        path = name
+        if stack:
+            # nested spans belong to the task of the enclosing one
+            path, attrs = f'{stack[-1][0]}/{name}', {**stack[-1][1], **attrs}
+        stack.append((path, attrs))
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            stack.pop()
+            event = {'name': name, 'ph': 'X', 'ts': (start - self.origin) * 1e6, 'dur': (end - start) * 1e6,
+                     'pid': self.pid, 'tid': threading.get_ident(), 'args': attrs}
+            with self.lock:
+                self.events.append(event)
+                task = attrs.get('task')
+                if task is not None:
+                    totals = self.totals.setdefault(task, {})
+                    totals[path] = totals.get(path, 0.0) + end - start
+
+    def task_totals(self, task_id: int):
+        """
+        Returns:
+            dict[str, float]: Seconds spent in each span of the task, keyed by the path of
+                span names from the outermost one, e.g. 'compile/exec'.
+        """
+        with self.lock:
+            return dict(self.totals.get(task_id, {}))
+
+    def export(self, path: Path):
+        """
+        Write the spans recorded so far as a Chrome trace JSON file.
+        """
+        with self.lock:
+            events = list(self.events)
+        threads = {event['tid'] for event in events}
+        meta = [{'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid,
+                 'args': {'name': f'thread {i}'}} for i, tid in enumerate(sorted(threads))]
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump({'traceEvents': meta + events, 'displayTimeUnit': 'ms'}, file)
+
+
+def traced(name: str):
+    """
+    Method decorator running an AppForge method inside `self.span(name, task_id)`,
+    with the method's `task_id` argument if it has one.
+    """
+    def decorator(method):
+        params = list(inspect.signature(method).parameters)
+        index = params.index('task_id') if 'task_id' in params else None
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self.tracer is None:
+                return method(self, *args, **kwargs)
+            task_id = None
+            if index is not None:
+                task_id = args[index - 1] if len(args) >= index else kwargs.get('task_id')
+            with self.span(name, task_id):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,135 @@
+from typing import Callable, Optional
+from pathlib import Path
+import os, threading, time, uuid
+
+from .utils import remove_directory
+
+
+class TrashReaper:
+    """
+    Deferred folder deletion.
+
+    `discard` moves a folder into the trash directory with a single rename, so
+    the caller never waits on the size of the folder. A background thread then
+    removes the trash file by file, pausing after every batch so that it does not
+    compete with builds for the disk. Folders left in the trash by an earlier
+    process are reaped as well.
+
+    Files this process may not remove, e.g. build outputs the root user of a
+    container created, are handed to `remover`. Whatever is left after that is
+    reported once and stays in the trash.
+
+    """
+    def __init__(self, folder: Path, batch: int = 256, pause: float = 0.01,
+                 remover: Optional[Callable[[Path], None]] = None):
+        """
+        Args:
+            folder (Path): The trash directory. Must be on the same file system as the discarded folders.
+            batch (int): Number of files removed between two pauses. Defaults to 256.
+            pause (float): Seconds to pause after each batch. Defaults to 0.01.
+            remover (Optional[Callable[[Path], None]]): Removes a trash entry the reaper could not,
+                e.g. from inside the container that created it. Can be set later. Defaults to None.
+        """
+        self.folder = folder
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.batch = batch
+        self.pause = pause
+        self.remover = remover
+        # names of entries that could not be removed, not retried by this process
+        self.failed = set()
+        self.wake = threading.Event()
+        self.closing = False
+        self.thread = None
+        self.lock = threading.Lock()
+        if any(self.folder.iterdir()):
+            self.start()
+
+    def start(self):
+        with self.lock:
+            if self.thread is None and not self.closing:
+                self.thread = threading.Thread(target=self.reap, daemon=True)
+                self.thread.start()
+
+    def discard(self, path: Path):
+        """
+        Remove a folder, deferring the actual deletion to the reaper.
+        Falls back to removing it in place if it cannot be moved.
+
+        Args:
+            path (Path): The folder to remove. Nothing happens if it does not exist.
+        """
+        if not path.exists():
+            return
+        try:
+            path.rename(self.folder / uuid.uuid4().hex)
+        except OSError:
+            remove_directory(path)
+            return
+        self.start()
+        self.wake.set()
+
+    def reap(self):
+        while True:
+            self.wake.clear()
+            closing = self.closing
+            for entry in list(self.folder.iterdir()):
+                if entry.name not in self.failed:
+                    self.remove(entry)
+            if closing:
+                return
+            self.wake.wait()
+
+    def remove(self, entry: Path):
+        removed = 0
+        errors = []
+        for root, dirs, files in os.walk(entry, topdown=False):
+            for name in files:
+                try:
+                    os.unlink(os.path.join(root, name))
+                except FileNotFoundError:
+                    # several reapers share the leftovers of an earlier process
+                    pass
+                except OSError as e:
+                    errors.append(e)
+                removed += 1
+                if removed % self.batch == 0 and not self.closing:
+                    time.sleep(self.pause)
+            for name in dirs:
+                p = os.path.join(root, name)
+                try:
+                    if os.path.islink(p):
+                        os.unlink(p)
+                    else:
+                        os.rmdir(p)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    errors.append(e)
+        try:
+            if entry.is_symlink() or entry.is_file():
+                entry.unlink()
+            else:
+                entry.rmdir()
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            errors.append(e)
+        if errors and self.remover and os.path.lexists(entry):
+            try:
+                self.remover(entry)
+            except Exception as e:
+                errors.append(e)
+        if errors and os.path.lexists(entry):
+            self.failed.add(entry.name)
+            print(f'AppForge: Could not remove {entry} from the trash ({len(errors)} errors, first: {errors[0]})')
+
+    def close(self):
+        """
+        Finish removing the trash without pausing and stop the reaper.
+        """
+        with self.lock:
+            self.closing = True
+            thread = self.thread
+        self.wake.set()
+        if thread:
+            thread.join()
@@ -1,6 +1,8 @@
 from pathlib import Path
-from typing import Dict
-import os
+from typing import Dict, Iterable
+from contextlib import contextmanager
+from collections import OrderedDict
+import fcntl, hashlib, os, shutil, socket, subprocess, threading, time
 
 def sumup_json(results: list[Dict]):
     """
@@ -16,17 +18,21 @@ def sumup_json(results: list[Dict]):
             
     Returns:
         Dict[str, float]: A dictionary with metric names as keys and their
-            average values across all tasks as values.
+            average values across all tasks as values. A metric only some results
+            have, e.g. one added after older results were saved, is averaged over those.
             
     """
     sum_results = {}
+    counts = {}
     for i in results.keys():
         for j in results[i]:
             if j not in sum_results:
                 sum_results[j] = 0
+                counts[j] = 0
             sum_results[j] += results[i][j]
-    for j in results[i]:
-        sum_results[j] /= len(results.keys())
+            counts[j] += 1
+    for j in sum_results:
+        sum_results[j] /= counts[j]
     return sum_results
 
 def remove_directory(path: Path):
@@ -49,6 +55,121 @@ def remove_directory(path: Path):
                 remove_directory(child)
         path.rmdir()
 
+@contextmanager
+def file_lock(path: Path):
+    """
+    Hold an exclusive lock on `path` (created if missing), across processes.
+    """
+    with open(path, 'a') as file:
+        fcntl.flock(file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
+
+def free_port(start: int, taken: Iterable[int] = ()):
+    """
+    Find the first port at or above `start` that can be bound on this host.
+
+    Args:
+        start (int): First port to try.
+        taken (Iterable[int]): Ports already handed out that must be skipped.
+
+    Returns:
+        int: A free port number.
+    """
+    port = start
+    while True:
+        if port not in taken:
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+                try:
+                    s.bind(('', port))
+                    return port
+                except OSError:
+                    pass
+        port += 1
+
+def clone_folder(src: Path, dst: Path):
+    """
+    Copy a folder with its permissions and symlinks, as a copy-on-write clone
+    where the filesystem supports reflinks (btrfs, XFS) and as a plain copy elsewhere.
+    """
+    try:
+        subprocess.run(['cp', '-a', '--reflink=auto', str(src), str(dst)], check=True, capture_output=True)
+    except (OSError, subprocess.CalledProcessError):
+        # e.g. a cp without --reflink
+        shutil.rmtree(dst, ignore_errors=True)
+        shutil.copytree(src, dst, symlinks=True)
+
+def is_binary(data: bytes):
+    """
+    Whether file content is binary, judged from a NUL byte in its first 8KB
+    like git does, so images and jars are told apart without decoding them.
+    """
+    return b'\0' in data[:8192]
+
+def read_text(data: bytes):
+    """
+    Decode file content the way `Path.read_text(encoding='utf-8')` does, newlines included.
+
+    Returns:
+        Optional[str]: The text, or None if the content is binary or not UTF-8.
+    """
+    if is_binary(data):
+        return None
+    try:
+        text = data.decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+    return text.replace('\r\n', '\n').replace('\r', '\n')
+
+def text_digest(text: str):
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+# mtimes this close to the time they are looked at may be shared by a later write of the
+# same tick, 2s covering the coarsest file systems, so files that recent are always read
+RACY_NS = 2 * 10**9
+MANIFESTS_MAX = 8
+_manifests: 'OrderedDict[Path, dict]' = OrderedDict()
+_manifests_lock = threading.Lock()
+
+def folder_manifest(folder: Path, refresh: bool = False):
+    """
+    Manifest of every file under a folder, computed once per process and folder.
+    Only the `MANIFESTS_MAX` folders used last are kept.
+    
+    Args:
+        folder (Path): The folder to describe, typically the template.
+        refresh (bool): Whether to recompute a manifest computed earlier. Defaults to False.
+        
+    Returns:
+        Dict[str, tuple[int, Optional[int], Optional[str]]]: (size, mtime in ns, digest of the text) of
+            every file keyed by its path relative to the folder. The mtime is None for files modified
+            too shortly before the scan to tell a later write apart, and the digest is None for files
+            that are not UTF-8 text.
+    """
+    key = folder.resolve()
+    with _manifests_lock:
+        if key in _manifests and not refresh:
+            _manifests.move_to_end(key)
+            return _manifests[key]
+    manifest = {}
+    scanned = time.time_ns()
+    for root, _dirs, files in os.walk(folder):
+        for name in files:
+            p = Path(root) / name
+            stat = p.stat()
+            text = read_text(p.read_bytes())
+            manifest[str(p.relative_to(folder))] = (stat.st_size,
+                                                    stat.st_mtime_ns if scanned - stat.st_mtime_ns > RACY_NS else None,
+                                                    text_digest(text) if text is not None else None)
+    with _manifests_lock:
+        _manifests[key] = manifest
+        _manifests.move_to_end(key)
+        while len(_manifests) > MANIFESTS_MAX:
+            _manifests.popitem(last=False)
+    return manifest
+
 def compare_folder(folderA:Path, folderB:Path):
     """
     Compare two folders and identify files that differ or are new.
@@ -58,6 +179,11 @@ def compare_folder(folderA:Path, folderB:Path):
     content compared to folderB. Only text files that can be read as UTF-8
     are considered in the comparison.
     
+    folderB is described once by `folder_manifest`, so only the files of folderA
+    are read, and a file with the same size and mtime as its folderB counterpart
+    is taken as unchanged without reading it, unless that mtime is recent enough
+    to be shared by a rewrite. folderB is assumed not to change during the process.
+    
     Args:
         folderA (Path): The source folder to compare (typically newer version).
         folderB (Path): The target folder to compare against (typically baseline).
@@ -69,25 +195,25 @@ def compare_folder(folderA:Path, folderB:Path):
             have different content between the two folders.
             
     """
+    manifest = folder_manifest(folderB)
     changed: dict[str, str] = {}
     for root, _dirs, files in os.walk(folderA):
         for name in files:
             p = Path(root) / name
             rel = str(p.relative_to(folderA))
-            src_file = folderB / rel
+            entry = manifest.get(rel)
+            if entry is not None:
+                size, mtime, digest = entry
+                if digest is None:
+                    continue
+                stat = p.stat()
+                if stat.st_size == size and stat.st_mtime_ns == mtime and time.time_ns() - mtime > RACY_NS:
+                    # untouched copy of the template file, e.g. from shutil.copytree
+                    continue
 
-            try:
-                new_text = p.read_text(encoding="utf-8")
-            except Exception:
+            new_text = read_text(p.read_bytes())
+            if new_text is None:
                 continue
-
-            if not src_file.exists():
+            if entry is None or text_digest(new_text) != entry[2]:
                 changed[rel] = new_text
-            else:
-                try:
-                    old_text = src_file.read_text(encoding="utf-8")
-                except Exception:
-                    continue
-                if new_text != old_text:
-                    changed[rel] = new_text
     return changed
@@ -0,0 +1,322 @@
+from typing import Iterable, NamedTuple, Optional, Union
+from contextlib import contextmanager
+from pathlib import Path
+import json, os, socket, sqlite3, threading, time, traceback
+
+from .appforge import AppForge
+from .pool import DevicePool
+from .utils import sumup_json
+
+
+class Job(NamedTuple):
+    """
+    One claimed (run, task, stage) of a `WorkQueue`.
+    """
+    run: str
+    task: int
+    stage: str
+    args: dict
+    attempts: int
+    worker: str
+
+
+class WorkQueue:
+    """
+    Queue of evaluation jobs shared by worker processes on any number of hosts.
+
+    A coordinator enqueues (run, task, stage) jobs, where stage is 'test', 'fuzz'
+    or 'evaluate' (test and fuzz). A worker claims the next pending job with a
+    lease, renews the lease while it works (`heartbeat`) and completes or fails
+    it. A job whose lease ran out, because its worker died or lost its host, goes
+    back to pending on the next claim, until it has been tried `max_attempts` times.
+
+    The queue is one SQLite database. It stays in rollback journal mode, unlike
+    `ResultStore`, since WAL needs shared memory and does not work for processes
+    on different hosts sharing the file over a network file system. Every claim
+    is one immediate transaction, so no two workers get the same job. Another
+    backend can replace it by providing the same methods.
+
+    """
+    schema = '''
+        CREATE TABLE IF NOT EXISTS jobs (
+            run TEXT NOT NULL,
+            task INTEGER NOT NULL,
+            stage TEXT NOT NULL,
+            args TEXT NOT NULL,
+            priority REAL NOT NULL DEFAULT 0,
+            state TEXT NOT NULL,
+            worker TEXT,
+            lease_until REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            result TEXT,
+            error TEXT,
+            updated REAL NOT NULL,
+            PRIMARY KEY (run, task, stage)
+        );
+        CREATE INDEX IF NOT EXISTS jobs_by_state ON jobs (state, run, priority);
+    '''
+    stages = ('test', 'fuzz', 'evaluate')
+
+    def __init__(self, path: Path, max_attempts: int = 3):
+        """
+        Args:
+            path (Path): Database file, created if missing. Must be on a file system every worker sees.
+            max_attempts (int): Times a job is claimed before it is given up as 'failed'. Defaults to 3.
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        self.local = threading.local()
+        self.connection().executescript(self.schema)
+
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            # transactions are opened explicitly, see `transaction`
+            conn = sqlite3.connect(str(self.path), timeout=60, isolation_level=None)
+            self.local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        conn = self.connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def enqueue(self, run: str, task_ids: Iterable[int], stage: str, priorities: Optional[dict[int, float]] = None,
+                reset: bool = False, **args):
+        """
+        Add a job for every task. Jobs already in the queue are kept as they are,
+        unless `reset` is set, which puts them back to pending.
+
+        Args:
+            run (str): Name of the run, i.e. `runs` of the workers' AppForge.
+            task_ids (Iterable[int]): IDs of the tasks.
+            stage (str): 'test', 'fuzz' or 'evaluate'.
+            priorities (Optional[dict[int, float]]): Jobs with a higher priority are claimed first,
+                ties in task order. Defaults to 0 for every task.
+            reset (bool): Whether to redo jobs that are already queued or done. Defaults to False.
+            **args: Arguments of the stage: 'budget' and 'stop' for fuzzing, 'combined' for 'evaluate'.
+
+        Returns:
+            int: Number of jobs added or reset.
+        """
+        assert stage in self.stages, f'No such stage {stage}!'
+        priorities = priorities or {}
+        rows = [(run, task, stage, json.dumps(args), priorities.get(task, 0.0), 'pending', time.time())
+                for task in task_ids]
+        verb = 'INSERT OR REPLACE' if reset else 'INSERT OR IGNORE'
+        with self.transaction() as conn:
+            before = conn.total_changes
+            conn.executemany(f'{verb} INTO jobs (run, task, stage, args, priority, state, updated) '
+                             'VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            return conn.total_changes - before
+
+    def requeue_expired(self, conn: Optional[sqlite3.Connection] = None):
+        """
+        Put jobs whose lease ran out back to pending, or give them up if they ran out of attempts.
+
+        Returns:
+            int: Number of jobs requeued or given up.
+        """
+        if conn is None:
+            with self.transaction() as conn:
+                return self.requeue_expired(conn)
+        now = time.time()
+        conn.execute("UPDATE jobs SET state='failed', error='lease lost', worker=NULL, updated=? "
+                     "WHERE state='leased' AND lease_until<? AND attempts>=?", (now, now, self.max_attempts))
+        given_up = conn.execute('SELECT changes()').fetchone()[0]
+        conn.execute("UPDATE jobs SET state='pending', worker=NULL, lease_until=NULL, updated=? "
+                     "WHERE state='leased' AND lease_until<?", (now, now))
+        return given_up + conn.execute('SELECT changes()').fetchone()[0]
+
+    def claim(self, worker: str, lease: float, run: Optional[str] = None):
+        """
+        Lease the pending job of the highest priority.
+
+        Args:
+            worker (str): Name of the claiming worker, unique across hosts.
+            lease (float): Seconds the job is the worker's without a heartbeat.
+            run (Optional[str]): Only claim jobs of this run. Defaults to None, any run.
+
+        Returns:
+            Optional[Job]: The job, or None if nothing is pending.
+        """
+        with self.transaction() as conn:
+            self.requeue_expired(conn)
+            query = "SELECT run, task, stage, args, attempts FROM jobs WHERE state='pending'"
+            params = ()
+            if run is not None:
+                query, params = query + ' AND run=?', (run,)
+            row = conn.execute(query + ' ORDER BY priority DESC, task LIMIT 1', params).fetchone()
+            if row is None:
+                return None
+            job = Job(row[0], row[1], row[2], json.loads(row[3]), row[4] + 1, worker)
+            conn.execute("UPDATE jobs SET state='leased', worker=?, lease_until=?, attempts=?, updated=? "
+                         'WHERE run=? AND task=? AND stage=?',
+                         (worker, time.time() + lease, job.attempts, time.time(), job.run, job.task, job.stage))
+        return job
+
+    def heartbeat(self, job: Job, lease: float):
+        """
+        Extend the lease of a job.
+
+        Returns:
+            bool: Whether the worker still holds the job. False if the lease ran out and
+                the job was requeued meanwhile.
+        """
+        with self.transaction() as conn:
+            conn.execute("UPDATE jobs SET lease_until=?, updated=? WHERE run=? AND task=? AND stage=? "
+                         "AND state='leased' AND worker=?",
+                         (time.time() + lease, time.time(), job.run, job.task, job.stage, job.worker))
+            return conn.execute('SELECT changes()').fetchone()[0] == 1
+
+    def complete(self, job: Job, result: dict):
+        """
+        Mark a job done with its result. A job that was requeued meanwhile is
+        completed all the same, as results of one stage do not depend on who ran it.
+        """
+        with self.transaction() as conn:
+            conn.execute("UPDATE jobs SET state='done', result=?, error=NULL, worker=?, lease_until=NULL, updated=? "
+                         "WHERE run=? AND task=? AND stage=? AND state!='done'",
+                         (json.dumps(result), job.worker, time.time(), job.run, job.task, job.stage))
+
+    def fail(self, job: Job, error: str):
+        """
+        Put a job that raised back to pending, or give it up if it ran out of attempts.
+        """
+        state = 'failed' if job.attempts >= self.max_attempts else 'pending'
+        with self.transaction() as conn:
+            conn.execute('UPDATE jobs SET state=?, error=?, worker=NULL, lease_until=NULL, updated=? '
+                         "WHERE run=? AND task=? AND stage=? AND state='leased' AND worker=?",
+                         (state, error, time.time(), job.run, job.task, job.stage, job.worker))
+
+    def counts(self, run: Optional[str] = None):
+        """
+        Returns:
+            dict[str, int]: Number of jobs in each state ('pending', 'leased', 'done', 'failed').
+        """
+        query, params = 'SELECT state, COUNT(*) FROM jobs', ()
+        if run is not None:
+            query, params = query + ' WHERE run=?', (run,)
+        return dict(self.connection().execute(query + ' GROUP BY state', params).fetchall())
+
+    def unfinished(self, run: Optional[str] = None):
+        counts = self.counts(run)
+        return counts.get('pending', 0) + counts.get('leased', 0)
+
+    def results(self, run: str, stage: str):
+        """
+        Returns:
+            dict[int, dict]: Results of the done jobs of a run and stage, keyed by task ID.
+        """
+        rows = self.connection().execute("SELECT task, result FROM jobs WHERE run=? AND stage=? AND state='done' "
+                                         'ORDER BY task', (run, stage))
+        return {task: json.loads(result) for task, result in rows}
+
+    def summary(self, run: str, stage: str):
+        """
+        Returns:
+            Optional[dict]: Results of the stage averaged as by `AppForge.evaluation`, or None if none is done.
+        """
+        results = self.results(run, stage)
+        if not results:
+            return None
+        ans = sumup_json(results)
+        if 'no_crash' in ans and ans.get('compile'):
+            ans['crash_rate'] = 1 - ans['no_crash'] / ans['compile']
+        return ans
+
+
+def run_job(forge: AppForge, job: Job):
+    budget, stop = job.args.get('budget'), job.args.get('stop')
+    if job.stage == 'test':
+        return forge.test(job.task)
+    if job.stage == 'fuzz':
+        return forge.fuzz(job.task, budget=budget, stop=stop)
+    return forge.evaluate_task(job.task, budget, stop, job.args.get('combined', False))
+
+
+def work(evaluator: Union[AppForge, DevicePool], queue: WorkQueue, worker: Optional[str] = None,
+         lease: float = 300, poll: float = 10, wait: bool = False):
+    """
+    Run jobs of the evaluator's run from the queue until there are none left,
+    one at a time on each device of the evaluator.
+
+    Results are saved by the devices as usual, i.e. into the task folders and the
+    result store under the shared base folder, and also reported to the queue.
+
+    Args:
+        evaluator (Union[AppForge, DevicePool]): The devices to work on. Only jobs of its `runs` are claimed.
+        queue (WorkQueue): The queue.
+        worker (Optional[str]): Name of this worker. Defaults to host name and pid.
+        lease (float): Seconds a job stays claimed without a heartbeat; heartbeats go
+            out every third of it. Defaults to 300.
+        poll (float): Seconds between claims while jobs are leased by other workers
+            or, with `wait`, while nothing is queued. Defaults to 10.
+        wait (bool): Whether to keep waiting for jobs when the queue is empty. Defaults to False.
+
+    Returns:
+        int: Number of jobs done.
+    """
+    worker = worker or f'{socket.gethostname()}-{os.getpid()}'
+    run = evaluator.runs
+    done = [0]
+    lock = threading.Lock()
+
+    def loop(forge: AppForge, name: str):
+        while True:
+            job = queue.claim(name, lease, run)
+            if job is None:
+                # leased jobs come back if their worker is lost
+                if wait or queue.unfinished(run):
+                    time.sleep(poll)
+                    continue
+                return
+            print(f'AppForge: {name} took {job.stage} of {job.task} (attempt {job.attempts})...')
+            stop = threading.Event()
+            def beat():
+                while not stop.wait(lease / 3):
+                    if not queue.heartbeat(job, lease):
+                        print(f'AppForge: {name} lost the lease of {job.stage} of {job.task}...')
+                        return
+            heart = threading.Thread(target=beat, daemon=True)
+            heart.start()
+            try:
+                result = run_job(forge, job)
+            except Exception:
+                queue.fail(job, traceback.format_exc())
+            else:
+                queue.complete(job, result)
+                with lock:
+                    done[0] += 1
+            finally:
+                stop.set()
+                heart.join()
+
+    if isinstance(evaluator, DevicePool):
+        def device_loop(i):
+            with evaluator.device() as forge:
+                loop(forge, f'{worker}-{i}')
+        threads = [threading.Thread(target=device_loop, args=(i,)) for i in range(len(evaluator))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    else:
+        loop(evaluator, worker)
+    return done[0]
+
+
+if __name__ == '__main__':
+    # python -m AppForge.workqueue <base_folder>: state of the queue of a base folder
+    import sys
+    base_folder = Path(sys.argv[1] if len(sys.argv) > 1 else 'runs')
+    queue = WorkQueue(base_folder / 'queue.db')
+    runs = [row[0] for row in queue.connection().execute('SELECT DISTINCT run FROM jobs ORDER BY run')]
+    for run in runs:
+        print(run, queue.counts(run))
@@ -0,0 +1,180 @@
+"""
+Micro-benchmarks of the Python side of AppForge on the fake backend.
+
+Runs synthetic runs of 101 and 10,000 tasks (or any sizes) through AppForge with
+a `FakeBackend` in place of the emulator and the Android SDK, and times the
+orchestration work: writing projects, log parsing, result caching, folder
+comparison and removal, and aggregation. Needs neither Docker nor an emulator.
+The build worker is timed against a process per build on a stand-in `build.py`
+that only imports what the real one does, i.e. without Gradle.
+
+    python benchmarks/orchestration.py --tasks 101 10000 --output bench.json
+    python benchmarks/orchestration.py --tasks 101 10000 --baseline bench.json --tolerance 0.3
+
+With `--baseline`, it exits with status 1 if any phase got slower than the
+baseline by more than the tolerance. Compare runs made with the same options;
+`--memory` in particular slows every phase down.
+"""
+from pathlib import Path
+import argparse, json, resource, shutil, subprocess, sys, tempfile, time, tracemalloc
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from AppForge import AppForge, FakeBackend, TaskRegistry, load_tasks
+from AppForge.build_worker import BuildWorker
+from AppForge.extracts import extract_error, extract_fuzz, extract_test
+from AppForge.utils import compare_folder, remove_directory, sumup_json
+
+
+def synthetic_sheet(n: int):
+    """
+    `n` tasks cycling through the entries of tasks.json, with distinct app keys.
+    """
+    sheet = load_tasks().sheet
+    return [{**sheet[i % len(sheet)], 'app_key': f"{sheet[i % len(sheet)]['app_key']}.s{i}"} for i in range(n)]
+
+
+def changed_files(task_id: int, attempt: int = 0):
+    activity = (f'package com.example.app{task_id};\n\npublic class MainActivity {{\n'
+                + ''.join(f'    int field{i} = {task_id + i + attempt};\n' for i in range(50)) + '}\n')
+    return {
+        'app/src/main/java/com/example/MainActivity.java': activity,
+        'app/src/main/res/layout/activity_main.xml': '<LinearLayout/>\n' * 20,
+        'app/src/main/res/values/strings.xml': f'<resources><string name="app_name">App {task_id}</string></resources>\n',
+    }
+
+
+# the imports of compiler/build.py, whose Gradle run the fake backend stands in for
+STUB_BUILD = '''\
+import argparse, json, os, re, shutil, subprocess, sys
+from pathlib import Path
+if __name__ == '__main__':
+    print('BUILD SUCCESSFUL')
+'''
+
+
+class Phases:
+    def __init__(self, memory: bool):
+        self.memory = memory
+        self.rows = []
+
+    def time(self, name: str, n: int, ops: int, fn):
+        if self.memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        fn()
+        seconds = time.perf_counter() - start
+        row = {'phase': name, 'tasks': n, 'ops': ops, 'seconds': seconds, 'ops_per_s': ops / seconds if seconds else 0.0,
+               'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+        if self.memory:
+            row['peak_mb'] = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+        self.rows.append(row)
+        print(f"{name:<24}{n:>8}{ops:>9}{seconds:>10.3f}s{row['ops_per_s']:>12.1f}/s{row['max_rss_mb']:>9.1f}MB"
+              + (f"{row['peak_mb']:>9.1f}MB" if self.memory else ''), flush=True)
+
+
+def run(n: int, phases: Phases, backend_kwargs: dict):
+    folder = Path(tempfile.mkdtemp(prefix='appforge-bench-'))
+    try:
+        sheet = []
+        phases.time('registry', n, n, lambda: sheet.extend(synthetic_sheet(n)))
+        registry = []
+        phases.time('registry_parse', n, n, lambda: registry.append(TaskRegistry(sheet)))
+        forge = AppForge('bench', base_folder=folder, emulator_id='emulator-5554', sdk_path=folder / 'sdk',
+                         bench_folder=folder / 'bench', backend=FakeBackend(**backend_kwargs))
+        forge.tasks, forge.task_sheet, forge.task_num = registry[0], sheet, n
+        task_ids = list(range(n))
+
+        phases.time('compile', n, n, lambda: [forge.compile_json_based_on_template(changed_files(i), i)
+                                              for i in task_ids])
+        # the second attempt discards the first project of every task
+        phases.time('recompile', n, n, lambda: [forge.compile_json_based_on_template(changed_files(i, 1), i)
+                                                for i in task_ids])
+        results = {}
+        phases.time('evaluation', n, 2 * n, lambda: results.update(forge.evaluation(task_ids)))
+        phases.time('evaluation_cached', n, 2 * n, lambda: forge.evaluation(task_ids))
+
+        logs = [(forge.compile_log(i).read_text(), forge.test_log(i).read_text(), forge.fuzz_log(i).read_text(),
+                 str(forge.apk_folder(i))) for i in task_ids]
+        phases.time('extract', n, 3 * n, lambda: [(extract_error(c, ignore_path_str=p), extract_test(t), extract_fuzz(f))
+                                                  for c, t, f, p in logs])
+        per_task = {i: {**json.loads(forge.result_path(i).read_text()), **json.loads(forge.fuzz_result_path(i).read_text())}
+                    for i in task_ids}
+        phases.time('sumup_json', n, n, lambda: sumup_json(per_task))
+
+        projects = [forge.project_folder(i) for i in task_ids if forge.project_folder(i).exists()]
+        reference = projects[0]
+        phases.time('compare_folder', n, len(projects), lambda: [compare_folder(p, reference) for p in projects])
+        phases.time('remove_directory', n, len(projects), lambda: [remove_directory(p) for p in projects])
+        phases.time('clean_up', n, 1, forge.clean_up)
+
+        stub = folder / 'build.py'
+        stub.write_text(STUB_BUILD)
+        builds = min(n, 200)
+        phases.time('build_process', n, builds, lambda: [subprocess.run([sys.executable, str(stub)], cwd=folder,
+                                                                        capture_output=True) for _ in range(builds)])
+        worker = BuildWorker(python=sys.executable)
+        try:
+            worker.start()
+            phases.time('build_worker', n, builds, lambda: [worker.run([sys.executable, str(stub)], folder)
+                                                            for _ in range(builds)])
+        finally:
+            worker.close()
+        return results
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def compare(rows: list[dict], baseline: list[dict], tolerance: float):
+    """
+    Returns:
+        list[str]: Phases slower than their baseline by more than `tolerance`.
+    """
+    before = {(row['phase'], row['tasks']): row for row in baseline}
+    slower = []
+    for row in rows:
+        old = before.get((row['phase'], row['tasks']))
+        if old and old['ops_per_s'] and row['ops_per_s'] < old['ops_per_s'] * (1 - tolerance):
+            slower.append(f"{row['phase']} ({row['tasks']} tasks): {row['ops_per_s']:.1f}/s, "
+                          f"was {old['ops_per_s']:.1f}/s")
+    return slower
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser('AppForge orchestration benchmarks')
+    ap.add_argument('--tasks', type=int, nargs='+', default=[101, 10000],
+                    help="sizes of the synthetic runs")
+    ap.add_argument('--log_lines', type=int, default=100,
+                    help="filler lines of every fake build and evaluation log")
+    ap.add_argument('--latency', type=float, default=0.0,
+                    help="seconds every fake command takes")
+    ap.add_argument('--recorded', default=None,
+                    help="task folder of a real run whose logs the fake backend replays")
+    ap.add_argument('--memory', action='store_true',
+                    help="also report peak Python allocations per phase (slower)")
+    ap.add_argument('--output', default=None,
+                    help="write the results as JSON")
+    ap.add_argument('--baseline', default=None,
+                    help="results JSON of an earlier run to compare throughput with")
+    ap.add_argument('--tolerance', type=float, default=0.3,
+                    help="share of baseline throughput a phase may lose")
+    args = ap.parse_args()
+
+    backend_kwargs = dict(log_lines=args.log_lines, latency=args.latency)
+    if args.recorded:
+        backend_kwargs['logs'] = FakeBackend.recorded(Path(args.recorded)).logs
+    phases = Phases(args.memory)
+    print(f"{'phase':<24}{'tasks':>8}{'ops':>9}{'time':>11}{'throughput':>14}{'max rss':>11}"
+          + (f"{'peak':>11}" if args.memory else ''))
+    for n in args.tasks:
+        print(f'evaluation of {n} tasks:', run(n, phases, backend_kwargs))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(phases.rows, file, indent=1)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            slower = compare(phases.rows, json.load(file), args.tolerance)
+        for line in slower:
+            print(f'Slower than baseline: {line}')
+        sys.exit(1 if slower else 0)
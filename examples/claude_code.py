@@ -1,6 +1,7 @@
 import os, shutil, json
 import subprocess
 from pathlib import Path
+from AppForge.utils import compare_folder
 
 class claude_code():
     def __init__(self, workspace, template_path, evaluator, task_id):
@@ -49,28 +50,7 @@ You should directly modify the file in the given file directory to implement the
 
         self.run(workspace, desc)
 
-        changed: dict[str, str] = {}
-        for root, _dirs, files in os.walk(workspace):
-            for name in files:
-                p = Path(root) / name
-                rel = str(p.relative_to(workspace))
-                src_file = src / rel
-
-                try:
-                    new_text = p.read_text(encoding="utf-8")
-                except Exception:
-                    continue
-
-                if not src_file.exists():
-                    changed[rel] = new_text
-                else:
-                    try:
-                        old_text = src_file.read_text(encoding="utf-8")
-                    except Exception:
-                        continue
-                    if new_text != old_text:
-                        changed[rel] = new_text
-
+        changed = compare_folder(workspace, src)
 
         return 'No raw log provided', changed
 
@@ -7,7 +7,9 @@ import subprocess
 import shutil
 # import appforge
 import AppForge
-from AppForge import AppForge
+from AppForge import AppForge, DevicePool, WorkQueue
+from AppForge.schedule import expected_seconds
+from AppForge.workqueue import work
 from simple import simple_output_parser,simple_agent
 
 if __name__ == "__main__":
@@ -21,7 +23,39 @@ if __name__ == "__main__":
     ap.add_argument('--docker_port', type=int, default=6080,
                     help="docker port")
     ap.add_argument("--emulator_id", default="emulator-5554",
-                    help="adb device id, such as 'emulator-5554'")
+                    help="adb device id, such as 'emulator-5554'; separate several ids with ',' to evaluate on all of them")
+    ap.add_argument('--num_devices', type=int, default=1,
+                    help="number of docker containers to evaluate on in parallel")
+    ap.add_argument('--container', default=None,
+                    help="name or id of a running AppForge container to attach to instead of starting one; separate several with ','")
+    ap.add_argument('--snapshot_volume', default=None,
+                    help="docker volume keeping the emulator's quick-boot snapshot between runs")
+    
+    ap.add_argument('--build_worker', action='store_true',
+                    help="compile through a long-lived build worker that keeps build.py loaded")
+    
+    ap.add_argument('--build_cache', action='store_true',
+                    help="reuse earlier builds of identical generated files")
+    ap.add_argument('--gradle_home', default=None,
+                    help="gradle user home warmed once, then shared read-only by every build and container as their offline dependency cache")
+    ap.add_argument('--template_baseline', action='store_true',
+                    help="build the template once and start every task build from a clone of it")
+    ap.add_argument('--fast_check', action='store_true',
+                    help="check generated files with aapt2 and javac before each gradle build; needs --template_baseline")
+    
+    ap.add_argument('--stream_logs', action='store_true',
+                    help="stream compile/test/fuzz output into log files instead of buffering it")
+    
+    ap.add_argument('--evaluator_server', action='store_true',
+                    help="run test/fuzz jobs through a long-lived evaluator server with a warm device connection")
+    
+    ap.add_argument('--trace', action='store_true',
+                    help="time every stage; writes runs/trace.json and a timings.json per task")
+    ap.add_argument('--profile_builds', action='store_true',
+                    help="time the Gradle tasks of every build; report with python -m AppForge.gradle")
+    
+    ap.add_argument('--result_store', action='store_true',
+                    help="also record results in the SQLite store base_folder/results.db")
     
     ap.add_argument('--base_folder', default = 'runs',
                     help="where to put generated apks")
@@ -44,6 +78,29 @@ if __name__ == "__main__":
     
     ap.add_argument('--fuzz', action='store_true',
                     help="whether to run tests only or tests and fuzz both")
+    ap.add_argument('--fuzz_budget', type=float, default=None,
+                    help="seconds after which each fuzzing session is stopped")
+    ap.add_argument('--fuzz_stop', default=None, choices=['first_crash', 'plateau'],
+                    help="stop each fuzzing session early on this condition")
+    ap.add_argument('--combined', action='store_true',
+                    help="test and fuzz each app in one session, installing it once")
+    ap.add_argument('--test_shards', type=int, default=1,
+                    help="spread the sub-features of each task's tests over this many devices")
+    
+    ap.add_argument('--compile_deadline', type=float, default=None,
+                    help="seconds after which a compile is killed and retried")
+    ap.add_argument('--test_deadline', type=float, default=None,
+                    help="seconds after which a test run is killed and retried")
+    ap.add_argument('--fuzz_deadline', type=float, default=None,
+                    help="seconds after which a fuzzing session is killed and retried")
+    ap.add_argument('--boot_deadline', type=float, default=None,
+                    help="seconds to wait for an emulator to boot")
+    ap.add_argument('--retries', type=int, default=1,
+                    help="how many times a stage that ran into its deadline is retried")
+    
+    ap.add_argument('--queue', default=None, choices=['enqueue', 'work'],
+                    help="enqueue the evaluation of the generated apps into base_folder/queue.db for workers on any host, "
+                         "or work on that queue instead of generating apps")
     
     ap.add_argument('--start_id', type=int, default=0,
                     help="range of tested apps (inclusive)")
@@ -52,18 +109,51 @@ if __name__ == "__main__":
     
     ap.add_argument('--self_fix_attempts', type=int, default=0,
                     help="self fix with compile feedback")
+    ap.add_argument('--incremental', action='store_true',
+                    help="rebuild self fix attempts incrementally in the previous attempt's project")
     
     args = ap.parse_args()
     args.template_path = 'compiler/templates/empty_activity'
     # exit(0)
     os.makedirs(args.base_folder,exist_ok=True)
+    emulator_ids = args.emulator_id.split(',')
+    if args.use_docker and args.container:
+        pooled = len(args.container.split(',')) > 1
+    else:
+        pooled = args.num_devices > 1 if args.use_docker else len(emulator_ids) > 1
+    if args.test_shards > 1 and not pooled:
+        ap.error('--test_shards needs several devices (--container, --num_devices or --emulator_id)')
+    forge_kwargs = dict(base_folder = Path(args.base_folder).resolve(), build_worker=args.build_worker,
+                        build_cache=args.build_cache, stream_logs=args.stream_logs,
+                        result_store=args.result_store, shared_store=bool(args.queue),
+                        evaluator_server=args.evaluator_server,
+                        deadlines={stage: seconds for stage, seconds in [('compile', args.compile_deadline),
+                                   ('test', args.test_deadline), ('fuzz', args.fuzz_deadline),
+                                   ('boot', args.boot_deadline)] if seconds},
+                        retries=args.retries, trace=args.trace,
+                        profile_builds=args.profile_builds,
+                        gradle_home=Path(args.gradle_home).resolve() if args.gradle_home else None,
+                        template_baseline=args.template_baseline, fast_check=args.fast_check)
     if args.use_docker:
-        evaluator = AppForge(args.runs, base_folder = Path(args.base_folder).resolve(), use_docker=True, \
-            docker_name=args.docker_name, docker_port=args.docker_port)
+        forge_kwargs.update(use_docker=True, docker_name=args.docker_name, docker_port=args.docker_port,
+                            snapshot_volume=args.snapshot_volume)
     else:
         assert args.sdk_path and args.bench_folder, 'Android SDK and Benchmark folder not provided!'
-        evaluator = AppForge(args.runs, base_folder = Path(args.base_folder).resolve(), emulator_id=args.emulator_id,\
-            bench_folder = Path(args.bench_folder).resolve(),sdk_path = Path(args.sdk_path).resolve())
+        forge_kwargs.update(bench_folder = Path(args.bench_folder).resolve(), sdk_path = Path(args.sdk_path).resolve())
+    if args.use_docker and args.container:
+        containers = args.container.split(',')
+        if len(containers) > 1:
+            evaluator = DevicePool(args.runs, containers=containers, **forge_kwargs)
+        else:
+            evaluator = AppForge(args.runs, container=args.container, **forge_kwargs)
+    elif args.use_docker and args.num_devices > 1:
+        evaluator = DevicePool(args.runs, docker_num=args.num_devices, **forge_kwargs)
+    elif args.use_docker:
+        evaluator = AppForge(args.runs, **forge_kwargs)
+    elif len(emulator_ids) > 1:
+        evaluator = DevicePool(args.runs, emulator_ids=emulator_ids, **forge_kwargs)
+    else:
+        evaluator = AppForge(args.runs, emulator_id=args.emulator_id, **forge_kwargs)
     
     base_folder_path = Path(args.base_folder)
     done = {}
@@ -77,7 +167,7 @@ if __name__ == "__main__":
         
     try:
         for task_id in range(args.start_id,args.end_id+1):
-            if task_id in done:
+            if task_id in done or args.queue == 'work':
                 continue
             
             if args.model == 'qwen3coder':
@@ -103,12 +193,28 @@ if __name__ == "__main__":
                 if compile_error is None:
                     break
                 raw_log, changed = simpleAgent.repair(compile_error)
-                compile_error = evaluator.compile_json_based_on_template(changed, task_id, raw_log=raw_log)
+                compile_error = evaluator.compile_json_based_on_template(changed, task_id, raw_log=raw_log,
+                                                                         incremental=args.incremental)
             done[task_id] = True
-        if args.fuzz:
-            print(evaluator.evaluation(list(done.keys())))
+        # sharding needs a DevicePool, which the argument check above guarantees
+        shard_kwargs = dict(test_shards=args.test_shards) if isinstance(evaluator, DevicePool) else {}
+        if args.queue:
+            queue, stage = WorkQueue(base_folder_path / 'queue.db'), 'evaluate' if args.fuzz else 'test'
+            if args.queue == 'enqueue':
+                # longest expected jobs first, so no host ends the run alone on a long task
+                forge = evaluator.devices[0] if isinstance(evaluator, DevicePool) else evaluator
+                priorities = expected_seconds(done.keys(), stage, forge.tasks, forge.store, args.runs, args.fuzz_budget)
+                queue.enqueue(args.runs, list(done.keys()), stage, priorities=priorities, budget=args.fuzz_budget,
+                              stop=args.fuzz_stop, combined=args.combined)
+                print(queue.counts(args.runs))
+            else:
+                work(evaluator, queue)
+                print(queue.summary(args.runs, stage))
+        elif args.fuzz:
+            print(evaluator.evaluation(list(done.keys()), fuzz_budget=args.fuzz_budget, fuzz_stop=args.fuzz_stop,
+                                       combined=args.combined, **shard_kwargs))
         else:
-            print(evaluator.evaluation_only_test(list(done.keys())))
+            print(evaluator.evaluation_only_test(list(done.keys()), **shard_kwargs))
     finally:
         with open(base_folder_path / str(args.runs) / 'done.json', 'w+') as file:
             json.dump(done, file)
@@ -6,9 +6,12 @@ setup(
     description='A benchmark for app generation',
     author='Your Name',
     author_email='your.email@example.com',
-    packages=['AppForge'],
+    packages=['AppForge', 'AppForge.tasks'],
+    # tasks.json is kept at the top of the source tree and shipped as AppForge/tasks/tasks.json
+    package_dir={'AppForge.tasks': 'tasks'},
     package_data={
-        '': ['tasks/tasks.json','compiler/*'],
+        '': ['compiler/*'],
+        'AppForge.tasks': ['tasks.json'],
     },
     install_requires=[
             "docker",
@@ -28,5 +31,8 @@ setup(
         'local': [  # local emulator
 
         ],
+        'test': [  # python -m pytest tests
+            "pytest",
+        ],
     }
 )
\ No newline at end of file
@@ -0,0 +1,47 @@
+import pytest
+
+from AppForge import AppForge, FakeBackend
+
+
+EMULATORS = ('emulator-5554', 'emulator-5556', 'emulator-5558')
+
+
+def changed_files(task_id: int, attempt: int = 0):
+    """
+    Generated files of a small app, distinct per task and attempt.
+    """
+    return {
+        'app/src/main/java/com/example/template/MainActivity.java':
+            f'package com.example.template;\n\npublic class MainActivity {{ int task = {task_id}; '
+            f'int attempt = {attempt}; }}\n',
+        'app/src/main/res/values/strings.xml': f'<resources><string name="app_name">App {task_id}</string></resources>\n',
+    }
+
+
+class NoBuildOverProjects(FakeBackend):
+    """
+    A `build.py` that crashes, without an error block, if the project folder exists.
+    """
+    def build(self, project, changed):
+        if project.exists():
+            return self.pad('build', f"Traceback (most recent call last):\nFileExistsError: '{project}'\n")
+        return super().build(project, changed)
+
+
+@pytest.fixture
+def make_forge(tmp_path):
+    """
+    Factory of AppForge instances (or of `cls`) running on a FakeBackend in a temporary
+    base folder, cleaned up after the test.
+    """
+    forges = []
+
+    def make(cls=AppForge, backend=None, emulator_id=EMULATORS[0], **kwargs):
+        forge = cls('test', base_folder=tmp_path, emulator_id=emulator_id, sdk_path=tmp_path / 'sdk',
+                    bench_folder=tmp_path / 'bench', backend=backend or FakeBackend(devices=EMULATORS), **kwargs)
+        forges.append(forge)
+        return forge
+
+    yield make
+    for forge in forges:
+        forge.clean_up()
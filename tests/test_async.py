@@ -0,0 +1,93 @@
+import asyncio
+import subprocess
+import time
+from pathlib import Path
+
+import pytest
+
+from AppForge import AsyncAppForge, FakeBackend
+
+from conftest import EMULATORS, changed_files
+
+
+def running(pid):
+    """
+    Whether a process exists and is not a zombie waiting to be reaped.
+    """
+    try:
+        return Path(f'/proc/{pid}/stat').read_text().rsplit(')', 1)[1].split()[0] != 'Z'
+    except FileNotFoundError:
+        return False
+
+
+def wait_for_file(path):
+    for _ in range(100):
+        if path.exists() and path.read_text().strip():
+            return path.read_text().strip()
+        time.sleep(0.02)
+    raise TimeoutError(path)
+
+
+def test_cancelled_command_is_killed_with_its_children(make_forge, tmp_path):
+    forge = make_forge(AsyncAppForge)
+    pid_file = tmp_path / 'child.pid'
+
+    async def main():
+        task = asyncio.create_task(forge.exec_cmd_async(['sh', '-c', f'sleep 30 & echo $! > {pid_file}; wait']))
+        await asyncio.to_thread(wait_for_file, pid_file)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    asyncio.run(main())
+    assert not running(int(pid_file.read_text()))
+
+
+def test_cancelled_stream_is_killed(make_forge, tmp_path):
+    forge = make_forge(AsyncAppForge, stream_logs=True)
+    pid_file = tmp_path / 'child.pid'
+
+    async def main():
+        task = asyncio.create_task(forge.exec_stream_async(
+            ['sh', '-c', f'echo started; sleep 30 & echo $! > {pid_file}; wait'], None, tmp_path / 'log',
+            forge.error_parser(0)))
+        await asyncio.to_thread(wait_for_file, pid_file)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    asyncio.run(main())
+    assert not running(int(pid_file.read_text()))
+
+
+def test_command_past_its_timeout_is_killed(make_forge):
+    forge = make_forge(AsyncAppForge)
+    start = time.time()
+    with pytest.raises(subprocess.TimeoutExpired):
+        asyncio.run(forge.exec_cmd_async(['sleep', '30'], timeout=0.2))
+    assert time.time() - start < 5
+
+
+def test_offline_emulator(make_forge):
+    forge = make_forge(AsyncAppForge, backend=FakeBackend(devices=EMULATORS[1:]))
+    with pytest.raises(AssertionError):
+        asyncio.run(forge.ensure_emulator_async())
+
+
+def test_compile_file_work_does_not_block_the_loop(make_forge, monkeypatch):
+    forge = make_forge(AsyncAppForge, backend=FakeBackend(devices=EMULATORS, fail_rate=0))
+    prepare = forge._prepare_compile
+
+    def slow_prepare(*args):
+        time.sleep(0.3)
+        return prepare(*args)
+    monkeypatch.setattr(forge, '_prepare_compile', slow_prepare)
+
+    async def main():
+        ticks = 0
+        task = asyncio.create_task(forge.compile_async(changed_files(0), 0))
+        while not task.done():
+            await asyncio.sleep(0.01)
+            ticks += 1
+        return await task, ticks
+    error, ticks = asyncio.run(main())
+    assert error is None and forge.direct_apk_path(0).exists()
+    assert ticks >= 10
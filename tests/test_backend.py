@@ -0,0 +1,52 @@
+import importlib.util
+from pathlib import Path
+
+from AppForge import FakeBackend
+
+from conftest import EMULATORS, changed_files
+
+
+def load_benchmarks():
+    path = Path(__file__).resolve().parent.parent / 'benchmarks' / 'orchestration.py'
+    spec = importlib.util.spec_from_file_location('orchestration', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_fake_outcomes_depend_only_on_the_generated_files(make_forge):
+    results = []
+    for emulator_id in EMULATORS[:2]:
+        forge = make_forge(backend=FakeBackend(devices=EMULATORS, fail_rate=0.5), emulator_id=emulator_id)
+        results.append([forge.compile_json_based_on_template(changed_files(task), task) is None
+                        for task in range(8)])
+    assert results[0] == results[1] and True in results[0] and False in results[0]
+
+
+def test_recorded_backend_replays_the_logs_of_a_run(make_forge, tmp_path):
+    (tmp_path / 'recorded').mkdir()
+    (tmp_path / 'recorded' / 'test.log').write_text("{'success': True}\n{'success': False}\n")
+    backend = FakeBackend.recorded(tmp_path / 'recorded', devices=EMULATORS, fail_rate=0, log_lines=0)
+    forge = make_forge(backend=backend)
+    assert forge.compile_json_based_on_template(changed_files(0), 0) is None
+    assert forge.test(0)['test'] == 0.5
+
+
+def test_killed_command_stops_streaming():
+    backend = FakeBackend(log_lines=1000, chunk_bytes=64)
+    pid, chunks = backend.submit(['adb', 'devices'], None)
+    next(chunks)
+    backend.kill(pid)
+    assert list(chunks) == []
+
+
+def test_benchmark_runs_every_phase_and_flags_slower_ones():
+    orchestration = load_benchmarks()
+    phases = orchestration.Phases(memory=False)
+    orchestration.run(3, phases, {'log_lines': 10})
+    names = [row['phase'] for row in phases.rows]
+    assert names[:4] == ['registry', 'registry_parse', 'compile', 'recompile']
+    assert {'evaluation', 'compare_folder', 'build_process', 'build_worker'} <= set(names)
+    baseline = [{**row, 'ops_per_s': row['ops_per_s'] * 2} for row in phases.rows]
+    assert len(orchestration.compare(phases.rows, baseline, 0.3)) == len(phases.rows)
+    assert orchestration.compare(phases.rows, phases.rows, 0.3) == []
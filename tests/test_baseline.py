@@ -0,0 +1,32 @@
+from AppForge import FakeBackend
+from AppForge.gradle import WARMUP_CHANGED
+
+from conftest import EMULATORS, NoBuildOverProjects, changed_files
+
+
+def test_task_builds_are_seeded_with_baseline_intermediates(make_forge):
+    forge = make_forge(backend=FakeBackend(devices=EMULATORS, fail_rate=0), template_baseline=True)
+    assert forge.baseline.changed == WARMUP_CHANGED
+    intermediates = forge.baseline.project / 'app' / 'build' / 'intermediates'
+    (intermediates / 'baseline_only.txt').write_text('from the baseline\n')
+    assert forge.compile_json_based_on_template(changed_files(0), 0) is None
+    project = forge.project_folder(0)
+    assert (project / 'app' / 'build' / 'intermediates' / 'baseline_only.txt').exists()
+    # the APK is the task's own, not the baseline's
+    baseline_apk = forge.baseline.project / 'app' / 'build' / 'outputs' / 'apk' / 'debug' / 'app-debug.apk'
+    assert forge.direct_apk_path(0).read_bytes() != baseline_apk.read_bytes()
+    # the baseline is built once per identity
+    other = make_forge(backend=forge.backend, emulator_id=EMULATORS[1], template_baseline=True)
+    assert other.baseline.folder == forge.baseline.folder
+    assert (intermediates / 'baseline_only.txt').exists()
+
+
+def test_silent_failure_over_seeded_project_stops_seeding(make_forge):
+    forge = make_forge(backend=NoBuildOverProjects(devices=EMULATORS, fail_rate=0), template_baseline=True)
+    assert forge.baseline is not None
+    assert forge.compile_json_based_on_template(changed_files(0), 0) is None
+    assert forge.direct_apk_path(0).exists() and not forge.reuse_projects
+    assert 'FileExistsError' not in forge.compile_log(0).read_text()
+    (forge.baseline.project / 'app' / 'build' / 'intermediates' / 'baseline_only.txt').write_text('seeded\n')
+    assert forge.compile_json_based_on_template(changed_files(1), 1) is None
+    assert not (forge.project_folder(1) / 'app' / 'build' / 'intermediates' / 'baseline_only.txt').exists()
@@ -0,0 +1,38 @@
+import sys
+
+import pytest
+
+from AppForge.build_worker import BuildWorker
+
+BUILD = '''\
+import sys, time
+import heavy
+if __name__ == '__main__':
+    print('built', sys.argv[1:], flush=True)
+    time.sleep(float(sys.argv[1]))
+'''
+
+
+@pytest.fixture
+def worker(tmp_path):
+    (tmp_path / 'build.py').write_text(BUILD)
+    # records every time the worker imports it
+    (tmp_path / 'heavy.py').write_text(f"open({str(tmp_path / 'imports')!r}, 'a').write('x')\n")
+    worker = BuildWorker(python=sys.executable)
+    yield worker
+    worker.close()
+
+
+def test_builds_share_the_imports_of_one_interpreter(worker, tmp_path):
+    cmd = [sys.executable, str(tmp_path / 'build.py')]
+    assert worker.run(cmd + ['0'], tmp_path) == "built ['0']\n"
+    assert worker.run(cmd + ['0'], tmp_path) == "built ['0']\n"
+    assert (tmp_path / 'imports').read_text() == 'x'
+
+
+def test_timed_out_build_restarts_the_worker(worker, tmp_path):
+    cmd = [sys.executable, str(tmp_path / 'build.py')]
+    with pytest.raises(TimeoutError):
+        worker.run(cmd + ['30'], tmp_path, timeout=1)
+    assert not worker.busy()
+    assert worker.run(cmd + ['0'], tmp_path) == "built ['0']\n"
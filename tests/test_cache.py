@@ -0,0 +1,102 @@
+import os
+import shutil
+
+from AppForge import cache as cache_module
+from AppForge.cache import BuildCache, sdk_identity
+
+
+CHANGED = {
+    'app/src/main/java/com/example/template/MainActivity.java': 'class MainActivity {}\n',
+    'app/src/main/res/values/strings.xml': '<resources/>\n',
+}
+
+
+def put(cache, tmp_path, changed, output='BUILD SUCCESSFUL\n', apk=b'apk'):
+    apk_path = None
+    if apk is not None:
+        apk_path = tmp_path / 'built.apk'
+        apk_path.write_bytes(apk)
+    key = cache.key(changed)
+    cache.put(key, output, apk_path, '/runs/r/0', '/runs/r/0/project')
+    return key
+
+
+def test_key_ignores_order_and_depends_on_content_and_identity(tmp_path):
+    cache = BuildCache(tmp_path / 'cache', 'sdk:template')
+    assert cache.key(CHANGED) == cache.key(dict(reversed(list(CHANGED.items()))))
+    assert cache.key(CHANGED) != cache.key({**CHANGED, 'app/src/main/res/values/strings.xml': '<resources></resources>\n'})
+    assert cache.key(CHANGED) != BuildCache(tmp_path / 'other', 'sdk2:template').key(CHANGED)
+
+
+def test_get_restores_apk_and_task_paths(tmp_path):
+    cache = BuildCache(tmp_path / 'cache', 'sdk:template')
+    key = put(cache, tmp_path, CHANGED, output='/runs/r/0/project/app/A.java:1: warning\n/runs/r/0/compile.log\n')
+    apk_path = tmp_path / 'task' / 'app-debug.apk'
+    output = cache.get(key, apk_path, '/runs/r/7', '/runs/r/7/project')
+    assert output == '/runs/r/7/project/app/A.java:1: warning\n/runs/r/7/compile.log\n'
+    assert apk_path.read_bytes() == b'apk'
+    assert cache.get(cache.key({}), apk_path, '/runs/r/7', '/runs/r/7/project') is None
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+FAILED = '编译失败\n/runs/r/0/project/app/A.java:3: error: cannot find symbol\nBUILD FAILED\n'
+
+
+def test_failed_build_has_no_apk(tmp_path):
+    cache = BuildCache(tmp_path / 'cache', 'sdk:template')
+    key = put(cache, tmp_path, CHANGED, output=FAILED, apk=None)
+    apk_path = tmp_path / 'task' / 'app-debug.apk'
+    assert cache.get(key, apk_path, '/runs/r/1', '/runs/r/1/project') == FAILED.replace('/r/0/', '/r/1/')
+    assert not apk_path.exists()
+
+
+def test_failure_without_compiler_errors_is_not_cached(tmp_path):
+    cache = BuildCache(tmp_path / 'cache', 'sdk:template')
+    output = "编译失败\nCould not resolve androidx.core:core:1.9.0.\nBUILD FAILED\n"
+    key = put(cache, tmp_path, CHANGED, output=output, apk=None)
+    assert cache.get(key, tmp_path / 'out.apk', '/runs/r/1', '/runs/r/1/project') is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_entry_evicted_while_read_is_a_miss(tmp_path, monkeypatch):
+    cache = BuildCache(tmp_path / 'cache', 'sdk:template')
+    key = put(cache, tmp_path, CHANGED)
+    evicting = BuildCache(tmp_path / 'cache', 'sdk:template', max_bytes=0)
+    real_copyfile = shutil.copyfile
+
+    def copyfile(src, dst):
+        # another instance evicts the entry halfway through the copy
+        dst.write_bytes(b'a')
+        evicting.evict()
+        return real_copyfile(src, dst)
+    monkeypatch.setattr(cache_module.shutil, 'copyfile', copyfile)
+    apk_path = tmp_path / 'task' / 'app-debug.apk'
+    assert cache.get(key, apk_path, '/runs/r/1', '/runs/r/1/project') is None
+    assert not apk_path.exists()
+    assert cache.stats()['hits'] == 0 and cache.stats()['misses'] == 1
+    assert list((tmp_path / 'cache').iterdir()) == []
+
+
+def test_evicts_least_recently_used_beyond_bound(tmp_path):
+    # every entry holds a 100-byte APK and a short log
+    cache = BuildCache(tmp_path / 'cache', 'sdk:template', max_bytes=250)
+    keys = []
+    for i in range(2):
+        keys.append(put(cache, tmp_path, {'A.java': str(i)}, output='ok\n', apk=b'x' * 100))
+        os.utime(tmp_path / 'cache' / keys[-1] / 'compile.log', (1000 + i, 1000 + i))
+    # using the older entry makes the newer one the least recently used
+    assert cache.get(keys[0], tmp_path / 'out.apk', '/runs/r/0', '/runs/r/0/project') == 'ok\n'
+    keys.append(put(cache, tmp_path, {'A.java': '2'}, output='ok\n', apk=b'x' * 100))
+    assert sorted(entry.name for _, _, entry in cache.entries()) == sorted([keys[0], keys[2]])
+    assert cache.stats()['bytes'] <= 250
+
+
+def test_sdk_identity_reads_package_revisions(tmp_path):
+    build_tools = tmp_path / 'build-tools' / '34.0.0'
+    build_tools.mkdir(parents=True)
+    (build_tools / 'source.properties').write_text('Pkg.Desc=Android SDK Build-Tools 34\nPkg.Revision=34.0.0\n')
+    (tmp_path / 'platforms' / 'android-34').mkdir(parents=True)
+    identity = sdk_identity(tmp_path)
+    assert identity == 'build-tools/34.0.0=34.0.0,platforms/android-34=android-34'
+    (build_tools / 'source.properties').write_text('Pkg.Revision=34.0.1\n')
+    assert sdk_identity(tmp_path) != identity
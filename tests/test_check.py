@@ -0,0 +1,53 @@
+from AppForge import FakeBackend, FastCheck
+
+from conftest import EMULATORS, changed_files
+
+
+MAIN = 'app/src/main/java/com/example/template/MainActivity.java'
+
+
+class GrepCheck(FastCheck):
+    """
+    Fails sources that use `Foo`, the way the real check prints a javac error.
+    """
+    def __init__(self):
+        super().__init__('aapt2', 'javac', 'android.jar', [], 'resources.zip')
+
+    def cmd(self):
+        return ['sh', '-c', 'test -f app/src/main/AndroidManifest.xml || echo "no manifest"; '
+                            f'if grep -q Foo {MAIN}; then echo 编译失败; '
+                            f'echo "$PWD/{MAIN}:3: error: cannot find symbol"; echo BUILD FAILED; '
+                            'else echo "Fast check passed"; fi']
+
+
+def checked_forge(make_forge):
+    forge = make_forge(backend=FakeBackend(devices=EMULATORS, fail_rate=0))
+    forge.checker = GrepCheck()
+    return forge
+
+
+def test_failed_check_reports_like_the_build_without_building(make_forge):
+    forge = checked_forge(make_forge)
+    changed = {**changed_files(0), MAIN: 'class MainActivity { Foo foo; }\n'}
+    error = forge.compile_json_based_on_template(changed, 0)
+    assert error == f'/0/{MAIN}:3: error: cannot find symbol\nBUILD FAILED'
+    assert [(d.file, d.line) for d in forge.compile_diagnostics(0)] == [(f'0/{MAIN}', 3)]
+    # build.py never ran, and the scratch copy is gone
+    assert not forge.project_folder(0).exists()
+    assert not (forge.apk_folder(0) / 'check').exists()
+
+
+def test_passed_check_goes_on_to_the_build(make_forge):
+    forge = checked_forge(make_forge)
+    assert forge.compile_json_based_on_template(changed_files(0), 0) is None
+    assert forge.direct_apk_path(0).exists()
+    assert 'no manifest' not in forge.compile_log(0).read_text()
+    assert not (forge.apk_folder(0) / 'check').exists()
+
+
+def test_gradle_files_skip_the_check(make_forge):
+    forge = checked_forge(make_forge)
+    changed = {**changed_files(0), MAIN: 'class MainActivity { Foo foo; }\n', 'app/build.gradle': 'plugins {}\n'}
+    assert not FastCheck.covers(changed)
+    assert not FastCheck.covers({'gradle/wrapper/gradle-wrapper.properties': ''})
+    assert forge.compile_json_based_on_template(changed, 0) is None
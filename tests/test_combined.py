@@ -0,0 +1,59 @@
+from AppForge import FakeBackend, extracts
+from AppForge.extracts import FUZZ_PHASE_MARKER
+
+from conftest import EMULATORS, changed_files
+
+
+TEST_KEYS = ['compile', 'test', 'all_pass']
+FUZZ_KEYS = ['no_crash', 'native', 'java', 'anr', 'failtostart']
+
+
+class NoCombinedMode(FakeBackend):
+    usage = 'usage: evaluate_app.py --apk-path APK_PATH [--test {no_fuzz,only_fuzz}]\n'
+
+
+class NoMarker(FakeBackend):
+    def output(self, cmd, workdir):
+        return super().output(cmd, workdir).replace(FUZZ_PHASE_MARKER + '\n', '')
+
+
+def separate(forge, task_id):
+    """
+    What separate test and fuzz runs of the task report.
+    """
+    results = []
+    for test, parser in [('no_fuzz', extracts.TestParser()), ('only_fuzz', extracts.FuzzParser())]:
+        parser.feed(forge.backend.output(forge.evaluate_cmd(task_id, test), forge.bench_path()))
+        results.append(parser.result())
+    return results
+
+
+def test_combined_session_matches_separate_runs(make_forge):
+    forge = make_forge(backend=FakeBackend(devices=EMULATORS, fail_rate=0, crash_rate=1.0))
+    for task_id in range(4):
+        assert forge.compile_json_based_on_template(changed_files(task_id), task_id) is None
+        result = forge.test_and_fuzz(task_id)
+        assert forge.session_log(task_id).exists()
+        test, fuzz = separate(forge, task_id)
+        assert {key: result[key] for key in TEST_KEYS} == test
+        assert {key: result[key] for key in FUZZ_KEYS} == {key: fuzz[key] for key in FUZZ_KEYS}
+
+
+def test_without_combined_mode_runs_separately(make_forge):
+    forge = make_forge(backend=NoCombinedMode(devices=EMULATORS, fail_rate=0))
+    assert forge.compile_json_based_on_template(changed_files(0), 0) is None
+    assert not forge.supports_combined()
+    result = forge.test_and_fuzz(0)
+    assert not forge.session_log(0).exists()
+    assert forge.test_log(0).exists() and forge.fuzz_log(0).exists()
+    test, fuzz = separate(forge, 0)
+    assert {key: result[key] for key in TEST_KEYS} == test
+
+
+def test_session_without_marker_fuzzes_separately(make_forge):
+    forge = make_forge(backend=NoMarker(devices=EMULATORS, fail_rate=0, crash_rate=1.0))
+    assert forge.compile_json_based_on_template(changed_files(0), 0) is None
+    result = forge.test_and_fuzz(0)
+    assert forge.fuzz_log(0).exists()
+    test, fuzz = separate(forge, 0)
+    assert {key: result[key] for key in FUZZ_KEYS} == {key: fuzz[key] for key in FUZZ_KEYS}
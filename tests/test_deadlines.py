@@ -0,0 +1,99 @@
+import asyncio
+import subprocess
+import time
+from pathlib import Path
+
+import pytest
+
+from AppForge import AppForge, AsyncAppForge, FakeBackend
+
+from conftest import EMULATORS, changed_files
+
+
+class SlowBuilds(FakeBackend):
+    """
+    Hangs the first `slow` builds for half a second.
+    """
+    def __init__(self, slow: int, **kwargs):
+        super().__init__(**kwargs)
+        self.slow = slow
+        self.builds = 0
+
+    def chunks(self, pid, cmd, workdir):
+        if len(cmd) > 1 and Path(cmd[1]).name == 'build.py':
+            with self.lock:
+                self.builds += 1
+                slow = self.builds <= self.slow
+            if slow:
+                time.sleep(0.5)
+                # a killed build does not get to write its APK
+                with self.lock:
+                    if pid in self.killed:
+                        self.killed.discard(pid)
+                        return
+        yield from super().chunks(pid, cmd, workdir)
+
+
+def build(forge, task_id):
+    if isinstance(forge, AsyncAppForge):
+        return asyncio.run(forge.compile_async(changed_files(task_id), task_id))
+    return forge.compile_json_based_on_template(changed_files(task_id), task_id)
+
+
+@pytest.mark.parametrize('cls', [AppForge, AsyncAppForge])
+def test_retry_after_timed_out_build_succeeds(make_forge, cls):
+    backend = SlowBuilds(1, devices=EMULATORS, fail_rate=0)
+    forge = make_forge(cls, backend=backend, deadlines={'compile': 0.2}, retries=1, result_store=True)
+    assert build(forge, 0) is None
+    assert backend.builds == 2
+    assert forge.direct_apk_path(0).exists()
+    row = forge.store.row(forge.runs, 0, 'compile')
+    assert row['metrics']['compile'] == 1 and row['metrics']['timeout'] == 0
+
+
+@pytest.mark.parametrize('cls', [AppForge, AsyncAppForge])
+def test_every_build_timed_out(make_forge, cls):
+    backend = SlowBuilds(2, devices=EMULATORS, fail_rate=0)
+    forge = make_forge(cls, backend=backend, deadlines={'compile': 0.2}, retries=1, result_store=True)
+    error = build(forge, 0)
+    assert error == 'Compile timed out after 0.2s!\n'
+    assert backend.builds == 2
+    assert forge.compile_log(0).read_text().endswith(error)
+    assert not forge.direct_apk_path(0).exists()
+    row = forge.store.row(forge.runs, 0, 'compile')
+    assert row['metrics'] == {'compile': 0, 'error': error, 'timeout': 1}
+
+
+class RecordingBackend(FakeBackend):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.cmds = []
+
+    def output(self, cmd, workdir):
+        self.cmds.append(cmd)
+        return super().output(cmd, workdir)
+
+
+def test_timed_out_compile_stops_the_daemons_of_its_own_gradle_home(make_forge, tmp_path):
+    forge = make_forge(backend=FakeBackend(devices=EMULATORS, fail_rate=0))
+    forge.build_env['GRADLE_USER_HOME'] = str(tmp_path / 'home')
+    daemons = [subprocess.Popen(['sh', '-c', 'sleep 30; :', f'{home}/wrapper/dists/gradle-8/lib/gradle-launcher.jar',
+                                 'org.gradle.launcher.daemon.bootstrap.GradleDaemon'])
+               for home in [tmp_path / 'home', tmp_path / 'other']]
+    try:
+        time.sleep(0.1)
+        forge.recover('compile', 0)
+        assert daemons[0].wait(timeout=5) == -9
+        assert daemons[1].poll() is None
+    finally:
+        for daemon in daemons:
+            daemon.kill()
+            daemon.wait()
+
+
+def test_timed_out_compile_in_shared_gradle_home_stops_daemons_with_gradlew(make_forge):
+    backend = RecordingBackend(devices=EMULATORS, fail_rate=0)
+    forge = make_forge(backend=backend)
+    assert forge.compile_json_based_on_template(changed_files(0), 0) is None
+    forge.recover('compile', 0)
+    assert backend.cmds[-1] == [str(forge.project_folder(0) / 'gradlew'), '--stop']
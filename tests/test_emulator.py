@@ -0,0 +1,51 @@
+import pytest
+
+from AppForge import FakeBackend
+from AppForge import appforge as appforge_module
+
+from conftest import EMULATORS
+
+
+class BootingBackend(FakeBackend):
+    """
+    An emulator that reports sys.boot_completed after `probes` boot probes, and
+    whose package manager only answers after that.
+    """
+    def __init__(self, probes, **kwargs):
+        super().__init__(**kwargs)
+        self.probes = probes
+
+    def adb(self, cmd):
+        if 'getprop' in cmd:
+            self.probes -= 1
+            return '1\n' if self.probes < 0 else '\n'
+        if 'pm' in cmd and self.probes >= 0:
+            return 'Error: could not access the Package Manager. Is the system running?\n'
+        return super().adb(cmd)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+    monkeypatch.setattr(appforge_module.time, 'sleep', slept.append)
+    return slept
+
+
+def test_waits_for_boot_with_exponential_backoff(make_forge, sleeps):
+    forge = make_forge(backend=BootingBackend(7, devices=EMULATORS))
+    assert not forge.emulator_ready()
+    forge.wait_for_emulator(deadline=600)
+    assert sleeps == [1, 2, 4, 8, 16, 30]
+    assert forge.emulator_ready()
+
+
+def test_emulator_not_ready_by_the_deadline(make_forge, sleeps):
+    forge = make_forge(backend=BootingBackend(10**6, devices=EMULATORS))
+    with pytest.raises(TimeoutError, match='not ready'):
+        forge.wait_for_emulator(deadline=0)
+
+
+def test_offline_emulator_is_not_ready(make_forge):
+    forge = make_forge(backend=FakeBackend(devices=EMULATORS))
+    forge.backend.devices = ()
+    assert not forge.emulator_ready()
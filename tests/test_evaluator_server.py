@@ -0,0 +1,51 @@
+import os
+import stat
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+
+from AppForge.evaluator_server import EvaluatorServer
+
+SCRIPT = '''\
+import sys, time
+if __name__ == '__main__':
+    print('start', sys.argv[1], flush=True)
+    time.sleep(float(sys.argv[2]))
+    print('done', sys.argv[1], flush=True)
+'''
+
+
+@pytest.fixture
+def server():
+    # Unix socket paths are short, keep clear of pytest's long tmp_path
+    with tempfile.TemporaryDirectory(prefix='evs') as folder:
+        folder = Path(folder)
+        script = folder / 'bench' / 'evaluate_app.py'
+        script.parent.mkdir()
+        script.write_text(SCRIPT)
+        server = EvaluatorServer(folder / 'sock' / 's', script, 'emulator-5554', python=sys.executable,
+                                 start_timeout=30)
+        yield server
+        server.close()
+
+
+def test_jobs_run_while_another_one_is_running(server):
+    cmd = [sys.executable, str(server.script)]
+    slow = server.submit(cmd + ['slow', '5'], server.script.parent)
+    assert slow is not None
+    started = time.time()
+    assert server.run(cmd + ['fast', '0'], server.script.parent) == 'start fast\ndone fast\n'
+    assert time.time() - started < 4
+    server.kill(slow[0])
+    assert b''.join(slow[1]).decode() == 'start slow\n'
+
+
+def test_socket_is_only_open_to_its_owner(server):
+    assert server.start()
+    info = server.socket_path.stat()
+    assert info.st_uid == os.getuid()
+    assert stat.S_IMODE(info.st_mode) == 0o600
+    assert stat.S_IMODE(server.socket_path.parent.stat().st_mode) == 0o700
@@ -0,0 +1,167 @@
+import pytest
+
+from AppForge import extracts
+from AppForge.extracts import ErrorParser, FuzzParser, SessionParser, extract_diagnostics
+
+
+# The whole-log extractors the streaming parsers replaced, kept as the reference
+def reference_error(log, ignore_path_str=None):
+    build_outputs = log.split('\n')
+    errors = []
+    for id, s in enumerate(build_outputs):
+        if s.find('编译失败') >= 0:
+            for kid in range(id, len(build_outputs)):
+                if build_outputs[kid].find('BUILD FAILED') >= 0:
+                    if ignore_path_str:
+                        errors = [i.replace(ignore_path_str, '') for i in build_outputs[id + 1:kid + 1]]
+                    else:
+                        errors = [i for i in build_outputs[id + 1:kid + 1]]
+                    break
+            if len(errors) == 0:
+                errors += ['']
+    if len(errors) == 0:
+        return None
+    return '\n'.join(errors)
+
+
+def reference_fuzz(log):
+    result = {'compile': 0, 'no_crash': 0, 'native': 0, 'java': 0, 'anr': 0, 'failtostart': 0}
+    if 'Starting app...' in log:
+        result['compile'] = 1
+    crash_cnt, cycle_cnt = 0, 0
+    for cycle in log.split('Starting app...')[1:]:
+        cycle_cnt += 1
+        for pattern, key in [('Native crash detected!', 'native'), ('Java crash detected!', 'java'),
+                             ('ANR detected!', 'anr'), ('Failed to start', 'failtostart')]:
+            if pattern in cycle:
+                crash_cnt += 1
+                result[key] = 1
+    if cycle_cnt and crash_cnt == 0:
+        result['no_crash'] = 1
+    return result
+
+
+def reference_test(log):
+    result = {'compile': 0, 'test': 0.0, 'all_pass': 0}
+    bad, good = log.count("'success': False"), log.count("'success': True")
+    if good + bad > 0:
+        result['compile'] = 1
+        result['test'] = good / (good + bad)
+        if bad == 0:
+            result['all_pass'] = 1
+    return result
+
+
+PROJECT = '/runs/r/3/project'
+
+BUILD_LOGS = [
+    '',
+    'BUILD SUCCESSFUL in 12s\n',
+    f'> Task :app:compileDebugJavaWithJavac FAILED\n编译失败\n{PROJECT}/app/src/main/java/A.java:3: error: '
+    'cannot find symbol\n    symbol:   class Foo\n1 error\nBUILD FAILED in 3s\n',
+    # a marker without a closing line
+    '编译失败\nsomething went wrong\n',
+    # the marker line closes its own block
+    '编译失败 BUILD FAILED\n',
+    # the latest closed block wins, a later unclosed marker keeps it
+    f'编译失败\n{PROJECT}/A.java:1: error: first\nBUILD FAILED\n编译失败\n{PROJECT}/A.java:2: error: second\n'
+    'BUILD FAILED\n编译失败\nno end\n',
+    # nested markers before one closing line
+    '编译失败\nouter\n编译失败\ninner\nBUILD FAILED',
+    f'ERROR:{PROJECT}/app/src/main/res/layout/main.xml:4: AAPT: error: attribute not found.\n编译失败\n'
+    f'ERROR:{PROJECT}/app/src/main/res/layout/main.xml:4: AAPT: error: attribute not found.\nBUILD FAILED\n',
+]
+
+FUZZ_LOGS = [
+    '',
+    'monkey: no events\n',
+    'Starting app...\nStarting app...\nStarting app...\n',
+    'Java crash detected! before any start\nStarting app...\nok\n',
+    'Starting app...\nJava crash detected!\nStarting app...\nANR detected!\nStarting app...Failed to start\n',
+    'Starting app...Native crash detected!Starting app...\nJava crash detected!\nJava crash detected!\n',
+]
+
+TEST_LOGS = [
+    '',
+    "sub-feature 1-1: {'success': True}\n",
+    "sub-feature 1-1: {'success': True}\nsub-feature 1-2: {'success': False}\n{'success': True}{'success': True}\n",
+    "{'success': False}\n" * 3,
+]
+
+
+def chunked(log, size):
+    return [log[i:i + size] for i in range(0, len(log), size)] or ['']
+
+
+def parse(parser, chunks):
+    for chunk in chunks:
+        parser.feed(chunk)
+    return parser.result()
+
+
+@pytest.mark.parametrize('size', [1, 2, 7, 64, 1 << 20])
+@pytest.mark.parametrize('log', BUILD_LOGS)
+def test_error_parser_matches_reference(log, size):
+    assert parse(ErrorParser(), chunked(log, size)) == reference_error(log)
+    assert parse(ErrorParser(PROJECT), chunked(log, size)) == reference_error(log, PROJECT)
+
+
+@pytest.mark.parametrize('size', [1, 3, 16, 1 << 20])
+@pytest.mark.parametrize('log', FUZZ_LOGS)
+def test_fuzz_parser_matches_reference(log, size):
+    assert parse(FuzzParser(), chunked(log, size)) == reference_fuzz(log)
+
+
+@pytest.mark.parametrize('size', [1, 5, 1 << 20])
+@pytest.mark.parametrize('log', TEST_LOGS)
+def test_test_parser_matches_reference(log, size):
+    assert parse(extracts.TestParser(), chunked(log, size)) == reference_test(log)
+
+
+def test_diagnostics_of_the_selected_block():
+    diagnostics = extract_diagnostics(BUILD_LOGS[2], ignore_path_str=PROJECT)
+    assert [(d.file, d.line, d.severity, d.task) for d in diagnostics] == \
+        [('app/src/main/java/A.java', 3, 'error', ':app:compileDebugJavaWithJavac')]
+    assert diagnostics[0].message == 'cannot find symbol (symbol: class Foo)'
+
+
+def test_diagnostics_of_kotlin_and_aapt_are_deduplicated():
+    log = (f'> Task :app:compileDebugKotlin FAILED\n编译失败\n'
+           f'e: file://{PROJECT}/app/src/main/java/A.kt:12:5 Unresolved reference: foo\n'
+           f'e: {PROJECT}/app/src/main/java/A.kt: (12, 5): Unresolved reference: foo\n'
+           f'w: {PROJECT}/app/src/main/java/B.kt: (1, 1): Unused variable\n'
+           f'ERROR:{PROJECT}/app/src/main/res/layout/main.xml:4: AAPT: error: attribute not found.\n'
+           f'ERROR:{PROJECT}/app/src/main/res/layout/main.xml:4: AAPT: error: attribute not found.\n'
+           "Execution failed for task ':app:processDebugResources'.\nBUILD FAILED in 2s\n")
+    for size in [1, 7, 1 << 20]:
+        parser = ErrorParser(PROJECT)
+        parse(parser, chunked(log, size))
+        assert [d.render() for d in parser.diagnostics] == [
+            'app/src/main/java/A.kt:12:5: error: Unresolved reference: foo',
+            'app/src/main/java/B.kt:1:1: warning: Unused variable',
+            'app/src/main/res/layout/main.xml:4: error: attribute not found.',
+        ]
+        # the task running when a message was printed wins over the one reported failed
+        assert [d.task for d in parser.diagnostics] == [':app:compileDebugKotlin'] * 3
+
+
+def test_diagnostics_come_from_the_latest_closed_block():
+    assert [d.message for d in extract_diagnostics(BUILD_LOGS[5], PROJECT)] == ['second']
+    assert extract_diagnostics(BUILD_LOGS[1]) == []
+
+
+def test_merged_test_parsers_add_up():
+    parsers = [extracts.TestParser(), extracts.TestParser()]
+    parsers[0].feed(TEST_LOGS[2])
+    parsers[1].feed(TEST_LOGS[3])
+    assert extracts.TestParser.merge(parsers).result() == reference_test(TEST_LOGS[2] + TEST_LOGS[3])
+
+
+@pytest.mark.parametrize('size', [1, 9, 1 << 20])
+def test_session_parser_splits_phases(size):
+    tests = "Starting app...\nJava crash detected!\n{'success': True}\n{'success': False}\n"
+    fuzz = FUZZ_LOGS[4]
+    test_result, fuzz_result = parse(SessionParser(extracts.TestParser(), FuzzParser()),
+                                     chunked(tests + 'Start fuzzing...\n' + fuzz, size))
+    assert test_result == reference_test(tests)
+    assert fuzz_result == reference_fuzz(fuzz)
@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+
+from AppForge import FakeBackend
+from AppForge.policies import FirstCrash, Plateau, StopPolicy, stop_policy
+
+from conftest import EMULATORS, changed_files
+
+CYCLES = 200
+
+
+def fuzzing_forge(make_forge, crash_at=None):
+    log = ''.join('Starting app...\n' + ('Java crash detected!\n' if i == crash_at else '') for i in range(CYCLES))
+    forge = make_forge(backend=FakeBackend(devices=EMULATORS, fail_rate=0, log_lines=0, logs={'fuzz': log},
+                                           chunk_bytes=32))
+    assert forge.compile_json_based_on_template(changed_files(0), 0) is None
+    return forge
+
+
+def test_first_crash_stops_the_session_early(make_forge):
+    forge = fuzzing_forge(make_forge, crash_at=5)
+    result = forge.fuzz(0, stop='first_crash')
+    assert result['java'] == 1 and result['early_stop'] == 1
+    assert forge.fuzz_log(0).read_text().count('Starting app...') < CYCLES
+
+
+def test_session_without_crash_runs_to_completion(make_forge):
+    forge = fuzzing_forge(make_forge)
+    result = forge.fuzz(0, stop='first_crash')
+    assert result['java'] == 0 and result['early_stop'] == 0
+    assert forge.fuzz_log(0).read_text().count('Starting app...') == CYCLES
+
+
+def parser(cycles, java=0):
+    return SimpleNamespace(cycle_cnt=cycles, result_dict={'native': 0, 'java': java, 'anr': 0, 'failtostart': 0})
+
+
+def test_plateau_waits_for_cycles_without_news():
+    policy = stop_policy(Plateau(cycles=3), budget=60)
+    assert policy.budget == 60
+    assert not policy.check(parser(1), 0) and not policy.check(parser(3), 0)
+    # a new finding restarts the count
+    assert not policy.check(parser(4, java=1), 0) and not policy.check(parser(6, java=1), 0)
+    assert policy.check(parser(7, java=1), 0)
+    # every session gets a fresh copy
+    assert stop_policy(policy).since == 0
+
+
+def test_stop_policy_by_name():
+    assert type(stop_policy(None, 30)) is StopPolicy and stop_policy(None, 30).budget == 30
+    assert isinstance(stop_policy('first_crash'), FirstCrash)
+    assert FirstCrash().check(parser(1, java=1), 0) and not FirstCrash().check(parser(1), 0)
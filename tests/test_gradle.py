@@ -0,0 +1,97 @@
+import json
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from AppForge import FakeBackend
+from AppForge.gradle import PROFILE_FILE, read_profile, report
+
+from conftest import EMULATORS, changed_files
+
+
+class ProfilingBackend(FakeBackend):
+    """
+    Writes the profile the init script would, with `ms` per Gradle task.
+    """
+    def __init__(self, ms, **kwargs):
+        super().__init__(**kwargs)
+        self.ms = ms
+
+    def build(self, project, changed):
+        output = super().build(project, changed)
+        (project / PROFILE_FILE).parent.mkdir(parents=True, exist_ok=True)
+        (project / PROFILE_FILE).write_text(json.dumps({
+            'phases': {'settings': 100, 'configuration': 900, 'total': 3000},
+            'tasks': [{'path': ':app:compileDebugJavaWithJavac', 'ms': self.ms, 'outcome': 'EXECUTED'},
+                      {'path': ':app:mergeDebugResources', 'ms': 500, 'outcome': 'EXECUTED'}],
+            'failed': False}))
+        return output
+
+
+@pytest.fixture(autouse=True)
+def gradle_home(tmp_path, monkeypatch):
+    monkeypatch.setenv('GRADLE_USER_HOME', str(tmp_path / 'gradle'))
+    return tmp_path / 'gradle'
+
+
+def test_profiles_are_kept_per_task_and_reported(make_forge, gradle_home):
+    forge = make_forge(backend=ProfilingBackend(2000, devices=EMULATORS, fail_rate=0), profile_builds=True)
+    assert (gradle_home / 'init.d' / 'appforge-profile.gradle').exists()
+    for task in range(2):
+        assert forge.compile_json_based_on_template(changed_files(task), task) is None
+    profile = json.loads(forge.gradle_profile_path(0).read_text())
+    assert profile == {'phases': {'settings': 0.1, 'configuration': 0.9, 'total': 3.0},
+                       'tasks': {':app:compileDebugJavaWithJavac': 2.0, ':app:mergeDebugResources': 0.5},
+                       'failed': False}
+    # moved out of the project, so that the next build of the task cannot pass it off as its own
+    assert not (forge.project_folder(0) / PROFILE_FILE).exists()
+    ans = report(forge.app_folder, top=1)
+    assert ans['builds'] == 2 and ans['phases']['total'] == pytest.approx(3.0)
+    assert ans['tasks'] == [{'task': ':app:compileDebugJavaWithJavac', 'total': 4.0, 'mean': 2.0, 'builds': 2,
+                             'share': 0.8}]
+
+
+def test_profile_of_an_earlier_build_is_ignored(tmp_path):
+    path = tmp_path / 'profile.json'
+    path.write_text(json.dumps({'phases': {}, 'tasks': [{'path': ':a', 'ms': 1000}, {'path': ':a', 'ms': 500}]}))
+    assert read_profile(path)['tasks'] == {':a': 1.5}
+    os.utime(path, (time.time() - 60, time.time() - 60))
+    assert read_profile(path, since=time.time() - 30) is None
+    assert read_profile(tmp_path / 'missing.json') is None
+
+
+class CountingBackend(FakeBackend):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.builds = []
+
+    def build(self, project, changed):
+        self.builds.append(project.name)
+        return super().build(project, changed)
+
+
+def test_shared_gradle_home_is_warmed_once_then_used_offline(make_forge, tmp_path):
+    shared = tmp_path / 'shared'
+    (shared / 'wrapper' / 'dists').mkdir(parents=True)
+    (shared / 'wrapper' / 'dists' / 'gradle.zip').write_text('zip')
+    backend = CountingBackend(devices=EMULATORS, fail_rate=0)
+    forges = [make_forge(backend=backend, emulator_id=emulator_id, gradle_home=shared)
+              for emulator_id in EMULATORS[:2]]
+    assert backend.builds == ['template']
+    homes = {forge.build_env['GRADLE_USER_HOME'] for forge in forges}
+    assert len(homes) == 2 and str(shared) not in homes
+    for forge in forges:
+        assert forge.build_env['APPFORGE_GRADLE_SHARED'] == 'offline'
+        assert forge.build_env['GRADLE_RO_DEP_CACHE'] == f'{shared}/caches'
+        home = Path(forge.build_env['GRADLE_USER_HOME'])
+        assert (home / 'wrapper' / 'dists' / 'gradle.zip').read_text() == 'zip'
+        assert (home / 'init.d' / 'appforge-shared.gradle').exists()
+
+
+def test_failed_warm_up_builds_online(make_forge, tmp_path):
+    forge = make_forge(backend=FakeBackend(devices=EMULATORS, fail_rate=1), gradle_home=tmp_path / 'shared')
+    assert forge.build_env['APPFORGE_GRADLE_SHARED'] == 'online'
+    assert 'GRADLE_RO_DEP_CACHE' not in forge.build_env
+    assert not forge.gradle_home.warm
@@ -0,0 +1,62 @@
+from AppForge import FakeBackend
+
+from conftest import EMULATORS, NoBuildOverProjects, changed_files
+
+
+STRINGS = 'app/src/main/res/values/strings.xml'
+HELPER = 'app/src/main/java/com/example/template/Helper.java'
+
+
+class CrashingBuild(FakeBackend):
+    def build(self, project, changed):
+        return self.pad('build', 'Killed\n')
+
+
+def test_incremental_compile_updates_the_project_in_place(make_forge):
+    forge = make_forge(backend=FakeBackend(devices=EMULATORS, fail_rate=0))
+    first = {**changed_files(0), HELPER: 'class Helper {}\n'}
+    assert forge.compile_json_based_on_template(first, 0) is None
+    forge.test(0)
+    project = forge.project_folder(0)
+    (project / 'kept.txt').write_text('from the first attempt\n')
+    second = changed_files(0, attempt=1)
+    assert forge.compile_json_based_on_template(second, 0, incremental=True) is None
+    assert (project / 'kept.txt').exists()
+    for rel, text in second.items():
+        assert (project / rel).read_text() == text
+    # dropped files go back to the template version, or away
+    assert (project / STRINGS).read_text() == second[STRINGS]
+    assert not (project / HELPER).exists()
+    assert forge.direct_apk_path(0).exists()
+    assert not forge.test_log(0).exists() and not forge.result_path(0).exists()
+    third = {key: value for key, value in second.items() if key != STRINGS}
+    assert forge.compile_json_based_on_template(third, 0, incremental=True) is None
+    assert (project / STRINGS).read_bytes() == (forge.template_folder / 'empty_activity' / STRINGS).read_bytes()
+
+
+def test_incremental_compile_without_earlier_project_builds_fully(make_forge):
+    forge = make_forge(backend=FakeBackend(devices=EMULATORS, fail_rate=0))
+    assert forge.compile_json_based_on_template(changed_files(0), 0, incremental=True) is None
+    assert forge.direct_apk_path(0).exists()
+
+
+def test_silent_failure_over_existing_project_rebuilds_from_scratch(make_forge):
+    forge = make_forge(backend=NoBuildOverProjects(devices=EMULATORS, fail_rate=0))
+    assert forge.compile_json_based_on_template(changed_files(0), 0) is None
+    assert forge.compile_json_based_on_template(changed_files(0, attempt=1), 0, incremental=True) is None
+    assert forge.direct_apk_path(0).exists()
+    assert 'FileExistsError' not in forge.compile_log(0).read_text()
+    assert not forge.reuse_projects
+    # later attempts do not try again
+    (forge.project_folder(0) / 'kept.txt').write_text('from the second attempt\n')
+    assert forge.compile_json_based_on_template(changed_files(0, attempt=2), 0, incremental=True) is None
+    assert not (forge.project_folder(0) / 'kept.txt').exists()
+
+
+def test_build_without_apk_or_errors_is_a_failure(make_forge):
+    forge = make_forge(backend=CrashingBuild(devices=EMULATORS), build_cache=True, result_store=True)
+    error = forge.compile_json_based_on_template(changed_files(0), 0)
+    assert error == 'Build failed without compiler errors!\n'
+    assert forge.compile_log(0).read_text().endswith(error)
+    assert forge.build_cache.stats()['entries'] == 0
+    assert forge.store.get(forge.runs, 0, 'compile') == {'compile': 0, 'error': error}
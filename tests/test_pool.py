@@ -0,0 +1,117 @@
+import socket
+import time
+
+import pytest
+
+from AppForge import DevicePool, FakeBackend, extracts, load_tasks
+from AppForge.utils import free_port
+
+from conftest import EMULATORS, changed_files
+
+
+TASK = next(task.id for task in load_tasks().tasks if len(task.sub_features) >= 3)
+
+
+class NoSubFeatures(FakeBackend):
+    usage = 'usage: evaluate_app.py --apk-path APK_PATH [--test {all,no_fuzz,only_fuzz}]\n'
+
+
+class SlowFirstShard(FakeBackend):
+    """
+    Hangs the shard testing the first sub-feature of a task.
+    """
+    def __init__(self, first: str, **kwargs):
+        super().__init__(**kwargs)
+        self.first = first
+
+    def chunks(self, pid, cmd, workdir):
+        if any(arg.startswith('--sub-features=') and self.first in arg[len('--sub-features='):].split(',')
+               for arg in cmd):
+            time.sleep(1)
+        yield from super().chunks(pid, cmd, workdir)
+
+
+@pytest.fixture
+def make_pool(tmp_path):
+    pools = []
+
+    def make(backend=None, **kwargs):
+        pool = DevicePool('test', base_folder=tmp_path, emulator_ids=list(EMULATORS), sdk_path=tmp_path / 'sdk',
+                          bench_folder=tmp_path / 'bench',
+                          backend=backend or FakeBackend(devices=EMULATORS, fail_rate=0), **kwargs)
+        pools.append(pool)
+        assert pool.devices[0].compile_json_based_on_template(changed_files(TASK), TASK) is None
+        return pool
+
+    yield make
+    for pool in pools:
+        pool.clean_up()
+
+
+def unsharded(pool, sub_features):
+    """
+    What one session testing every sub-feature of the task reports.
+    """
+    forge = pool.devices[0]
+    parser = extracts.TestParser()
+    parser.feed(forge.backend.output(forge.evaluate_cmd(TASK, 'no_fuzz', sub_features), forge.bench_path()))
+    return parser.result()
+
+
+def test_sharded_counts_merge_to_one_session(make_pool):
+    pool = make_pool()
+    forge = pool.devices[0]
+    sub_features = [sub.id for sub in forge.tasks[TASK].sub_features]
+    result = pool.test(TASK, shards=3)
+    assert result == unsharded(pool, sub_features)
+    logs = [forge.shard_log(TASK, shard).read_text() for shard in range(3)]
+    # every sub-feature was tested by exactly one shard
+    assert sorted(sub for log in logs for sub in sub_features if f'sub-feature {sub}:' in log) == sorted(sub_features)
+    assert forge.test_log(TASK).read_text().count('=== shard ') == 3
+    # the merged result is saved and served from the cache afterwards
+    assert pool.test(TASK, shards=3) == result
+
+
+def test_without_sub_feature_option_tests_unsharded(make_pool):
+    pool = make_pool(NoSubFeatures(devices=EMULATORS, fail_rate=0))
+    result = pool.test(TASK, shards=3)
+    assert not pool.devices[0].shard_log(TASK, 0).exists()
+    assert result['compile'] == 1
+
+
+def test_timed_out_shard_counts_as_failed(make_pool):
+    first = load_tasks().tasks[TASK].sub_features[0].id
+    pool = make_pool(SlowFirstShard(first, devices=EMULATORS, fail_rate=0, pass_rate=1.0),
+                     deadlines={'test': 0.3}, retries=0)
+    result = pool.test(TASK, shards=3)
+    assert result['timeout'] == 1
+    assert result['compile'] == 1 and 0 < result['test'] < 1 and result['all_pass'] == 0
+
+
+def test_devices_share_trash_cache_and_store(make_pool):
+    pool = make_pool(build_cache=True, result_store=True)
+    first, second = pool.devices[0], pool.devices[1]
+    assert first.trash is pool.trash and second.trash is pool.trash
+    assert first.build_cache is second.build_cache and first.store is second.store
+    # TASK was compiled on the first device; the same files hit the cache on the second
+    assert second.compile_json_based_on_template(changed_files(TASK), TASK) is None
+    assert first.build_cache.stats()['hits'] == 1
+    assert first.store.get(pool.runs, TASK, 'compile')['compile'] == 1
+
+
+def test_free_port_skips_bound_and_taken_ports():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as bound:
+        bound.bind(('', 0))
+        port = bound.getsockname()[1]
+        assert free_port(port) != port
+        assert free_port(port, taken=[port + 1]) not in (port, port + 1)
+
+
+def test_sharded_test_leaves_a_busy_device_alone(make_pool, monkeypatch):
+    pool = make_pool()
+    sub_features = [sub.id for sub in pool.devices[0].tasks[TASK].sub_features]
+    expected = unsharded(pool, sub_features)
+    with pool.device() as busy:
+        for name in ['supports_sub_features', '_cached_result', '_save_result', 'test_shard']:
+            monkeypatch.setattr(busy, name, lambda *args, **kwargs: pytest.fail('used a busy device'))
+        assert pool.test(TASK, shards=2) == expected
@@ -0,0 +1,50 @@
+from AppForge import TaskRegistry, load_tasks
+from AppForge.registry import estimate_seconds, parse_features, shard_sub_features
+
+FEATURES = '''description: A notes app.
+
+feature-1: Edit notes.
+sub-feature 1-1: Tapping "com.example:id/add" opens the editor.
+sub-feature1-2: Typing into "com.example:id/text" and pressing "com.example:id/save" saves it.
+  The note shows in the list.
+sub-feature 1-2: Swiping a note deletes it.
+Feature 2 Settings without sub-features, tap "com.example:id/settings".
+sub-feature 3: Scroll the list.
+'''
+
+
+def test_parse_features_reads_every_header_spelling():
+    description, features = parse_features(FEATURES)
+    assert description == 'A notes app.'
+    assert [feature.id for feature in features] == [1, 2, 3]
+    assert [sub.id for sub in features[0].sub_features] == ['1-1', '1-2', '1-2b']
+    assert features[0].sub_features[1].text == ('Typing into "com.example:id/text" and pressing "com.example:id/save" '
+                                                'saves it. The note shows in the list.')
+    assert features[0].sub_features[1].resource_ids == ('com.example:id/text', 'com.example:id/save')
+    assert features[0].sub_features[1].estimated_seconds == estimate_seconds(2)
+    # a feature without sub-features is a single one of its own text
+    assert [(sub.id, sub.resource_ids) for sub in features[1].sub_features] == [('2-1', ('com.example:id/settings',))]
+    assert [sub.id for sub in features[2].sub_features] == ['3-1']
+
+
+def test_repeated_headers_are_told_apart():
+    registry = TaskRegistry([{'app_key': 'notes', 'refined_features': FEATURES}])
+    first, second = registry.sub_feature(0, '1-2'), registry.sub_feature(0, '1-2b')
+    assert first.text.startswith('Typing') and second.text.startswith('Swiping')
+    assert first.header == second.header == '1-2'
+    assert len(registry.sub_features) == 5
+    # task 9 of tasks.json lists sub-feature 1-3 twice
+    assert [sub.id for sub in load_tasks()[9].sub_features] == ['1-1', '1-3', '1-2', '1-3b', '2-1', '3-1']
+
+
+def test_shards_balance_estimates_and_keep_repeated_headers_together():
+    _, features = parse_features(FEATURES)
+    subs = tuple(sub for feature in features for sub in feature.sub_features)
+    groups = shard_sub_features(subs, 3)
+    assert sorted(sub.id for group in groups for sub in group) == sorted(sub.id for sub in subs)
+    assert all(group == sorted(group, key=subs.index) for group in groups)
+    assert any({'1-2', '1-2b'} <= {sub.id for sub in group} for group in groups)
+    lengths = sorted(sum(sub.estimated_seconds for sub in group) for group in groups)
+    assert lengths[-1] - lengths[0] <= max(sub.estimated_seconds for sub in subs) * 2
+    assert shard_sub_features(subs, 1) == [list(subs)]
+    assert len(shard_sub_features(subs[:2], 5)) == 2
@@ -0,0 +1,55 @@
+import pytest
+
+from AppForge import DevicePool, FakeBackend, ResultStore, TaskRegistry
+from AppForge.registry import estimate_seconds
+from AppForge.schedule import FUZZ_SECONDS, expected_seconds, longest_first
+
+from conftest import EMULATORS
+
+
+def registry(*actions):
+    """
+    One task per entry, with one sub-feature of that many taps.
+    """
+    return TaskRegistry([{'app_key': f'app{i}', 'refined_features': f'feature-1: x\nsub-feature 1-1: {"tap " * n}'}
+                         for i, n in enumerate(actions)])
+
+
+def test_unrecorded_tasks_are_expected_to_take_their_estimate():
+    tasks = registry(1, 5, 3)
+    assert expected_seconds(range(3), 'test', tasks) == {i: estimate_seconds(n) for i, n in enumerate([1, 5, 3])}
+    assert expected_seconds([0], 'fuzz', tasks) == {0: FUZZ_SECONDS}
+    assert expected_seconds([0], 'evaluate', tasks, fuzz_budget=60) == {0: estimate_seconds(1) + 60}
+
+
+def test_recorded_durations_win_and_scale_the_estimates(tmp_path):
+    tasks = registry(1, 5, 3)
+    store = ResultStore(tmp_path / 'results.db')
+    # task 1 ran twice as long as estimated
+    store.put('old', 1, 'test', {}, duration=2 * estimate_seconds(5))
+    store.put('old', 2, 'fuzz', {}, duration=900)
+    seconds = expected_seconds(range(3), 'test', tasks, store)
+    assert seconds == {0: 2 * estimate_seconds(1), 1: 2 * estimate_seconds(5), 2: 2 * estimate_seconds(3)}
+    # the durations of the run itself are preferred
+    store.put('new', 1, 'test', {}, duration=1.0)
+    assert expected_seconds([1], 'test', tasks, store, 'new') == {1: 1.0}
+    # fuzzing is capped by the coming budget
+    assert expected_seconds([2], 'fuzz', tasks, store, fuzz_budget=300) == {2: 300}
+
+
+def test_longest_first_keeps_ties_in_order():
+    assert longest_first([0, 1, 2, 3], {0: 10, 1: 30, 2: 10, 3: 20}) == [1, 3, 0, 2]
+
+
+def test_pool_takes_the_longest_tasks_first(tmp_path):
+    pool = DevicePool('r', base_folder=tmp_path, emulator_ids=list(EMULATORS), sdk_path=tmp_path / 'sdk',
+                      bench_folder=tmp_path / 'bench', backend=FakeBackend(devices=EMULATORS), result_store=True)
+    try:
+        tasks = pool.devices[0].tasks
+        assert pool.schedule(range(6), 'test') == sorted(range(6), key=lambda i: -tasks[i].estimated_seconds)
+        # recorded durations take over from the estimates
+        for i in range(6):
+            pool.devices[0].store.put('r', i, 'test', {}, duration=i + 1.0)
+        assert pool.schedule(range(6), 'test') == [5, 4, 3, 2, 1, 0]
+    finally:
+        pool.clean_up()
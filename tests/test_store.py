@@ -0,0 +1,36 @@
+import json
+from pathlib import Path
+
+from AppForge import ResultStore
+
+FAILED = ('> Task :app:compileDebugJavaWithJavac FAILED\n编译失败\n'
+          '{folder}/0/app/src/main/java/MainActivity.java:3: error: cannot find symbol\n'
+          '    symbol:   class Foo\n'
+          "Execution failed for task ':app:compileDebugJavaWithJavac'.\n"
+          'BUILD FAILED in 1s\n')
+
+
+def write_run(run_folder, log_folder):
+    task_folder = run_folder / '0'
+    task_folder.mkdir(parents=True)
+    (task_folder / 'compile.log').write_text(FAILED.format(folder=log_folder))
+    (task_folder / 'test_result.json').write_text(json.dumps({'compile': 0}))
+
+
+def test_import_run_strips_the_local_task_folder(tmp_path):
+    run_folder = tmp_path / 'runs' / 'r'
+    write_run(run_folder, run_folder / '0')
+    store = ResultStore(tmp_path / 'results.db')
+    assert store.import_run(run_folder) == 2
+    error = store.get('r', 0, 'compile')['error']
+    assert error.startswith('/0/app/src/main/java/MainActivity.java:3: error') and str(tmp_path) not in error
+    assert store.get('r', 0, 'test') == {'compile': 0}
+
+
+def test_import_run_strips_the_task_folder_of_the_container(tmp_path):
+    run_folder = tmp_path / 'runs' / 'r'
+    write_run(run_folder, '/AppDev-Bench/AppDev-Bench/runs/r/0')
+    store = ResultStore(tmp_path / 'results.db')
+    assert store.import_base_folder(tmp_path / 'runs', Path('/AppDev-Bench/AppDev-Bench/runs')) == 2
+    error = store.get('r', 0, 'compile')['error']
+    assert error.startswith('/0/app/src/main/java/MainActivity.java:3: error') and 'AppDev-Bench' not in error
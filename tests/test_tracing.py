@@ -0,0 +1,50 @@
+import json
+import threading
+
+from AppForge.tracing import Tracer
+
+from conftest import changed_files
+
+
+def test_nested_spans_inherit_attributes_and_sum_per_task():
+    tracer = Tracer()
+    with tracer.span('compile', task=3, run='r'):
+        with tracer.span('exec'):
+            assert tracer.depth() == 2
+        with tracer.span('exec'):
+            pass
+    with tracer.span('idle'):
+        pass
+    assert tracer.depth() == 0
+    assert set(tracer.task_totals(3)) == {'compile', 'compile/exec'}
+    assert tracer.task_totals(3)['compile'] >= tracer.task_totals(3)['compile/exec']
+    assert [(e['name'], e['args']) for e in tracer.events] == [
+        ('exec', {'task': 3, 'run': 'r'}), ('exec', {'task': 3, 'run': 'r'}),
+        ('compile', {'task': 3, 'run': 'r'}), ('idle', {})]
+
+
+def test_export_writes_a_chrome_trace_with_a_track_per_thread(tmp_path):
+    tracer = Tracer()
+    def work(i):
+        with tracer.span('work', task=i):
+            pass
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    tracer.export(tmp_path / 'trace.json')
+    events = json.loads((tmp_path / 'trace.json').read_text())['traceEvents']
+    assert [e['name'] for e in events if e['ph'] == 'M'] == ['thread_name'] * len({e['tid'] for e in events})
+    assert sorted(e['args']['task'] for e in events if e['ph'] == 'X') == [0, 1]
+
+
+def test_forge_writes_timings_and_trace(make_forge):
+    forge = make_forge(trace=True)
+    assert forge.compile_json_based_on_template(changed_files(0), 0) is None
+    forge.test(0)
+    timings = json.loads(forge.timings_path(0).read_text())
+    assert {'compile', 'test'} <= set(timings) and any(path.startswith('compile/') for path in timings)
+    forge.clean_up()
+    events = json.loads((forge.app_folder / 'trace.json').read_text())['traceEvents']
+    assert {e['args'].get('task') for e in events if e['name'] == 'compile'} == {0}
@@ -0,0 +1,68 @@
+import os
+import subprocess
+import threading
+
+from AppForge import trash as trash_module
+from AppForge.trash import TrashReaper
+
+
+def make_folder(path, files=3):
+    (path / 'sub').mkdir(parents=True)
+    for i in range(files):
+        (path / 'sub' / f'{i}.txt').write_text(str(i))
+    return path
+
+
+def stuck_unlink(monkeypatch, stuck):
+    """
+    Make `stuck` impossible to remove, also for root, which ignores permissions.
+    """
+    unlink = os.unlink
+    def fake_unlink(path, *args, **kwargs):
+        if os.path.basename(path) == stuck:
+            raise PermissionError(13, 'Permission denied', path)
+        return unlink(path, *args, **kwargs)
+    monkeypatch.setattr(trash_module.os, 'unlink', fake_unlink)
+
+
+def close_within(reaper, seconds=10):
+    closer = threading.Thread(target=reaper.close)
+    closer.start()
+    closer.join(seconds)
+    return not closer.is_alive()
+
+
+def test_discarded_folders_are_reaped_on_close(tmp_path):
+    reaper = TrashReaper(tmp_path / 'trash', batch=2)
+    for i in range(3):
+        reaper.discard(make_folder(tmp_path / f'project{i}'))
+        assert not (tmp_path / f'project{i}').exists()
+    assert close_within(reaper)
+    assert list((tmp_path / 'trash').iterdir()) == []
+
+
+def test_unremovable_entry_without_remover_does_not_block_close(tmp_path, monkeypatch, capsys):
+    stuck_unlink(monkeypatch, 'stuck.txt')
+    reaper = TrashReaper(tmp_path / 'trash')
+    project = make_folder(tmp_path / 'project')
+    (project / 'sub' / 'stuck.txt').write_text('root owned')
+    reaper.discard(project)
+    reaper.discard(make_folder(tmp_path / 'other'))
+    assert close_within(reaper)
+    # only the stuck file and the folders holding it are left
+    [entry] = (tmp_path / 'trash').iterdir()
+    assert [str(p.relative_to(entry)) for p in entry.rglob('*')] == ['sub', os.path.join('sub', 'stuck.txt')]
+    assert capsys.readouterr().out.count('Could not remove') == 1
+
+
+def test_remover_takes_what_the_reaper_cannot(tmp_path, monkeypatch):
+    stuck_unlink(monkeypatch, 'stuck.txt')
+    handed = []
+    # like the remover of a pool, which runs rm in the container
+    reaper = TrashReaper(tmp_path / 'trash', remover=lambda entry: (handed.append(entry.name),
+                                                                     subprocess.run(['rm', '-rf', str(entry)])))
+    project = make_folder(tmp_path / 'project')
+    (project / 'sub' / 'stuck.txt').write_text('root owned')
+    reaper.discard(project)
+    assert close_within(reaper)
+    assert len(handed) == 1 and list((tmp_path / 'trash').iterdir()) == []
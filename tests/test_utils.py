@@ -0,0 +1,56 @@
+import os
+import shutil
+
+from AppForge import utils
+from AppForge.utils import compare_folder, folder_manifest, sumup_json
+
+
+def test_sumup_averages_every_metric_over_the_results_that_have_it():
+    results = {
+        0: {'compile': 1, 'no_crash': 1},
+        1: {'compile': 1, 'no_crash': 0, 'fuzz_time': 30.0, 'early_stop': 1},
+        2: {'compile': 0, 'no_crash': 0, 'fuzz_time': 10.0, 'early_stop': 0},
+    }
+    assert sumup_json(results) == {'compile': 2 / 3, 'no_crash': 1 / 3, 'fuzz_time': 20.0, 'early_stop': 0.5}
+    assert sumup_json({}) == {}
+
+
+def make_template(folder, age=0):
+    (folder / 'app').mkdir(parents=True)
+    (folder / 'app' / 'Main.java').write_text('class Main {}\n')
+    (folder / 'icon.png').write_bytes(b'\x89PNG\0\0')
+    if age:
+        for p in (folder / 'app' / 'Main.java', folder / 'icon.png'):
+            stat = p.stat()
+            os.utime(p, ns=(stat.st_atime_ns - age * 10**9, stat.st_mtime_ns - age * 10**9))
+
+
+def test_compare_folder_returns_new_and_changed_text_files(tmp_path):
+    make_template(tmp_path / 'template', age=60)
+    shutil.copytree(tmp_path / 'template', tmp_path / 'project')
+    (tmp_path / 'project' / 'app' / 'Extra.java').write_text('class Extra {}\n')
+    (tmp_path / 'project' / 'icon.png').write_bytes(b'\x89PNG\0\0changed')
+    assert compare_folder(tmp_path / 'project', tmp_path / 'template') == {'app/Extra.java': 'class Extra {}\n'}
+
+    (tmp_path / 'project' / 'app' / 'Main.java').write_text('class Main {int a;}\n')
+    assert compare_folder(tmp_path / 'project', tmp_path / 'template') == {
+        'app/Extra.java': 'class Extra {}\n', 'app/Main.java': 'class Main {int a;}\n'}
+
+
+def test_compare_folder_reads_same_size_rewrites_within_one_mtime_tick(tmp_path):
+    make_template(tmp_path / 'template')
+    shutil.copytree(tmp_path / 'template', tmp_path / 'project')
+    main = tmp_path / 'project' / 'app' / 'Main.java'
+    stat = main.stat()
+    main.write_text('class Niam {}\n')
+    os.utime(main, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert compare_folder(tmp_path / 'project', tmp_path / 'template') == {'app/Main.java': 'class Niam {}\n'}
+
+
+def test_folder_manifests_are_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, '_manifests', utils.OrderedDict())
+    folders = [tmp_path / str(i) for i in range(utils.MANIFESTS_MAX + 2)]
+    for folder in folders:
+        make_template(folder)
+        folder_manifest(folder)
+    assert list(utils._manifests) == [folder.resolve() for folder in folders[2:]]
@@ -0,0 +1,77 @@
+import time
+
+from AppForge import ResultStore, WorkQueue
+from AppForge.workqueue import work
+
+from conftest import changed_files
+
+
+def test_claims_by_priority_then_task(tmp_path):
+    queue = WorkQueue(tmp_path / 'queue.db')
+    assert queue.enqueue('r', [0, 1, 2, 3], 'test', priorities={2: 1.0}) == 4
+    # queued jobs are kept unless reset
+    assert queue.enqueue('r', [0, 1], 'test') == 0
+    assert queue.enqueue('other', [0], 'test') == 1
+    assert [queue.claim('w', 60, 'r').task for _ in range(4)] == [2, 0, 1, 3]
+    assert queue.claim('w', 60, 'r') is None
+    assert queue.counts('r') == {'leased': 4} and queue.counts() == {'leased': 4, 'pending': 1}
+
+
+def test_expired_lease_is_requeued(tmp_path):
+    queue = WorkQueue(tmp_path / 'queue.db')
+    queue.enqueue('r', [0], 'test')
+    lost = queue.claim('a', 0.1)
+    assert lost.attempts == 1 and queue.claim('b', 0.1) is None
+    time.sleep(0.2)
+    job = queue.claim('b', 60)
+    assert (job.task, job.worker, job.attempts) == (0, 'b', 2)
+    # the first worker learns that it lost the job
+    assert not queue.heartbeat(lost, 60)
+    assert queue.heartbeat(job, 60)
+    # and its late result still counts
+    queue.complete(lost, {'compile': 1})
+    assert queue.results('r', 'test') == {0: {'compile': 1}}
+    queue.complete(job, {'compile': 0})
+    assert queue.results('r', 'test') == {0: {'compile': 1}}
+
+
+def test_lease_lost_too_often_fails_the_job(tmp_path):
+    queue = WorkQueue(tmp_path / 'queue.db', max_attempts=2)
+    queue.enqueue('r', [0], 'test')
+    for worker in ['a', 'b']:
+        assert queue.claim(worker, 0.05) is not None
+        time.sleep(0.1)
+    assert queue.claim('c', 60) is None
+    assert queue.counts('r') == {'failed': 1}
+    assert queue.connection().execute('SELECT error FROM jobs').fetchone()[0] == 'lease lost'
+
+
+def test_failed_job_is_retried_until_out_of_attempts(tmp_path):
+    queue = WorkQueue(tmp_path / 'queue.db', max_attempts=2)
+    queue.enqueue('r', [0, 1], 'test')
+    queue.complete(queue.claim('a', 60), {'compile': 1, 'test': 0.5, 'all_pass': 0})
+    queue.fail(queue.claim('a', 60), 'Traceback')
+    assert queue.counts('r') == {'done': 1, 'pending': 1}
+    job = queue.claim('b', 60)
+    assert (job.task, job.attempts) == (1, 2)
+    queue.fail(job, 'Traceback')
+    assert queue.counts('r') == {'done': 1, 'failed': 1} and queue.unfinished('r') == 0
+    assert queue.summary('r', 'test') == {'compile': 1, 'test': 0.5, 'all_pass': 0}
+    assert queue.enqueue('r', [1], 'test', reset=True) == 1
+    assert queue.claim('b', 60).attempts == 1
+
+
+def test_worker_runs_queued_jobs(make_forge, tmp_path):
+    forge = make_forge(result_store=True)
+    for task_id in range(3):
+        forge.compile_json_based_on_template(changed_files(task_id), task_id)
+    queue = WorkQueue(tmp_path / 'queue.db')
+    queue.enqueue(forge.runs, range(3), 'test')
+    assert work(forge, queue, worker='w', lease=60, poll=0.1) == 3
+    assert queue.results(forge.runs, 'test') == {task_id: forge.test(task_id) for task_id in range(3)}
+
+
+def test_shared_result_store_keeps_rollback_journal(tmp_path):
+    assert ResultStore(tmp_path / 'local.db').connection().execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    shared = ResultStore(tmp_path / 'shared.db', shared=True)
+    assert shared.connection().execute('PRAGMA journal_mode').fetchone()[0] == 'delete'